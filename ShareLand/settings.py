@@ -147,6 +147,37 @@ CRISPY_TEMPLATE_PACK = "bootstrap4"
 LOGIN_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
 
+# Default dictionary for research catalog full-text search ('it' or 'en')
+RESEARCH_SEARCH_LANGUAGE = os.getenv('RESEARCH_SEARCH_LANGUAGE', 'it')
+
+# Serve author autocomplete from an in-process index (invalidated through the
+# cache, so configure a shared cache backend when running several workers)
+AUTHOR_SEARCH_INDEX = os.getenv('AUTHOR_SEARCH_INDEX', 'True') == 'True'
+
+# Shared by all workers: upload preview jobs, index version keys and cached
+# maps live here, so keep a backend every worker sees (file or Redis)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'django')),
+    }
+}
+
+# Map GeoJSON documents (frontend/map_cache.py): Django cache entries backed by
+# an LRU-evicted directory; set MAP_CACHE_DIR to an empty value to disable it
+MAP_CACHE_DIR = os.getenv('MAP_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'maps'))
+MAP_CACHE_DISK_MAX_BYTES = int(os.getenv('MAP_CACHE_DISK_MAX_BYTES', 256 * 1024 * 1024))
+MAP_CACHE_TIMEOUT = int(os.getenv('MAP_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# Vector tile cache (frontend/tiles.py); nginx serves /tiles/ from this
+# directory and falls back to Django. Set to an empty value to disable it
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'tiles'))
+
+# Upload previews (frontend/shapefile_preview.py) run in a thread pool of this
+# many threads per worker (0: inside the request); results are cached by file hash
+PREVIEW_WORKERS = int(os.getenv('PREVIEW_WORKERS', 2))
+PREVIEW_CACHE_TIMEOUT = int(os.getenv('PREVIEW_CACHE_TIMEOUT', 60 * 60 * 24))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
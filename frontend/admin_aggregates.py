@@ -0,0 +1,355 @@
+"""
+Site and evidence counts per administrative unit (region, province,
+municipality), chronology and typology, stored in AdminAggregate.
+
+A site counts once for every distinct (chronology, typology) pair among its
+interpretations. Evidence uses its own chronology and typology. Facts with
+nothing recorded count under NOT_RECORDED. Rollup rows (ANY) count each fact
+once per unit, chronology or typology, so totals are exact without summing
+breakdowns.
+
+Writes update the table incrementally. The aggregate keys of every touched
+fact are read before the change (pre_save / pre_delete), compared with its
+keys once the transaction commits, and only the difference is applied with
+F() updates. Bulk writes, which send no per-row signals, schedule a full
+rebuild instead (also available as the refresh_admin_aggregates command).
+"""
+
+import threading
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.core.signals import request_started
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    AdminAggregate, ArchaeologicalEvidence, ArchaeologicalEvidenceTypology, Chronology, Interpretation, Municipality,
+    Province, Region, Site, Typology,
+)
+from .spatial import LAYER_BY_MODEL, POINT_LAYERS, geometries_bulk_changed
+
+ANY = AdminAggregate.ANY
+NOT_RECORDED = AdminAggregate.NOT_RECORDED
+LEVELS = ('region', 'province', 'municipality')
+LEVEL_FIELDS = ('id_region_id', 'id_province_id', 'id_municipality_id')
+BREAKDOWNS = ('chronology', 'typology')
+BATCH_SIZE = 5000
+
+# Key fields of an aggregate row, in the order of the key tuples used below
+KEY_FIELDS = ('layer', 'level', 'unit_id', 'chronology_id', 'typology_id')
+
+
+def _recorded(value):
+    return NOT_RECORDED if value is None else value
+
+
+def aggregate_keys(layer, units, pairs):
+    """
+    Aggregate keys a fact counts towards.
+
+    Args:
+        layer: 'site' or 'evidence'
+        units: (region id, province id, municipality id), None where unset
+        pairs: Set of (chronology id, typology id) of the fact
+
+    Returns:
+        List of (layer, level, unit id, chronology id, typology id) tuples
+    """
+    pairs = pairs or {(NOT_RECORDED, NOT_RECORDED)}
+    combinations = sorted(pairs)
+    combinations += [(chronology, ANY) for chronology in sorted({chronology for chronology, _ in pairs})]
+    combinations += [(ANY, typology) for typology in sorted({typology for _, typology in pairs})]
+    combinations.append((ANY, ANY))
+    return [
+        (layer, level, unit, chronology, typology)
+        for level, unit in zip(LEVELS, units) if unit is not None
+        for chronology, typology in combinations
+    ]
+
+
+def _site_facts(ids=None):
+    sites = Site.objects.order_by('id')
+    if ids is not None:
+        sites = sites.filter(id__in=ids)
+    rows = sites.values_list('id', *LEVEL_FIELDS).iterator(chunk_size=BATCH_SIZE)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        pairs = defaultdict(set)
+        interpretations = Interpretation.objects.filter(
+            id_site_id__in=[row[0] for row in batch]
+        ).values_list('id_site_id', 'id_chronology_id', 'id_typology_id')
+        for site_id, chronology, typology in interpretations:
+            pairs[site_id].add((_recorded(chronology), _recorded(typology)))
+        for site_id, *units in batch:
+            yield site_id, aggregate_keys('site', units, pairs.get(site_id))
+
+
+def _evidence_facts(ids=None):
+    evidence = ArchaeologicalEvidence.objects.order_by('id')
+    if ids is not None:
+        evidence = evidence.filter(id__in=ids)
+    rows = evidence.values_list('id', *LEVEL_FIELDS, 'id_chronology_id', 'id_archaeological_evidence_typology_id')
+    for evidence_id, region, province, municipality, chronology, typology in rows.iterator(chunk_size=BATCH_SIZE):
+        pairs = {(_recorded(chronology), _recorded(typology))}
+        yield evidence_id, aggregate_keys('evidence', (region, province, municipality), pairs)
+
+
+def fact_keys(layer, ids=None):
+    """Yield (id, aggregate keys) for the sites or evidence with the given ids (default: all)."""
+    return _site_facts(ids) if layer == 'site' else _evidence_facts(ids)
+
+
+def rebuild_admin_aggregates():
+    """
+    Recompute the whole aggregate table from the fact tables.
+
+    Returns:
+        Number of aggregate rows written
+    """
+    counts = Counter()
+    for layer in POINT_LAYERS:
+        for _, keys in fact_keys(layer):
+            counts.update(keys)
+    rows = [AdminAggregate(count=count, **dict(zip(KEY_FIELDS, key))) for key, count in counts.items()]
+    with transaction.atomic():
+        AdminAggregate.objects.all().delete()
+        AdminAggregate.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def apply_aggregate_delta(delta):
+    """Add a Counter of key -> count change to the table, dropping rows that reach zero."""
+    for key, change in delta.items():
+        if not change:
+            continue
+        rows = AdminAggregate.objects.filter(**dict(zip(KEY_FIELDS, key)))
+        if rows.update(count=F('count') + change):
+            if change < 0:
+                rows.filter(count__lte=0).delete()
+        elif change > 0:
+            try:
+                with transaction.atomic():
+                    AdminAggregate.objects.create(count=change, **dict(zip(KEY_FIELDS, key)))
+            except IntegrityError:
+                # Created concurrently by another worker
+                rows.update(count=F('count') + change)
+
+
+# The keys of touched facts before the change are collected per thread and the
+# difference is applied once the surrounding transaction commits, so cascading
+# deletes (a site and its interpretations) are counted once.
+_pending = threading.local()
+
+
+def _previous_keys():
+    if not hasattr(_pending, 'keys'):
+        _pending.keys = {}
+        _pending.rebuild = False
+    return _pending.keys
+
+
+def _remember(layer, ids):
+    """Record the current keys of facts not yet touched in this transaction."""
+    previous = _previous_keys()
+    missing = {fact_id for fact_id in ids if fact_id is not None and (layer, fact_id) not in previous}
+    if not missing:
+        return
+    for fact_id, keys in fact_keys(layer, list(missing)):
+        previous[(layer, fact_id)] = keys
+        missing.discard(fact_id)
+    for fact_id in missing:
+        previous[(layer, fact_id)] = []
+
+
+def discard_pending_aggregates():
+    """Forget the keys collected in this thread (left over when a transaction rolled back)."""
+    _previous_keys().clear()
+    _pending.rebuild = False
+
+
+def _flush_admin_aggregates():
+    previous = _previous_keys()
+    touched, rebuild = dict(previous), _pending.rebuild
+    previous.clear()
+    _pending.rebuild = False
+    if rebuild:
+        rebuild_admin_aggregates()
+        return
+    if not touched:
+        return
+
+    delta = Counter()
+    for keys in touched.values():
+        delta.subtract(keys)
+    for layer in POINT_LAYERS:
+        ids = [fact_id for touched_layer, fact_id in touched if touched_layer == layer]
+        if ids:
+            for _, keys in fact_keys(layer, ids):
+                delta.update(keys)
+    apply_aggregate_delta(delta)
+
+
+def schedule_aggregate_rebuild():
+    """Rebuild the whole table after the current transaction commits (for bulk writes)."""
+    _previous_keys()
+    _pending.rebuild = True
+    transaction.on_commit(_flush_admin_aggregates)
+
+
+def _unit_names(level, unit_ids):
+    if level == 'region':
+        return dict(Region.objects.filter(id_region__in=unit_ids).values_list('id_region', 'denominazione_regione'))
+    if level == 'province':
+        return dict(Province.objects.filter(id__in=unit_ids).values_list('id', 'denominazione_provincia'))
+    return dict(Municipality.objects.filter(id__in=unit_ids).values_list('id', 'denominazione_comune'))
+
+
+def _named(value, names):
+    if value == NOT_RECORDED:
+        return None
+    return {'id': value, 'name': names.get(value) or ''}
+
+
+def parse_aggregate_query(params):
+    """
+    Parse the level, layer, by and unit parameters.
+
+    Returns:
+        Dict with level, layers, by (tuple of breakdowns) and unit_ids (None for all units)
+
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    level = params.get('level') or 'region'
+    if level not in LEVELS:
+        raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+    layers = tuple(part.strip() for part in (params.get('layer') or ','.join(POINT_LAYERS)).split(',') if part.strip())
+    if not layers or any(layer not in POINT_LAYERS for layer in layers):
+        raise ValueError(f"layer must be a subset of {','.join(POINT_LAYERS)}")
+    by = tuple(part.strip() for part in (params.get('by') or '').split(',') if part.strip())
+    if any(breakdown not in BREAKDOWNS for breakdown in by):
+        raise ValueError(f"by must be a subset of {','.join(BREAKDOWNS)}")
+    unit_ids = None
+    if params.get('unit'):
+        try:
+            unit_ids = [int(part) for part in params['unit'].split(',') if part.strip()]
+        except ValueError:
+            raise ValueError('unit must be an id or a comma-separated list of ids')
+    return {'level': level, 'layers': layers, 'by': by, 'unit_ids': unit_ids}
+
+
+def admin_aggregates(level='region', layers=POINT_LAYERS, by=(), unit_ids=None):
+    """
+    Site and evidence counts per administrative unit, optionally broken down.
+
+    Args:
+        level: 'region', 'province' or 'municipality'
+        layers: Point layers to count
+        by: Breakdowns, a subset of ('chronology', 'typology')
+        unit_ids: Restrict to these units (default: all)
+
+    Returns:
+        List of dicts with layer, unit ({id, name}), count and, per breakdown, chronology /
+        typology ({id, name}, None when not recorded), largest counts first
+    """
+    rows = AdminAggregate.objects.filter(level=level, layer__in=layers)
+    rows = rows.exclude(chronology_id=ANY) if 'chronology' in by else rows.filter(chronology_id=ANY)
+    rows = rows.exclude(typology_id=ANY) if 'typology' in by else rows.filter(typology_id=ANY)
+    if unit_ids is not None:
+        rows = rows.filter(unit_id__in=unit_ids)
+    rows = list(rows.order_by('-count', 'layer', 'unit_id', 'chronology_id', 'typology_id').values_list(
+        'layer', 'unit_id', 'chronology_id', 'typology_id', 'count'
+    ))
+
+    units = _unit_names(level, {row[1] for row in rows})
+    chronologies = typologies = {}
+    if 'chronology' in by:
+        chronologies = dict(Chronology.objects.filter(
+            id__in={row[2] for row in rows}
+        ).values_list('id', 'chronological_period'))
+    if 'typology' in by:
+        typologies = {
+            'site': dict(Typology.objects.filter(
+                id__in={row[3] for row in rows if row[0] == 'site'}
+            ).values_list('id', 'desc_typology')),
+            'evidence': dict(ArchaeologicalEvidenceTypology.objects.filter(
+                id__in={row[3] for row in rows if row[0] == 'evidence'}
+            ).values_list('id', 'desc_typology_archaeological_evidence')),
+        }
+
+    results = []
+    for layer, unit_id, chronology_id, typology_id, count in rows:
+        result = {'layer': layer, 'unit': {'id': unit_id, 'name': units.get(unit_id) or ''}, 'count': count}
+        if 'chronology' in by:
+            result['chronology'] = _named(chronology_id, chronologies)
+        if 'typology' in by:
+            result['typology'] = _named(typology_id, typologies[layer])
+        results.append(result)
+    return results
+
+
+def region_totals():
+    """Sites and evidence per region for the home page, largest first."""
+    totals = defaultdict(lambda: {'sites': 0, 'evidence': 0})
+    for result in admin_aggregates('region'):
+        totals[result['unit']['id'], result['unit']['name']]['sites' if result['layer'] == 'site' else 'evidence'] = (
+            result['count']
+        )
+    return sorted(
+        ({'id': unit_id, 'name': name, **counts} for (unit_id, name), counts in totals.items()),
+        key=lambda region: (-(region['sites'] + region['evidence']), region['name']),
+    )
+
+
+# Signal handlers keeping the aggregates in sync
+@receiver(pre_save, sender=Site)
+@receiver(pre_save, sender=ArchaeologicalEvidence)
+@receiver(pre_delete, sender=Site)
+@receiver(pre_delete, sender=ArchaeologicalEvidence)
+def remember_fact_keys(sender, instance, **kwargs):
+    if instance.pk is not None:
+        _remember(LAYER_BY_MODEL[sender], [instance.pk])
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_save, sender=ArchaeologicalEvidence)
+@receiver(post_delete, sender=Site)
+@receiver(post_delete, sender=ArchaeologicalEvidence)
+def update_fact_aggregates(sender, instance, created=False, **kwargs):
+    if created:
+        # Nothing counted before the insert
+        _previous_keys().setdefault((LAYER_BY_MODEL[sender], instance.pk), [])
+    transaction.on_commit(_flush_admin_aggregates)
+
+
+@receiver(pre_save, sender=Interpretation)
+@receiver(pre_delete, sender=Interpretation)
+def remember_interpreted_site_keys(sender, instance, **kwargs):
+    site_ids = {instance.id_site_id}
+    if instance.pk is not None:
+        # The interpretation may be moving to another site
+        site_ids.update(Interpretation.objects.filter(pk=instance.pk).values_list('id_site_id', flat=True))
+    _remember('site', site_ids)
+
+
+@receiver(post_save, sender=Interpretation)
+@receiver(post_delete, sender=Interpretation)
+def update_interpreted_site_aggregates(sender, instance, **kwargs):
+    transaction.on_commit(_flush_admin_aggregates)
+
+
+@receiver(request_started)
+def reset_pending_aggregates(sender, **kwargs):
+    discard_pending_aggregates()
+
+
+@receiver(geometries_bulk_changed)
+def rebuild_bulk_aggregates(sender, **kwargs):
+    """Bulk imports send no per-row signals: rebuild the table once they commit."""
+    if LAYER_BY_MODEL[sender] in POINT_LAYERS:
+        schedule_aggregate_rebuild()
@@ -0,0 +1,184 @@
+"""
+Reverse lookup of the administrative units (municipality, province, region)
+of a coordinate. Municipality centroids are held as unit vectors in a KD-tree
+(frontend/utils/kdtree.py) built once per worker; the nearest centroid within
+MAX_MUNICIPALITY_DISTANCE_M gives the municipality, and its province and
+region follow from the admin tables.
+
+Used by /api/admin-units/ to fill the site and evidence forms from lat/lon,
+and by the backfill_admin_units command for rows missing their admin codes.
+Saving or deleting an admin row bumps a version key in the Django cache so
+every worker rebuilds its copy.
+"""
+
+import numpy as np
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .admin_aggregates import schedule_aggregate_rebuild
+from .catalog import research_ids_for_sites, schedule_catalog_refresh
+from .models import ArchaeologicalEvidence, ArchEvResearch, Municipality, Province, Region, SiteArchEvidence
+from .utils.kdtree import KDTree, arc_length, chord_length, unit_vectors
+from .utils.versioned_index import SharedIndex
+
+ITALY_COUNTRY_ID = 113
+MAX_MUNICIPALITY_DISTANCE_M = 25000  # farther than this the point is probably outside the country
+ADMIN_UNITS_VERSION_KEY = 'admin_units_index_version'
+ADMIN_FIELDS = ('id_country', 'id_region', 'id_province', 'id_municipality')
+
+
+class MunicipalityIndex:
+    """Municipality centroids with their province and region."""
+
+    def __init__(self, municipalities, provinces, regions, version=None):
+        self.version = version
+        # municipalities: (id, name, province id, lon, lat)
+        self.ids = [row[0] for row in municipalities]
+        self.names = [row[1] or '' for row in municipalities]
+        self.province_ids = [row[2] for row in municipalities]
+        lon = np.array([row[3] for row in municipalities], dtype=np.float64)
+        lat = np.array([row[4] for row in municipalities], dtype=np.float64)
+        self.tree = KDTree(unit_vectors(lon, lat))
+        # provinces: id -> (name, code, region id); regions: id -> name
+        self.provinces = provinces
+        self.regions = regions
+
+    @classmethod
+    def build(cls, version=None):
+        municipalities = [
+            (pk, name, province_id, float(lon), float(lat))
+            for pk, name, province_id, lon, lat in Municipality.objects.filter(
+                lat__isnull=False, lon__isnull=False
+            ).values_list('id', 'denominazione_comune', 'id_province_id', 'lon', 'lat').iterator(chunk_size=5000)
+        ]
+        provinces = {
+            pk: (name or '', code or '', region_id)
+            for pk, name, code, region_id in Province.objects.values_list(
+                'id', 'denominazione_provincia', 'sigla_provincia', 'codice_regione_id'
+            )
+        }
+        regions = dict(Region.objects.values_list('id_region', 'denominazione_regione'))
+        return cls(municipalities, provinces, regions, version=version)
+
+    def nearest(self, lon, lat, max_distance_m=MAX_MUNICIPALITY_DISTANCE_M):
+        """Position of the municipality nearest to lon/lat and its distance in meters, or (None, None)."""
+        if not self.ids:
+            return None, None
+        distances, positions = self.tree.query(unit_vectors([lon], [lat])[0], 1, float(chord_length(max_distance_m)))
+        if not len(positions):
+            return None, None
+        return int(positions[0]), float(arc_length(distances[0]))
+
+    def codes(self, position):
+        """(region id, province id, municipality id) of a municipality position."""
+        province_id = self.province_ids[position]
+        region_id = self.provinces.get(province_id, (None, None, None))[2]
+        return region_id, province_id, self.ids[position]
+
+    def result(self, position, distance):
+        region_id, province_id, municipality_id = self.codes(position)
+        province_name, province_code, _ = self.provinces.get(province_id, ('', '', None))
+        return {
+            'country': {'id': ITALY_COUNTRY_ID},
+            'region': {'id': region_id, 'name': self.regions.get(region_id) or ''} if region_id else None,
+            'province': {'id': province_id, 'name': province_name, 'code': province_code} if province_id else None,
+            'municipality': {'id': municipality_id, 'name': self.names[position]},
+            'distance_m': round(distance, 1),
+        }
+
+
+_municipality_index = SharedIndex(ADMIN_UNITS_VERSION_KEY, MunicipalityIndex.build)
+
+
+def get_municipality_index():
+    """Return this worker's municipality index, rebuilding it when the shared version changed."""
+    return _municipality_index.get()
+
+
+def reset_municipality_index():
+    _municipality_index.reset()
+
+
+def resolve_admin_units(lon, lat, max_distance_m=MAX_MUNICIPALITY_DISTANCE_M):
+    """
+    Administrative units of a position.
+
+    Returns:
+        Dict with country, region, province and municipality ({id, name}) and
+        distance_m to the municipality centroid, or None when no municipality is near enough
+    """
+    index = get_municipality_index()
+    position, distance = index.nearest(lon, lat, max_distance_m)
+    if position is None:
+        return None
+    return index.result(position, distance)
+
+
+def backfill_admin_units(model, batch_size=500, overwrite=False, dry_run=False):
+    """
+    Fill the country, region, province and municipality of site or evidence rows from their position.
+
+    Args:
+        model: Site or ArchaeologicalEvidence
+        batch_size: Rows written per bulk update
+        overwrite: Also replace admin codes that are already set (default: rows missing any code,
+            filling only the empty ones)
+        dry_run: Count the rows that would change without writing
+
+    Returns:
+        Tuple (rows with a position checked, rows updated, rows with no municipality near enough)
+    """
+    index = get_municipality_index()
+    queryset = model.objects.order_by('pk')
+    if not overwrite:
+        missing = Q()
+        for field in ADMIN_FIELDS:
+            missing |= Q(**{f'{field}__isnull': True})
+        queryset = queryset.filter(missing)
+    columns = [f'{field}_id' for field in ADMIN_FIELDS]
+    rows = queryset.values_list('pk', 'centroid_x', 'centroid_y', 'lon', 'lat', *columns)
+
+    checked = unresolved = 0
+    changed = []
+    for pk, centroid_x, centroid_y, lon, lat, *current in rows.iterator(chunk_size=5000):
+        if centroid_x is None:
+            if lon is None or lat is None:
+                continue
+            centroid_x, centroid_y = float(lon), float(lat)
+        checked += 1
+        position, _ = index.nearest(centroid_x, centroid_y)
+        if position is None:
+            unresolved += 1
+            continue
+        resolved = (ITALY_COUNTRY_ID, *index.codes(position))
+        values = [new if overwrite or old is None else old for old, new in zip(current, resolved)]
+        if values != current:
+            changed.append(model(pk=pk, **dict(zip(columns, values))))
+
+    if not dry_run and changed:
+        model.objects.bulk_update(changed, columns, batch_size=batch_size)
+        # Counts per admin unit move with the new codes
+        schedule_aggregate_rebuild()
+        if model is ArchaeologicalEvidence:
+            # The catalog shows the evidence region; bulk_update sends no post_save
+            evidence_ids = [instance.pk for instance in changed]
+            research_ids = set(ArchEvResearch.objects.filter(
+                id_archaeological_evidence_id__in=evidence_ids
+            ).values_list('id_research', flat=True))
+            site_ids = SiteArchEvidence.objects.filter(
+                id_archaeological_evidence_id__in=evidence_ids
+            ).values_list('id_site_id', flat=True)
+            research_ids.update(research_ids_for_sites(site_ids))
+            schedule_catalog_refresh(research_ids)
+    return checked, len(changed), unresolved
+
+
+@receiver(post_save, sender=Municipality)
+@receiver(post_save, sender=Province)
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Municipality)
+@receiver(post_delete, sender=Province)
+@receiver(post_delete, sender=Region)
+def invalidate_municipality_index(sender, **kwargs):
+    _municipality_index.invalidate()
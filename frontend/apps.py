@@ -5,6 +5,27 @@ class FrontendConfig(AppConfig):
     name = 'frontend'
     
     def ready(self):
+        # Register system checks
+        import frontend.checks
         # Import audit logging signals
         import frontend.audit_middleware
-
+        # Import catalog refresh signals
+        import frontend.catalog
+        # Import search vector maintenance signals
+        import frontend.search
+        # Import derived geometry column signals
+        import frontend.spatial
+        # Import map render cache invalidation signals
+        import frontend.map_cache
+        # Import overview map cluster index update signals
+        import frontend.clusters
+        # Import nearby search index update signals
+        import frontend.nearby
+        # Import municipality index invalidation signals
+        import frontend.admin_units
+        # Import administrative aggregate maintenance signals
+        import frontend.admin_aggregates
+        # Import vector tile cache invalidation signals
+        import frontend.tiles
+        # Import author search index invalidation signals
+        import frontend.utils.author_search
@@ -0,0 +1,243 @@
+"""
+Materialized research catalog.
+Builds the research → site → evidence tree shown on the public catalog page,
+stores it in ResearchCatalogEntry and refreshes the affected entries from
+model signals so the catalog view never has to walk the link tables.
+"""
+
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils.text import Truncator
+
+from .models import (
+    Research, Site, ArchaeologicalEvidence, SiteResearch, SiteArchEvidence,
+    ArchEvResearch, ResearchCatalogEntry
+)
+
+# Descriptions are shortened before storage; the template truncates further
+DESCRIPTION_WORDS = 30
+
+
+def _short_description(text):
+    if not text:
+        return ''
+    return Truncator(text).words(DESCRIPTION_WORDS)
+
+
+def _evidence_payload(row):
+    return {
+        'id': row['id'],
+        'evidence_name': row['evidence_name'] or '',
+        'description': _short_description(row['description']),
+        'country': row['id_country__name_country'] or '',
+        'region': row['id_region__denominazione_regione'] or '',
+        'typology': row['id_archaeological_evidence_typology__desc_typology_archaeological_evidence'] or '',
+    }
+
+
+def build_catalog_trees(research_ids):
+    """
+    Build catalog trees for several researches with a fixed number of queries.
+    Only display fields are read; geometry and other large columns are never loaded.
+
+    Args:
+        research_ids: Iterable of Research ids
+
+    Returns:
+        Dict of research_id -> {'sites': [...], 'direct_evidences': [...]}
+    """
+    research_ids = list(research_ids)
+    if not research_ids:
+        return {}
+
+    site_links = list(
+        SiteResearch.objects
+        .filter(id_research_id__in=research_ids)
+        .order_by('id')
+        .values_list('id_research_id', 'id_site_id')
+    )
+    site_ids = {site_id for _, site_id in site_links}
+
+    site_evidence_links = list(
+        SiteArchEvidence.objects
+        .filter(id_site_id__in=site_ids)
+        .order_by('id')
+        .values_list('id_site_id', 'id_archaeological_evidence_id')
+    )
+    direct_links = list(
+        ArchEvResearch.objects
+        .filter(id_research__in=research_ids, id_archaeological_evidence__isnull=False)
+        .order_by('id')
+        .values_list('id_research', 'id_archaeological_evidence_id')
+    )
+
+    evidence_ids = {evidence_id for _, evidence_id in site_evidence_links}
+    evidence_ids.update(evidence_id for _, evidence_id in direct_links)
+    evidence_by_id = {
+        row['id']: _evidence_payload(row)
+        for row in ArchaeologicalEvidence.objects.filter(id__in=evidence_ids).values(
+            'id', 'evidence_name', 'description', 'id_country__name_country',
+            'id_region__denominazione_regione',
+            'id_archaeological_evidence_typology__desc_typology_archaeological_evidence',
+        )
+    }
+
+    site_by_id = {
+        row['id']: row
+        for row in Site.objects.filter(id__in=site_ids).values(
+            'id', 'site_name', 'description', 'locality_name'
+        )
+    }
+
+    site_evidence_map = defaultdict(list)
+    for site_id, evidence_id in site_evidence_links:
+        if evidence_id in evidence_by_id:
+            site_evidence_map[site_id].append(evidence_by_id[evidence_id])
+
+    trees = {research_id: {'sites': [], 'direct_evidences': []} for research_id in research_ids}
+    for research_id, site_id in site_links:
+        site = site_by_id.get(site_id)
+        if site:
+            trees[research_id]['sites'].append({
+                'id': site['id'],
+                'site_name': site['site_name'] or '',
+                'description': _short_description(site['description']),
+                'locality_name': site['locality_name'] or '',
+                'evidences': site_evidence_map.get(site_id, []),
+            })
+    for research_id, evidence_id in direct_links:
+        if research_id in trees and evidence_id in evidence_by_id:
+            trees[research_id]['direct_evidences'].append(evidence_by_id[evidence_id])
+
+    return trees
+
+
+def refresh_catalog_entries(research_ids):
+    """
+    Rebuild and store the catalog entries of the given researches.
+    Ids of researches that no longer exist are ignored.
+
+    Returns:
+        Dict of research_id -> tree for the entries written
+    """
+    existing_ids = list(Research.objects.filter(id__in=set(research_ids)).values_list('id', flat=True))
+    trees = build_catalog_trees(existing_ids)
+    entries = [ResearchCatalogEntry(id_research_id=research_id, tree=tree) for research_id, tree in trees.items()]
+    ResearchCatalogEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['id_research'],
+        update_fields=['tree', 'updated_at'],
+    )
+    return trees
+
+
+def get_catalog_trees(research_ids):
+    """
+    Read catalog trees for the given researches, building any missing entry.
+
+    Returns:
+        Dict of research_id -> tree
+    """
+    research_ids = list(research_ids)
+    trees = dict(
+        ResearchCatalogEntry.objects
+        .filter(id_research_id__in=research_ids)
+        .values_list('id_research_id', 'tree')
+    )
+    missing = [research_id for research_id in research_ids if research_id not in trees]
+    if missing:
+        trees.update(refresh_catalog_entries(missing))
+    return trees
+
+
+# Pending refreshes are collected per thread and flushed once the surrounding
+# transaction commits, so cascading deletes rebuild each research only once.
+_pending = threading.local()
+
+
+def _pending_ids():
+    if not hasattr(_pending, 'research_ids'):
+        _pending.research_ids = set()
+    return _pending.research_ids
+
+
+def _flush_catalog_refresh():
+    pending = _pending_ids()
+    if not pending:
+        return
+    research_ids = set(pending)
+    pending.clear()
+    refresh_catalog_entries(research_ids)
+
+
+def schedule_catalog_refresh(research_ids):
+    """Queue a catalog refresh for the given researches after the current transaction commits."""
+    research_ids = {int(research_id) for research_id in research_ids if research_id}
+    if not research_ids:
+        return
+    _pending_ids().update(research_ids)
+    transaction.on_commit(_flush_catalog_refresh)
+
+
+def research_ids_for_sites(site_ids):
+    return SiteResearch.objects.filter(id_site_id__in=site_ids).values_list('id_research_id', flat=True)
+
+
+def research_ids_for_evidence(evidence_id):
+    research_ids = set(
+        ArchEvResearch.objects.filter(id_archaeological_evidence_id=evidence_id).values_list('id_research', flat=True)
+    )
+    site_ids = SiteArchEvidence.objects.filter(
+        id_archaeological_evidence_id=evidence_id
+    ).values_list('id_site_id', flat=True)
+    research_ids.update(research_ids_for_sites(site_ids))
+    return research_ids
+
+
+# Signal handlers keeping the catalog in sync
+@receiver(post_save, sender=Research)
+def refresh_catalog_on_research_save(sender, instance, **kwargs):
+    schedule_catalog_refresh([instance.id])
+
+
+@receiver(post_save, sender=Site)
+def refresh_catalog_on_site_save(sender, instance, **kwargs):
+    schedule_catalog_refresh(research_ids_for_sites([instance.id]))
+
+
+@receiver(post_save, sender=ArchaeologicalEvidence)
+def refresh_catalog_on_evidence_save(sender, instance, **kwargs):
+    schedule_catalog_refresh(research_ids_for_evidence(instance.id))
+
+
+@receiver(post_save, sender=SiteResearch)
+@receiver(post_delete, sender=SiteResearch)
+def refresh_catalog_on_site_research_change(sender, instance, **kwargs):
+    schedule_catalog_refresh([instance.id_research_id])
+
+
+@receiver(post_save, sender=SiteArchEvidence)
+@receiver(post_delete, sender=SiteArchEvidence)
+def refresh_catalog_on_site_evidence_change(sender, instance, **kwargs):
+    schedule_catalog_refresh(research_ids_for_sites([instance.id_site_id]))
+
+
+@receiver(pre_save, sender=ArchEvResearch)
+def remember_previous_evidence_research(sender, instance, **kwargs):
+    """update_or_create can move a link to another research; remember the old one."""
+    instance._previous_research_id = None
+    if instance.pk:
+        instance._previous_research_id = (
+            ArchEvResearch.objects.filter(pk=instance.pk).values_list('id_research', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=ArchEvResearch)
+@receiver(post_delete, sender=ArchEvResearch)
+def refresh_catalog_on_evidence_research_change(sender, instance, **kwargs):
+    schedule_catalog_refresh([instance.id_research, getattr(instance, '_previous_research_id', None)])
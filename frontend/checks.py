@@ -0,0 +1,28 @@
+"""
+System checks for settings the frontend relies on.
+"""
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Preview jobs (frontend/shapefile_preview.py) and the index version keys are
+    read back by other workers, which a per-process cache cannot serve.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Warning(
+        f'The default cache ({backend}) is not shared between worker processes.',
+        hint='Upload preview polling and in-memory index invalidation only work within one process; '
+             'use a file-based or Redis cache when running several workers.',
+        id='frontend.W001',
+    )]
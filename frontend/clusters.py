@@ -0,0 +1,283 @@
+"""
+Point clustering for the overview map of all sites and evidence.
+Points (the stored centroids, or lat/lon when a row has no geometry) are kept
+in NumPy arrays and aggregated on a Web Mercator grid of CLUSTER_RADIUS pixel
+cells for every zoom up to CLUSTER_MAX_ZOOM. The grids are nested, so each
+level is built from the one below it; above CLUSTER_MAX_ZOOM individual points
+are returned.
+
+The index lives in each worker and is updated in place when a site or
+evidence row is saved or deleted; a version key in the Django cache tells the
+other workers to rebuild theirs.
+"""
+
+import json
+import math
+import threading
+
+import numpy as np
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Site, ArchaeologicalEvidence
+from .spatial import (
+    COORDINATE_DECIMALS, MAX_FEATURES, MAX_ZOOM, feature_json, geometries_bulk_changed, load_layer_points, mercator,
+    point_position,
+)
+from .utils.versioned_index import SharedIndex
+
+CLUSTER_LAYERS = {
+    'site': (Site, 'site_name'),
+    'evidence': (ArchaeologicalEvidence, 'evidence_name'),
+}
+CLUSTER_LAYER_BY_MODEL = {model: layer for layer, (model, _) in CLUSTER_LAYERS.items()}
+
+CLUSTER_RADIUS = 64  # cell size in screen pixels
+CLUSTER_MAX_ZOOM = 16
+CLUSTER_VERSION_KEY = 'cluster_index_version'
+_CELLS_SHIFT = int(math.log2(256 // CLUSTER_RADIUS))  # cells per tile side = 2 ** _CELLS_SHIFT
+_KEY_BITS = 32
+_KEY_MASK = (1 << _KEY_BITS) - 1
+
+
+def cell_keys(x, y, zoom):
+    """Grid cell keys (int64) of projected points at a zoom."""
+    cells = 2 ** (zoom + _CELLS_SHIFT)
+    cx = np.minimum((x * cells).astype(np.int64), cells - 1)
+    cy = np.minimum((y * cells).astype(np.int64), cells - 1)
+    return (cx << _KEY_BITS) | cy
+
+
+def parent_keys(keys):
+    return ((keys >> (_KEY_BITS + 1)) << _KEY_BITS) | ((keys & _KEY_MASK) >> 1)
+
+
+class ClusterLevel:
+    """
+    Cells of one zoom level, sorted by key. Sums are kept instead of means so a
+    point can be added or removed in place; for a cell holding one point,
+    sum_slot is that point's slot.
+    """
+
+    def __init__(self, keys, counts, sum_lon, sum_lat, sum_slot):
+        self.keys = keys
+        self.counts = counts
+        self.sum_lon = sum_lon
+        self.sum_lat = sum_lat
+        self.sum_slot = sum_slot
+
+    @classmethod
+    def aggregate(cls, keys, counts, sum_lon, sum_lat, sum_slot):
+        """Merge rows sharing a key."""
+        unique, inverse = np.unique(keys, return_inverse=True)
+
+        def total(values):
+            return np.bincount(inverse, weights=values, minlength=len(unique))
+
+        return cls(unique, total(counts).astype(np.int64), total(sum_lon), total(sum_lat), total(sum_slot))
+
+    def parent(self):
+        """The level one zoom out."""
+        return ClusterLevel.aggregate(parent_keys(self.keys), self.counts, self.sum_lon, self.sum_lat, self.sum_slot)
+
+    def update(self, key, lon, lat, slot, sign):
+        """Add (sign=1) or remove (sign=-1) one point."""
+        position = np.searchsorted(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            if sign < 0:
+                return
+            self.keys = np.insert(self.keys, position, key)
+            self.counts = np.insert(self.counts, position, 0)
+            self.sum_lon = np.insert(self.sum_lon, position, 0.0)
+            self.sum_lat = np.insert(self.sum_lat, position, 0.0)
+            self.sum_slot = np.insert(self.sum_slot, position, 0.0)
+        self.counts[position] += sign
+        self.sum_lon[position] += sign * lon
+        self.sum_lat[position] += sign * lat
+        self.sum_slot[position] += sign * slot
+
+
+class ClusterIndex:
+    """Points of all CLUSTER_LAYERS with their cluster levels."""
+
+    def __init__(self, layers, ids, names, lon, lat, version=None):
+        self.version = version
+        self.layers = list(layers)
+        self.ids = list(ids)
+        self.names = list(names)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.slots = {(layer, pk): slot for slot, (layer, pk) in enumerate(zip(self.layers, self.ids))}
+        self.levels = self._build_levels()
+
+    @classmethod
+    def build(cls, version=None):
+        return cls(*load_cluster_points(), version=version)
+
+    def _build_levels(self):
+        x, y = mercator(self.lon, self.lat)
+        slots = np.arange(len(self.lon), dtype=np.float64)
+        level = ClusterLevel.aggregate(
+            cell_keys(x, y, CLUSTER_MAX_ZOOM), np.ones(len(slots)), self.lon, self.lat, slots
+        )
+        levels = {CLUSTER_MAX_ZOOM: level}
+        for zoom in range(CLUSTER_MAX_ZOOM - 1, -1, -1):
+            level = levels[zoom] = level.parent()
+        return levels
+
+    def _apply(self, slot, sign):
+        lon, lat = self.lon[slot], self.lat[slot]
+        x, y = mercator(np.array([lon]), np.array([lat]))
+        for zoom, level in self.levels.items():
+            level.update(cell_keys(x, y, zoom)[0], lon, lat, slot, sign)
+
+    def remove(self, layer, pk):
+        slot = self.slots.pop((layer, pk), None)
+        if slot is not None:
+            self._apply(slot, -1)
+            self.lon[slot] = self.lat[slot] = np.nan
+
+    def upsert(self, layer, pk, name, lon, lat):
+        """Move, rename or add a point (or remove it when it has no position)."""
+        if lon is None or lat is None:
+            self.remove(layer, pk)
+            return
+        slot = self.slots.get((layer, pk))
+        if slot is None:
+            slot = self.slots[(layer, pk)] = len(self.ids)
+            self.layers.append(layer)
+            self.ids.append(pk)
+            self.names.append('')
+            self.lon = np.append(self.lon, np.nan)
+            self.lat = np.append(self.lat, np.nan)
+        else:
+            self._apply(slot, -1)
+        self.names[slot] = name or ''
+        self.lon[slot] = lon
+        self.lat[slot] = lat
+        self._apply(slot, 1)
+
+    def point_feature(self, slot):
+        geometry = json.dumps({'type': 'Point', 'coordinates': [
+            round(float(self.lon[slot]), COORDINATE_DECIMALS), round(float(self.lat[slot]), COORDINATE_DECIMALS),
+        ]})
+        return feature_json(self.layers[slot], self.ids[slot], self.names[slot], geometry)
+
+    def query(self, zoom, bbox):
+        """
+        Clusters and single points whose position falls in bbox at a zoom.
+
+        Returns:
+            List of GeoJSON Feature strings
+        """
+        minx, miny, maxx, maxy = bbox
+        if zoom > CLUSTER_MAX_ZOOM:
+            inside = (self.lon >= minx) & (self.lon <= maxx) & (self.lat >= miny) & (self.lat <= maxy)
+            return [self.point_feature(slot) for slot in np.flatnonzero(inside)]
+
+        level = self.levels[zoom]
+        occupied = level.counts > 0
+        counts = np.where(occupied, level.counts, 1)
+        lon = level.sum_lon / counts
+        lat = level.sum_lat / counts
+        inside = occupied & (lon >= minx) & (lon <= maxx) & (lat >= miny) & (lat <= maxy)
+
+        features = []
+        for position in np.flatnonzero(inside):
+            if level.counts[position] == 1:
+                features.append(self.point_feature(int(round(level.sum_slot[position]))))
+                continue
+            geometry = json.dumps({'type': 'Point', 'coordinates': [
+                round(float(lon[position]), COORDINATE_DECIMALS), round(float(lat[position]), COORDINATE_DECIMALS),
+            ]})
+            features.append(
+                f'{{"type":"Feature","id":"cluster.{zoom}.{int(level.keys[position])}","geometry":{geometry},'
+                f'"properties":{{"cluster":true,"count":{int(level.counts[position])}}}}}'
+            )
+        return features
+
+
+def load_cluster_points():
+    """
+    Read the positions of every site and evidence row.
+
+    Returns:
+        Tuple (layers, ids, names, lon, lat), rows without a position dropped
+    """
+    layers, ids, names, lon, lat = [], [], [], [], []
+    for layer in CLUSTER_LAYERS:
+        layer_ids, layer_names, layer_lon, layer_lat = load_layer_points(layer)
+        layers.extend([layer] * len(layer_ids))
+        ids.extend(layer_ids)
+        names.extend(layer_names)
+        lon.append(layer_lon)
+        lat.append(layer_lat)
+    return layers, ids, names, np.concatenate(lon), np.concatenate(lat)
+
+
+_cluster_lock = threading.RLock()
+_cluster_index = SharedIndex(CLUSTER_VERSION_KEY, ClusterIndex.build, _cluster_lock)
+
+
+def get_cluster_index():
+    """Return this worker's cluster index, rebuilding it when the shared version changed."""
+    return _cluster_index.get()
+
+
+def reset_cluster_index():
+    _cluster_index.reset()
+
+
+def parse_cluster_zoom(value):
+    """
+    Parse the required z parameter.
+
+    Raises:
+        ValueError: If the value is missing or not an integer between 0 and MAX_ZOOM
+    """
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        zoom = -1
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f'z must be an integer between 0 and {MAX_ZOOM}')
+    return zoom
+
+
+def cluster_feature_collection(zoom, bbox, limit=MAX_FEATURES):
+    """
+    GeoJSON FeatureCollection of the clusters and points in bbox at a zoom.
+    Clusters have properties {"cluster": true, "count": n}; single points
+    carry layer, id and name like /api/spatial/.
+
+    Returns:
+        JSON string; "truncated" is true when more than limit features matched
+    """
+    with _cluster_lock:
+        features = get_cluster_index().query(zoom, bbox)
+    truncated = len(features) > limit
+    return (f'{{"type":"FeatureCollection","zoom":{zoom},"truncated":{"true" if truncated else "false"},'
+            f'"features":[{",".join(features[:limit])}]}}')
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_save, sender=ArchaeologicalEvidence)
+def update_cluster_point(sender, instance, **kwargs):
+    layer = CLUSTER_LAYER_BY_MODEL[sender]
+    name = getattr(instance, CLUSTER_LAYERS[layer][1])
+    lon, lat = point_position(instance)
+    _cluster_index.update(lambda index: index.upsert(layer, instance.pk, name, lon, lat))
+
+
+@receiver(post_delete, sender=Site)
+@receiver(post_delete, sender=ArchaeologicalEvidence)
+def remove_cluster_point(sender, instance, **kwargs):
+    layer = CLUSTER_LAYER_BY_MODEL[sender]
+    _cluster_index.update(lambda index: index.remove(layer, instance.pk))
+
+
+@receiver(geometries_bulk_changed)
+def rebuild_cluster_index(sender, **kwargs):
+    """Bulk writes are not applied in place: every worker rebuilds on next use."""
+    if sender in CLUSTER_LAYER_BY_MODEL:
+        _cluster_index.invalidate()
@@ -0,0 +1,189 @@
+"""
+Density grid of sites or evidence for heatmaps.
+Positions (see spatial.load_layer_points) are binned into a regular grid of
+square-ish cells cell_km wide with numpy.histogram2d. Cell edges are snapped to
+multiples of the cell size, so panning the map reuses cached grids and
+neighbouring requests line up.
+
+Each worker keeps the coordinate arrays of a layer, and the Django cache keeps
+computed grids. Both are keyed by the spatial layer version (see
+spatial.get_layer_version), which moved or renamed rows, deletes and bulk
+imports bump, so a write invalidates them everywhere without receivers of its own.
+"""
+
+import base64
+import hashlib
+import io
+import math
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+from django.core.cache import cache
+from PIL import Image
+
+from .spatial import POINT_LAYERS, SPATIAL_VERSION_KEY, get_layer_version, load_layer_points, parse_bbox
+from .utils.versioned_index import SharedIndex
+
+KEY_PREFIX = 'density'
+KM_PER_DEGREE = 111.32
+DEFAULT_CELL_KM = 10.0
+MIN_CELL_KM = 0.1
+MAX_CELL_KM = 1000.0
+MAX_GRID_CELLS = 512 * 512
+DENSITY_FORMATS = ('json', 'png')
+GRID_TIMEOUT = 60 * 60
+# PNG colour ramp from sparse to dense cells (RGB); empty cells are transparent
+RAMP_LOW = (255, 237, 160)
+RAMP_HIGH = (189, 0, 38)
+
+DensityGrid = namedtuple('DensityGrid', ['bbox', 'cell_size', 'counts'])
+DensityPoints = namedtuple('DensityPoints', ['version', 'lon', 'lat'])
+
+
+def load_density_points(layer, version=None):
+    _, _, lon, lat = load_layer_points(layer)
+    return DensityPoints(version, lon, lat)
+
+
+# Follow the spatial layer versions (bumped by spatial.invalidate_spatial_index)
+_density_points = {
+    layer: SharedIndex(SPATIAL_VERSION_KEY.format(layer), partial(load_density_points, layer))
+    for layer in POINT_LAYERS
+}
+
+
+def get_density_points(layer):
+    """(lon, lat) arrays of a point layer, reloaded when the layer version changed."""
+    points = _density_points[layer].get()
+    return points.lon, points.lat
+
+
+def reset_density_points(layer=None):
+    for name in POINT_LAYERS if layer is None else (layer,):
+        _density_points[name].reset()
+
+
+def parse_density_query(params):
+    """
+    Parse the layer, cell_km, bbox and format parameters.
+
+    Returns:
+        Dict with layer, cell_km, bbox (None for the extent of the layer) and format
+
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    layer = params.get('layer') or 'site'
+    if layer not in POINT_LAYERS:
+        raise ValueError(f"layer must be one of {', '.join(POINT_LAYERS)}")
+    try:
+        cell_km = float(params.get('cell_km') or DEFAULT_CELL_KM)
+    except ValueError:
+        cell_km = -1.0
+    if not MIN_CELL_KM <= cell_km <= MAX_CELL_KM:
+        raise ValueError(f'cell_km must be a number between {MIN_CELL_KM} and {MAX_CELL_KM:g}')
+    bbox = parse_bbox(params['bbox']) if params.get('bbox') else None
+    density_format = params.get('format') or 'json'
+    if density_format not in DENSITY_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(DENSITY_FORMATS)}")
+    return {'layer': layer, 'cell_km': cell_km, 'bbox': bbox, 'format': density_format}
+
+
+def grid_cells(bbox, cell_km):
+    """
+    Snap bbox outwards to a grid of cell_km cells.
+
+    The cell width in degrees of longitude is taken at the bbox centre latitude,
+    rounded to the degree so small pans keep the same grid.
+
+    Returns:
+        Tuple (first column, first row, columns, rows, cell width, cell height), columns
+        and rows counted in cells from lon/lat 0
+
+    Raises:
+        ValueError: If the grid would exceed MAX_GRID_CELLS
+    """
+    minx, miny, maxx, maxy = bbox
+    cell_height = cell_km / KM_PER_DEGREE
+    reference_lat = round((miny + maxy) / 2)
+    cell_width = cell_height / max(math.cos(math.radians(reference_lat)), 0.01)
+    first_column, first_row = math.floor(minx / cell_width), math.floor(miny / cell_height)
+    columns = max(math.ceil(maxx / cell_width) - first_column, 1)
+    rows = max(math.ceil(maxy / cell_height) - first_row, 1)
+    if columns * rows > MAX_GRID_CELLS:
+        raise ValueError(f'The grid would have {columns * rows} cells (at most {MAX_GRID_CELLS}); '
+                         f'increase cell_km or narrow the bbox')
+    return first_column, first_row, columns, rows, cell_width, cell_height
+
+
+def density_grid(layer, cell_km=DEFAULT_CELL_KM, bbox=None):
+    """
+    Count the sites or evidence per grid cell.
+
+    Args:
+        layer: 'site' or 'evidence'
+        cell_km: Cell size in kilometers
+        bbox: (minx, miny, maxx, maxy); default: the extent of the layer
+
+    Returns:
+        DensityGrid(snapped bbox, (cell width, cell height) in degrees, uint32 counts with
+        the northernmost row first)
+
+    Raises:
+        ValueError: If the grid would exceed MAX_GRID_CELLS
+    """
+    version = get_layer_version(layer)
+    lon, lat = get_density_points(layer)
+    if bbox is None:
+        bbox = (0.0, 0.0, 0.0, 0.0)
+        if len(lon):
+            bbox = (float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max()))
+    first_column, first_row, columns, rows, cell_width, cell_height = grid_cells(bbox, cell_km)
+    snapped = (first_column * cell_width, first_row * cell_height,
+               (first_column + columns) * cell_width, (first_row + rows) * cell_height)
+
+    key = f'{KEY_PREFIX}:{layer}:{version}:{cell_km:g}:{first_column}:{first_row}:{columns}:{rows}:{cell_width!r}'
+    counts = cache.get(key)
+    if counts is None:
+        histogram, _, _ = np.histogram2d(
+            lat, lon, bins=[rows, columns], range=[[snapped[1], snapped[3]], [snapped[0], snapped[2]]],
+        )
+        counts = np.ascontiguousarray(histogram[::-1], dtype=np.uint32)
+        cache.set(key, counts, timeout=GRID_TIMEOUT)
+    return DensityGrid(snapped, (cell_width, cell_height), counts)
+
+
+def grid_json(layer, cell_km, grid):
+    """JSON document of a grid; counts are base64 little-endian uint32, row-major, north first."""
+    rows, columns = grid.counts.shape
+    return {
+        'success': True,
+        'layer': layer,
+        'cell_km': cell_km,
+        'bbox': [round(value, 6) for value in grid.bbox],
+        'cell_size': [round(value, 9) for value in grid.cell_size],
+        'shape': [rows, columns],
+        'total': int(grid.counts.sum()),
+        'max': int(grid.counts.max()),
+        'dtype': 'uint32',
+        'counts': base64.b64encode(grid.counts.astype('<u4').tobytes()).decode('ascii'),
+    }
+
+
+def grid_png(grid):
+    """PNG of a grid, one pixel per cell, coloured on a log scale (empty cells transparent)."""
+    counts = grid.counts.astype(np.float64)
+    peak = counts.max()
+    scale = np.log1p(counts) / math.log1p(peak) if peak else counts
+    low, high = np.array(RAMP_LOW, dtype=np.float64), np.array(RAMP_HIGH, dtype=np.float64)
+    pixels = np.empty(counts.shape + (4,), dtype=np.uint8)
+    pixels[..., :3] = np.rint(low + (high - low) * scale[..., None])
+    pixels[..., 3] = np.where(counts > 0, np.rint(96 + 159 * scale), 0)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def grid_etag(grid):
+    return f'"{hashlib.sha256(grid.counts.tobytes() + repr(grid.bbox).encode()).hexdigest()[:32]}"'
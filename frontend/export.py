@@ -0,0 +1,331 @@
+"""
+Streaming export of sites, evidence and research areas as GeoJSON, GeoPackage or CSV.
+
+Rows are read with .iterator(chunk_size=BATCH_SIZE) and converted one batch at
+a time: geometries come from the stored WKB (text geometries are parsed only
+for rows not yet backfilled) and are serialized with vectorized shapely calls.
+GeoJSON and CSV are generated as the response is sent. A GeoPackage is a
+SQLite file, so batches are appended to a temporary file with pyogrio and the
+file is streamed afterwards. Memory stays bounded by the batch size either way.
+
+Filters match the research catalog: q (full-text research search), region,
+chronology and research ids. A site or evidence row matches q when it belongs
+to a matching research. A research matches region or chronology through its
+linked sites and evidence.
+"""
+
+import csv
+import json
+import os
+import tempfile
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+import pyogrio
+import shapely
+from django.db.models import Q
+
+from .models import (
+    ArchaeologicalEvidence, ArchEvResearch, Interpretation, Research, Site, SiteArchEvidence, SiteResearch,
+)
+from .search import search_research
+from .spatial import COORDINATE_DECIMALS, SPATIAL_LAYERS, round_coordinates
+from .utils.geometry_parser import parse_geometries
+
+BATCH_SIZE = 2000
+EXPORT_FORMATS = {
+    'geojson': 'application/geo+json',
+    'gpkg': 'application/geopackage+sqlite3',
+    'csv': 'text/csv',
+}
+
+# Exported attributes per layer: (column name, value lookup, GeoPackage type)
+EXPORT_COLUMNS = {
+    'site': [
+        ('id', 'id', 'int'),
+        ('name', 'site_name', 'str'),
+        ('locality', 'locality_name', 'str'),
+        ('country', 'id_country__name_country', 'str'),
+        ('region', 'id_region__denominazione_regione', 'str'),
+        ('province', 'id_province__denominazione_provincia', 'str'),
+        ('municipality', 'id_municipality__denominazione_comune', 'str'),
+        ('elevation', 'elevation', 'int'),
+        ('lat', 'lat', 'float'),
+        ('lon', 'lon', 'float'),
+        ('description', 'description', 'str'),
+    ],
+    'evidence': [
+        ('id', 'id', 'int'),
+        ('name', 'evidence_name', 'str'),
+        ('typology', 'id_archaeological_evidence_typology__desc_typology_archaeological_evidence', 'str'),
+        ('chronology', 'id_chronology__chronological_period', 'str'),
+        ('chronology_certainty', 'chronology_certainty_level', 'int'),
+        ('locality', 'locality_name', 'str'),
+        ('country', 'id_country__name_country', 'str'),
+        ('region', 'id_region__denominazione_regione', 'str'),
+        ('province', 'id_province__denominazione_provincia', 'str'),
+        ('municipality', 'id_municipality__denominazione_comune', 'str'),
+        ('elevation', 'elevation', 'int'),
+        ('lat', 'lat', 'float'),
+        ('lon', 'lon', 'float'),
+        ('description', 'description', 'str'),
+    ],
+    'research': [
+        ('id', 'id', 'int'),
+        ('title', 'title', 'str'),
+        ('year', 'year', 'str'),
+        ('type', 'type', 'str'),
+        ('keywords', 'keywords', 'str'),
+        ('abstract', 'abstract', 'str'),
+    ],
+}
+
+ExportBatch = namedtuple('ExportBatch', ['columns', 'shapes'])
+
+
+def _id_list(value, name):
+    try:
+        ids = [int(part) for part in str(value).split(',') if part.strip()]
+    except ValueError:
+        ids = []
+    if not ids:
+        raise ValueError(f'{name} must be an id or a comma-separated list of ids')
+    return ids
+
+
+def parse_export_filters(params):
+    """
+    Parse the catalog filters of an export request.
+
+    Returns:
+        Dict with q and lang (strings) and region, chronology and research (lists of ids);
+        absent filters are left out
+
+    Raises:
+        ValueError: If an id filter is not a list of integers
+    """
+    filters = {}
+    for name in ('q', 'lang'):
+        if (params.get(name) or '').strip():
+            filters[name] = params[name].strip()
+    for name in ('region', 'chronology', 'research'):
+        if (params.get(name) or '').strip():
+            filters[name] = _id_list(params[name], name)
+    return filters
+
+
+def _research_ids(filters):
+    """Subquery of the research ids selected by the q and research filters, or None when neither is set."""
+    queryset = None
+    if filters.get('q'):
+        queryset = search_research(Research.objects.all(), filters['q'], filters.get('lang')).order_by()
+    if filters.get('research'):
+        queryset = (queryset if queryset is not None else Research.objects.all()).filter(id__in=filters['research'])
+    return None if queryset is None else queryset.values('id')
+
+
+def _site_filter(filters):
+    condition = Q()
+    if filters.get('region'):
+        condition &= Q(id_region_id__in=filters['region'])
+    if filters.get('chronology'):
+        condition &= Q(id__in=Interpretation.objects.filter(
+            id_chronology_id__in=filters['chronology']
+        ).values('id_site_id'))
+    return condition
+
+
+def _evidence_filter(filters):
+    condition = Q()
+    if filters.get('region'):
+        condition &= Q(id_region_id__in=filters['region'])
+    if filters.get('chronology'):
+        condition &= Q(id_chronology_id__in=filters['chronology'])
+    return condition
+
+
+def export_queryset(layer, filters=None):
+    """
+    Rows of a layer matching the catalog filters (see parse_export_filters), ordered by id.
+
+    Raises:
+        ValueError: For an unknown layer
+    """
+    if layer not in SPATIAL_LAYERS:
+        raise ValueError(f"layer must be one of {', '.join(SPATIAL_LAYERS)}")
+    filters = filters or {}
+    model = SPATIAL_LAYERS[layer][0]
+    research_ids = _research_ids(filters)
+    queryset = model.objects.all()
+
+    if layer == 'site':
+        queryset = queryset.filter(_site_filter(filters))
+        if research_ids is not None:
+            queryset = queryset.filter(id__in=SiteResearch.objects.filter(
+                id_research_id__in=research_ids
+            ).values('id_site_id'))
+    elif layer == 'evidence':
+        queryset = queryset.filter(_evidence_filter(filters))
+        if research_ids is not None:
+            # Linked directly or through one of the research's sites, as in the catalog tree
+            site_ids = SiteResearch.objects.filter(id_research_id__in=research_ids).values('id_site_id')
+            queryset = queryset.filter(
+                Q(id__in=ArchEvResearch.objects.filter(
+                    id_research__in=research_ids
+                ).values('id_archaeological_evidence_id'))
+                | Q(id__in=SiteArchEvidence.objects.filter(
+                    id_site_id__in=site_ids
+                ).values('id_archaeological_evidence_id'))
+            )
+    else:
+        if research_ids is not None:
+            queryset = queryset.filter(id__in=research_ids)
+        if filters.get('region') or filters.get('chronology'):
+            sites = Site.objects.filter(_site_filter(filters)).values('id')
+            evidence = ArchaeologicalEvidence.objects.filter(_evidence_filter(filters)).values('id')
+            queryset = queryset.filter(
+                Q(id__in=SiteResearch.objects.filter(id_site_id__in=sites).values('id_research_id'))
+                | Q(id__in=ArchEvResearch.objects.filter(
+                    id_archaeological_evidence_id__in=evidence
+                ).values('id_research'))
+                | Q(id__in=SiteResearch.objects.filter(id_site_id__in=SiteArchEvidence.objects.filter(
+                    id_archaeological_evidence_id__in=evidence
+                ).values('id_site_id')).values('id_research_id'))
+            )
+    return queryset.order_by('id')
+
+
+def _batch_shapes(model, ids, wkb_values):
+    shapes = np.full(len(ids), None, dtype=object)
+    stored = [position for position, data in enumerate(wkb_values) if data]
+    if stored:
+        shapes[stored] = shapely.from_wkb([bytes(wkb_values[position]) for position in stored])
+    missing = [ids[position] for position, data in enumerate(wkb_values) if not data]
+    if missing:
+        # Rows not backfilled yet (see backfill_geometry_columns)
+        texts = dict(model.objects.filter(id__in=missing).values_list('id', 'geometry'))
+        parsed = parse_geometries(texts.get(pk) for pk in missing)
+        positions = [position for position, data in enumerate(wkb_values) if not data]
+        for position, shape in zip(positions, parsed):
+            shapes[position] = shape
+    return shapes
+
+
+def export_batches(layer, filters=None, batch_size=BATCH_SIZE):
+    """
+    Read the rows of an export in batches.
+
+    Yields:
+        ExportBatch(dict column -> list of values, WGS84 shapes as object array, None
+        for rows without a usable geometry)
+    """
+    model = SPATIAL_LAYERS[layer][0]
+    columns = EXPORT_COLUMNS[layer]
+    rows = export_queryset(layer, filters).values_list(
+        *[lookup for _, lookup, _ in columns], 'geometry_wkb'
+    ).iterator(chunk_size=batch_size)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        values = list(zip(*batch))
+        shapes = _batch_shapes(model, values[0], values[-1])
+        yield ExportBatch({name: list(column) for (name, _, _), column in zip(columns, values)}, shapes)
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return float(value)
+
+
+def geojson_chunks(layer, filters=None, batch_size=BATCH_SIZE):
+    """Yield a GeoJSON FeatureCollection of an export piece by piece (one string per batch)."""
+    names = [name for name, _, _ in EXPORT_COLUMNS[layer]]
+    yield '{"type":"FeatureCollection","features":[\n'
+    separator = ''
+    for batch in export_batches(layer, filters, batch_size):
+        geometries = shapely.to_geojson(round_coordinates(batch.shapes))
+        features = []
+        for position, geometry in enumerate(geometries.tolist()):
+            properties = {name: _json_value(batch.columns[name][position]) for name in names}
+            features.append(
+                f'{{"type":"Feature","id":"{layer}.{properties["id"]}","geometry":{geometry or "null"},'
+                f'"properties":{json.dumps(properties, separators=(",", ":"), ensure_ascii=False)}}}'
+            )
+        yield separator + ',\n'.join(features)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+class _Echo:
+    """File-like object whose write returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(layer, filters=None, batch_size=BATCH_SIZE):
+    """Yield the CSV rows of an export (geometry as WKT), one string per batch."""
+    names = [name for name, _, _ in EXPORT_COLUMNS[layer]]
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names + ['geometry'])
+    for batch in export_batches(layer, filters, batch_size):
+        wkt = shapely.to_wkt(batch.shapes, rounding_precision=COORDINATE_DECIMALS, trim=True)
+        yield ''.join(
+            writer.writerow([batch.columns[name][position] for name in names] + [text or ''])
+            for position, text in enumerate(wkt.tolist())
+        )
+
+
+def _field_array(values, kind):
+    if kind == 'str':
+        return np.array(values, dtype=object), None
+    mask = np.array([value is None for value in values], dtype=bool)
+    dtype = np.int64 if kind == 'int' else np.float64
+    array = np.array([0 if value is None else value for value in values], dtype=dtype)
+    return array, mask if mask.any() else None
+
+
+def write_geopackage(layer, path, filters=None, batch_size=BATCH_SIZE):
+    """
+    Write an export to a GeoPackage file, appending one batch at a time.
+
+    Returns:
+        Number of features written
+    """
+    columns = EXPORT_COLUMNS[layer]
+    names = [name for name, _, _ in columns]
+    written = 0
+    options = {'layer': layer, 'driver': 'GPKG', 'geometry_type': 'Unknown', 'crs': 'EPSG:4326',
+               'promote_to_multi': False}
+    for batch in export_batches(layer, filters, batch_size):
+        fields = [_field_array(batch.columns[name], kind) for name, _, kind in columns]
+        pyogrio.raw.write(
+            path, shapely.to_wkb(batch.shapes), [array for array, _ in fields], names,
+            field_mask=[mask for _, mask in fields], append=written > 0, **options,
+        )
+        written += len(batch.shapes)
+    if not written:
+        # Keep the layer and its columns in an empty export
+        fields = [_field_array([], kind) for _, _, kind in columns]
+        pyogrio.raw.write(path, np.array([], dtype=object), [array for array, _ in fields], names, **options)
+    return written
+
+
+def geopackage_file(layer, filters=None, batch_size=BATCH_SIZE):
+    """
+    Write an export to a temporary GeoPackage and return it opened for reading.
+    The file is already unlinked, so it disappears when the handle is closed.
+    """
+    directory = tempfile.mkdtemp(prefix='export-')
+    path = os.path.join(directory, f'{layer}.gpkg')
+    try:
+        write_geopackage(layer, path, filters, batch_size)
+        handle = open(path, 'rb')
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+    return handle
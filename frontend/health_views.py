@@ -9,6 +9,8 @@ from django.conf import settings
 from django.views.decorators.http import require_GET
 from django.views.decorators.cache import never_cache
 
+from .map_cache import get_map_cache_stats
+
 logger = logging.getLogger(__name__)
 
 
@@ -92,6 +94,16 @@ def health_check(request):
             'message': str(e)
         }
     
+    # Map render cache counters (informational)
+    try:
+        health_status['checks']['map_cache'] = {'status': 'ok', **get_map_cache_stats()}
+    except Exception as e:
+        logger.error(f"Map cache stats failed: {e}")
+        health_status['checks']['map_cache'] = {
+            'status': 'error',
+            'message': str(e)
+        }
+    
     # Set overall status
     if not is_healthy:
         health_status['status'] = 'unhealthy'
@@ -0,0 +1,270 @@
+"""
+Bulk ingestion of survey data (zipped shapefiles, GeoPackage, GeoJSON) as
+sites or archaeological evidence.
+
+Features are streamed in batches of BATCH_SIZE through pyogrio's Arrow reader
+(one pass over an open dataset, geometries as WKB). Shapefiles and GeoPackages
+are read incrementally, so memory stays bounded by the batch; GDAL's GeoJSON
+driver may still hold the parsed document. Geometries are reprojected to
+WGS84 with a cached pyproj Transformer and stored whole (every part and
+hole); source attributes are copied to model fields through a mapping. Rows
+are written with bulk_create after filling the derived geometry columns,
+and geometries_bulk_changed tells the spatial indexes and the tile cache.
+"""
+
+import os
+import tempfile
+import zipfile
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+
+import numpy as np
+import pyogrio
+import shapely
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import models, transaction
+from pyogrio.raw import open_arrow
+from pyproj import CRS, Transformer
+
+from .spatial import DERIVED_FIELDS, POINT_LAYERS, SPATIAL_LAYERS, geometries_bulk_changed, sync_geometry_columns_many
+from .utils.geometry_parser import format_geometries
+
+BATCH_SIZE = 5000
+DATASET_EXTENSIONS = ('.shp', '.gpkg', '.geojson', '.json')
+UPLOAD_EXTENSIONS = ('.zip', '.gpkg', '.geojson', '.json')  # shapefiles need their sidecar files
+# Filled from the geometry, never from the mapping
+GEOMETRY_FIELDS = ('geometry', 'lat', 'lon') + DERIVED_FIELDS
+
+FeatureBatch = namedtuple('FeatureBatch', ['fids', 'shapes', 'attributes'])
+IngestResult = namedtuple('IngestResult', ['created', 'skipped_geometry', 'skipped_invalid'])
+
+
+def dataset_path(path):
+    """
+    GDAL path of the dataset in a file; for a zip archive, its first shapefile,
+    GeoPackage or GeoJSON member.
+
+    Raises:
+        ValueError: If a zip archive contains no supported dataset
+    """
+    if not path.lower().endswith('.zip'):
+        return path
+    with zipfile.ZipFile(path) as archive:
+        members = sorted(name for name in archive.namelist() if name.lower().endswith(DATASET_EXTENSIONS))
+    if not members:
+        raise ValueError(f"The archive contains no {', '.join(DATASET_EXTENSIONS)} file.")
+    return f'/vsizip/{path}/{members[0]}'
+
+
+@contextmanager
+def uploaded_dataset(upload):
+    """
+    Spool an uploaded file to disk and yield its dataset path.
+
+    Raises:
+        ValueError: If the file extension is not supported
+    """
+    suffix = os.path.splitext(upload.name or '')[1].lower()
+    if suffix not in UPLOAD_EXTENSIONS:
+        raise ValueError(f"Unsupported file type; upload one of {', '.join(UPLOAD_EXTENSIONS)}.")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'upload{suffix}')
+        with open(path, 'wb') as handle:
+            for chunk in upload.chunks():
+                handle.write(chunk)
+        yield dataset_path(path)
+
+
+@lru_cache(maxsize=32)
+def get_transformer(crs):
+    """Transformer from a CRS to WGS84 lon/lat, or None when no reprojection is needed."""
+    source = CRS.from_user_input(crs)
+    if source.equals(CRS.from_epsg(4326), ignore_axis_order=True):
+        return None
+    return Transformer.from_crs(source, 'EPSG:4326', always_xy=True)
+
+
+def to_wgs84(shapes, crs):
+    """Reproject an array of geometries to WGS84 lon/lat (unchanged when crs is missing or WGS84)."""
+    transformer = get_transformer(crs) if crs else None
+    if transformer is None or not len(shapes):
+        return shapes
+    return shapely.transform(shapes, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+
+
+def read_feature_batches(path, layer=None, batch_size=BATCH_SIZE, columns=None):
+    """
+    Read the features of a dataset in batches.
+
+    The dataset is opened once and read front to back as an Arrow stream, so
+    drivers without random access (GeoJSON) are parsed a single time.
+
+    Args:
+        path: Dataset path (see dataset_path)
+        layer: Layer name or index for multi-layer datasets (default: first)
+        batch_size: Features per batch
+        columns: Attribute columns to read (default: all)
+
+    Yields:
+        FeatureBatch(fids, WGS84 shapes as object array (None for null geometries),
+        dict column -> value array)
+    """
+    with open_arrow(path, layer=layer, columns=columns, batch_size=batch_size, return_fids=True,
+                    use_pyarrow=True) as (meta, reader):
+        geometry_column = meta['geometry_name'] or 'wkb_geometry'
+        fid_column = meta['fid_column'] or 'OGC_FID'
+        for record_batch in reader:
+            if not record_batch.num_rows:
+                continue
+            values = {name: record_batch.column(name).to_numpy(zero_copy_only=False)
+                      for name in record_batch.schema.names}
+            fids = values.pop(fid_column)
+            shapes = to_wgs84(shapely.from_wkb(values.pop(geometry_column)), meta['crs'])
+            yield FeatureBatch(fids, shapes, values)
+
+
+def _python_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _model_field(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise ValueError(f"{model.__name__} has no field '{name}'.")
+    if not field.concrete or field.primary_key or field.name in GEOMETRY_FIELDS or field.many_to_many:
+        raise ValueError(f"Field '{name}' cannot be imported.")
+    return field
+
+
+def _clean_value(field, value):
+    value = _python_value(value)
+    if value is None:
+        return None
+    if isinstance(field, models.ForeignKey):
+        return field.target_field.to_python(value)
+    value = field.to_python(value)
+    if isinstance(value, str) and field.max_length:
+        value = value[:field.max_length]
+    return value
+
+
+def check_mapping(model, mapping, defaults, source_fields):
+    """
+    Validate an attribute mapping against a model and a dataset.
+
+    Args:
+        model: Site or ArchaeologicalEvidence
+        mapping: Dict model field -> source column
+        defaults: Dict model field -> constant value
+        source_fields: Column names of the dataset
+
+    Returns:
+        Dict model field -> (Field, attribute name set on the instance)
+
+    Raises:
+        ValueError: For unknown or reserved fields, missing source columns or
+            required fields left without a value
+    """
+    fields = {name: _model_field(model, name) for name in list(mapping) + list(defaults)}
+    missing_columns = sorted(set(mapping.values()) - set(source_fields))
+    if missing_columns:
+        raise ValueError(f"Source columns not found: {', '.join(missing_columns)}.")
+    required = [
+        field.name for field in model._meta.concrete_fields
+        if not field.null and not field.has_default() and not field.primary_key
+        and field.name not in GEOMETRY_FIELDS and field.name not in fields
+    ]
+    if required:
+        raise ValueError(f"Required fields need a mapping or a default: {', '.join(required)}.")
+    return {name: (field, field.attname) for name, field in fields.items()}
+
+
+def ingest_features(path, layer, mapping=None, defaults=None, source_layer=None, batch_size=BATCH_SIZE,
+                    dry_run=False):
+    """
+    Create a site or evidence row for every feature of a dataset.
+
+    Args:
+        path: Dataset path (see dataset_path)
+        layer: 'site' or 'evidence'
+        mapping: Dict model field -> source column
+        defaults: Dict model field -> value used for every row (mapped values take precedence
+            unless they are empty)
+        source_layer: Layer of a multi-layer dataset
+        batch_size: Features read and rows written per batch
+        dry_run: Read and validate without writing
+
+    Returns:
+        IngestResult(created, skipped_geometry, skipped_invalid)
+
+    Raises:
+        ValueError: For an invalid mapping (see check_mapping)
+    """
+    if layer not in POINT_LAYERS:
+        raise ValueError(f"layer must be one of {', '.join(POINT_LAYERS)}")
+    model = SPATIAL_LAYERS[layer][0]
+    mapping, defaults = dict(mapping or {}), dict(defaults or {})
+    info = pyogrio.read_info(path, layer=source_layer)
+    fields = check_mapping(model, mapping, defaults, list(info['fields']))
+    try:
+        constants = {fields[name][1]: _clean_value(fields[name][0], value) for name, value in defaults.items()}
+    except ValidationError as e:
+        raise ValueError(f"Invalid default value: {'; '.join(e.messages)}")
+
+    required = [attname for field, attname in fields.values() if not field.null and not field.has_default()]
+
+    created = skipped_geometry = skipped_invalid = 0
+    extent = None
+    columns = sorted(set(mapping.values()))
+    # One transaction: a failing batch leaves no partial import behind
+    with nullcontext() if dry_run else transaction.atomic():
+        for batch in read_feature_batches(path, layer=source_layer, batch_size=batch_size, columns=columns):
+            rows, shapes = [], []
+            drawable = ~shapely.is_missing(batch.shapes)
+            drawable[drawable] = ~shapely.is_empty(batch.shapes[drawable])
+            skipped_geometry += int((~drawable).sum())
+            for position in np.flatnonzero(drawable).tolist():
+                shape = batch.shapes[position]
+                values = dict(constants)
+                try:
+                    for name, column in mapping.items():
+                        value = _clean_value(fields[name][0], batch.attributes[column][position])
+                        if value is not None:
+                            values[fields[name][1]] = value
+                except ValidationError:
+                    skipped_invalid += 1
+                    continue
+                if any(values.get(attname) is None for attname in required):
+                    skipped_invalid += 1
+                    continue
+                rows.append(model(**values))
+                shapes.append(shape)
+            if not rows:
+                continue
+
+            sync_geometry_columns_many(rows, shapes)
+            for instance, text in zip(rows, format_geometries(shapes)):
+                instance.geometry = text
+                instance.lon = round(instance.centroid_x, 6)
+                instance.lat = round(instance.centroid_y, 6)
+
+            bounds = np.array([[row.bbox_minx, row.bbox_miny, row.bbox_maxx, row.bbox_maxy] for row in rows])
+            if extent is not None:
+                bounds = np.vstack([bounds, extent])
+            extent = (*bounds[:, :2].min(axis=0).tolist(), *bounds[:, 2:].max(axis=0).tolist())
+            if not dry_run:
+                model.objects.bulk_create(rows, batch_size=batch_size)
+            created += len(rows)
+
+    if created and not dry_run:
+        geometries_bulk_changed.send(sender=model, bbox=extent)
+    return IngestResult(created, skipped_geometry, skipped_invalid)
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from frontend.admin_units import backfill_admin_units
+from frontend.models import ArchaeologicalEvidence, Site
+
+ADMIN_UNIT_MODELS = (Site, ArchaeologicalEvidence)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the country, region, province and municipality of sites and "
+        "archaeological evidence from their position (the nearest municipality "
+        "centroid). By default only rows missing an admin code are touched, and "
+        "codes already set are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', dest='models', nargs='*', default=None,
+            choices=[model._meta.model_name for model in ADMIN_UNIT_MODELS],
+            help='Only backfill these models (default: all).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows written per batch.'
+        )
+        parser.add_argument(
+            '--overwrite', action='store_true',
+            help='Recompute every row with a position, replacing existing codes.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would change without writing.'
+        )
+
+    def handle(self, *args, **options):
+        selected = options.get('models')
+        batch_size = max(1, options['batch_size'])
+
+        for model in ADMIN_UNIT_MODELS:
+            if selected and model._meta.model_name not in selected:
+                continue
+            checked, written, unresolved = backfill_admin_units(
+                model, batch_size=batch_size, overwrite=options['overwrite'], dry_run=options['dry_run'],
+            )
+            verb = 'would update' if options['dry_run'] else 'updated'
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name}: checked {checked} rows, {verb} {written}, '
+                f'{unresolved} without a municipality nearby.'
+            ))
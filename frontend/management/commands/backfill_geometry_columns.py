@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from frontend.spatial import GEOMETRY_MODELS, backfill_geometry_columns
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the derived geometry columns (WKB, bbox, centroid, simplified levels) "
+        "of research, sites and archaeological evidence from their text geometry. "
+        "The columns are normally kept in sync on save; run this after migrating, "
+        "bulk imports or raw SQL changes that bypass the ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', dest='models', nargs='*', default=None,
+            choices=[model._meta.model_name for model in GEOMETRY_MODELS],
+            help='Only backfill these models (default: all).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows written per batch.'
+        )
+        parser.add_argument(
+            '--missing-only', action='store_true',
+            help='Skip rows that already have a bounding box.'
+        )
+
+    def handle(self, *args, **options):
+        selected = options.get('models')
+        batch_size = max(1, options['batch_size'])
+
+        for model in GEOMETRY_MODELS:
+            if selected and model._meta.model_name not in selected:
+                continue
+            written = backfill_geometry_columns(model, batch_size=batch_size, only_missing=options['missing_only'])
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.verbose_name}: updated {written} rows.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from frontend.spatial import SPATIAL_LAYERS
+from frontend.tiles import clear_tile_cache, prune_tile_objects
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete cached vector tiles. Tiles are invalidated per feature on save; "
+        "run this after backfill_geometry_columns, bulk imports or raw SQL "
+        "changes that bypass the ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--layer', choices=list(SPATIAL_LAYERS), default=None,
+            help='Only clear this layer (default: all).'
+        )
+        parser.add_argument(
+            '--prune-only', action='store_true',
+            help='Keep the tiles; only delete stored objects no tile refers to.'
+        )
+
+    def handle(self, *args, **options):
+        if options['prune_only']:
+            removed = prune_tile_objects()
+            self.stdout.write(self.style.SUCCESS(f'Removed {removed} unreferenced tile objects.'))
+            return
+        clear_tile_cache(options['layer'])
+        self.stdout.write(self.style.SUCCESS(f"Cleared tiles of {options['layer'] or 'all layers'}."))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from frontend.export import (
+    BATCH_SIZE, EXPORT_FORMATS, csv_chunks, geojson_chunks, parse_export_filters, write_geopackage,
+)
+from frontend.spatial import SPATIAL_LAYERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Export sites, evidence or research areas as GeoJSON, GeoPackage or CSV, "
+        "streaming rows in batches. Accepts the research catalog filters; the format "
+        "follows the output file extension unless --format is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('layer', choices=list(SPATIAL_LAYERS), help='Layer to export.')
+        parser.add_argument('output', help='Output file (.geojson, .gpkg, .csv); "-" writes GeoJSON or CSV to stdout.')
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS),
+                            help='Output format (default: from the output extension).')
+        parser.add_argument('--q', help='Full-text research search, as in the catalog.')
+        parser.add_argument('--lang', help="Search dictionary ('it' or 'en').")
+        parser.add_argument('--region', help='Region id(s), comma-separated.')
+        parser.add_argument('--chronology', help='Chronology id(s), comma-separated.')
+        parser.add_argument('--research', help='Research id(s), comma-separated.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows read per batch.')
+
+    def handle(self, *args, **options):
+        layer, output = options['layer'], options['output']
+        export_format = options['export_format'] or output.rsplit('.', 1)[-1].lower()
+        if export_format not in EXPORT_FORMATS:
+            raise CommandError(f"Cannot tell the format of {output}; use --format {{{','.join(EXPORT_FORMATS)}}}")
+        if export_format == 'gpkg' and output == '-':
+            raise CommandError('A GeoPackage cannot be written to stdout')
+        try:
+            filters = parse_export_filters(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+        batch_size = max(1, options['batch_size'])
+
+        started = time.monotonic()
+        if export_format == 'gpkg':
+            written = write_geopackage(layer, output, filters, batch_size)
+            self.stdout.write(self.style.SUCCESS(
+                f'{layer}: wrote {written} features to {output} in {time.monotonic() - started:.1f}s'
+            ))
+            return
+
+        chunks = (geojson_chunks if export_format == 'geojson' else csv_chunks)(layer, filters, batch_size)
+        if output == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(output, 'w', encoding='utf-8', newline='') as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'{layer}: wrote {output} in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,77 @@
+import time
+
+import pyogrio
+from pyogrio.errors import DataLayerError, DataSourceError
+from django.core.management.base import BaseCommand, CommandError
+
+from frontend.ingest import BATCH_SIZE, dataset_path, ingest_features
+from frontend.spatial import POINT_LAYERS
+
+
+def _pairs(values, option):
+    pairs = {}
+    for value in values or []:
+        name, separator, target = value.partition('=')
+        if not separator or not name.strip():
+            raise CommandError(f'{option} expects field=value, got "{value}"')
+        pairs[name.strip()] = target.strip()
+    return pairs
+
+
+class Command(BaseCommand):
+    help = (
+        "Import every feature of a zipped shapefile, GeoPackage or GeoJSON file as "
+        "sites or archaeological evidence. Geometries are reprojected to WGS84 and "
+        "stored whole; attributes are copied with --map, constant values set with --set. "
+        "Use --describe to list the source columns first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Dataset (.zip, .shp, .gpkg, .geojson).')
+        parser.add_argument('--layer', choices=POINT_LAYERS, help='Create sites or evidence.')
+        parser.add_argument(
+            '--map', dest='mapping', action='append', metavar='FIELD=COLUMN',
+            help='Copy a source column to a model field (repeatable), e.g. --map site_name=NOME.'
+        )
+        parser.add_argument(
+            '--set', dest='defaults', action='append', metavar='FIELD=VALUE',
+            help='Constant value for a model field (repeatable), e.g. --set id_positioning_mode=1.'
+        )
+        parser.add_argument('--source-layer', help='Layer of a multi-layer dataset (default: first).')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Features read and rows written per batch.'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Read and validate without writing.')
+        parser.add_argument('--describe', action='store_true', help='Print the source layer and columns, then exit.')
+
+    def handle(self, *args, **options):
+        try:
+            path = dataset_path(options['path'])
+            if options['describe']:
+                info = pyogrio.read_info(path, layer=options['source_layer'])
+                self.stdout.write(f"Layer {info['layer_name']}: {info['features']} {info['geometry_type']} "
+                                  f"features, CRS {info['crs']}")
+                for name, dtype in zip(info['fields'], info['dtypes']):
+                    self.stdout.write(f'  {name} ({dtype})')
+                return
+            if not options['layer']:
+                raise CommandError('--layer is required')
+
+            started = time.monotonic()
+            result = ingest_features(
+                path, options['layer'],
+                mapping=_pairs(options['mapping'], '--map'),
+                defaults=_pairs(options['defaults'], '--set'),
+                source_layer=options['source_layer'],
+                batch_size=max(1, options['batch_size']),
+                dry_run=options['dry_run'],
+            )
+        except (ValueError, DataSourceError, DataLayerError) as e:
+            raise CommandError(str(e))
+
+        verb = 'would create' if options['dry_run'] else 'created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['layer']}: {verb} {result.created} rows in {time.monotonic() - started:.1f}s; "
+            f"skipped {result.skipped_geometry} without geometry, {result.skipped_invalid} with invalid values."
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from frontend.catalog import refresh_catalog_entries
+from frontend.models import Research
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the materialized research catalog (research_catalog_entry). "
+        "Entries are normally kept in sync by signals; run this after bulk imports "
+        "or raw SQL changes that bypass them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--research', dest='research_ids', type=int, nargs='*', default=None,
+            help='Only rebuild these research ids (default: all).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Number of researches rebuilt per batch.'
+        )
+
+    def handle(self, *args, **options):
+        research_ids = options.get('research_ids')
+        if not research_ids:
+            research_ids = list(Research.objects.order_by('id').values_list('id', flat=True))
+        batch_size = max(1, options['batch_size'])
+
+        written = 0
+        for start in range(0, len(research_ids), batch_size):
+            written += len(refresh_catalog_entries(research_ids[start:start + batch_size]))
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} catalog entries.'))
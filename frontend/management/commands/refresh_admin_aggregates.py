@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from frontend.admin_aggregates import rebuild_admin_aggregates
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the site and evidence counts per region, province and municipality, "
+        "broken down by chronology and typology, from the fact tables. Normally the "
+        "counts are kept up to date by model signals; run this after raw SQL imports "
+        "or to fill the table for the first time."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = rebuild_admin_aggregates()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} aggregate rows in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from frontend.spatial import POINT_LAYERS
+from frontend.spatial_join import create_research_links, suggest_research_links
+
+
+class Command(BaseCommand):
+    help = (
+        "Find sites and archaeological evidence lying inside research areas and "
+        "report the SiteResearch / ArchEvResearch links that are missing. "
+        "Uses the derived geometry columns; run backfill_geometry_columns first "
+        "on a fresh database. With --create the links are stored."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--layer', dest='layers', nargs='*', choices=POINT_LAYERS, default=None,
+            help='Only join these layers (default: site and evidence).'
+        )
+        parser.add_argument(
+            '--research', dest='research_ids', nargs='*', type=int, default=None,
+            help='Only consider these research ids (default: all).'
+        )
+        parser.add_argument(
+            '--list', action='store_true',
+            help='Print every suggested link as "layer,point_id,research_id".'
+        )
+        parser.add_argument(
+            '--create', action='store_true',
+            help='Store the suggested links.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        suggestions = suggest_research_links(
+            layers=options['layers'] or POINT_LAYERS,
+            research_ids=options['research_ids'],
+        )
+        elapsed = time.monotonic() - started
+
+        for suggestion in suggestions:
+            if options['list']:
+                for point_id, research_id in zip(suggestion.point_ids.tolist(), suggestion.research_ids.tolist()):
+                    self.stdout.write(f'{suggestion.layer},{point_id},{research_id}')
+            self.stdout.write(
+                f'{suggestion.layer}: {len(suggestion.point_ids)} missing links '
+                f'in {len(set(suggestion.research_ids.tolist()))} researches.'
+            )
+        self.stdout.write(f'Spatial join took {elapsed:.2f}s.')
+
+        if options['create']:
+            written = create_research_links(suggestions)
+            for layer, count in written.items():
+                self.stdout.write(self.style.SUCCESS(f'{layer}: created {count} links.'))
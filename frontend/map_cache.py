@@ -0,0 +1,280 @@
+"""
+Map render cache.
+The map of a research area, site or evidence is a quantized GeoJSON Feature
+(see spatial.quantize_shape) of the pyramid level matching the zoom that
+fits the feature, drawn in the browser by the shared Leaflet
+renderer (static/frontend/map_loader.js); nothing is rendered with Folium in
+the request path. Documents are built once per (row, geometry, title) and reused.
+Entries live in the Django cache with a disk tier behind it (MAP_CACHE_DIR,
+LRU-evicted to MAP_CACHE_DISK_MAX_BYTES), so a restarted worker or a cold
+cache still avoids re-serializing; each worker runs the eviction scan after
+writing about 1/EVICTION_SLACK of that budget rather than on every miss. Saving or deleting a row drops the entry
+it last rendered; hit/miss counters are kept in the Django cache and reported
+by the health check.
+
+Detail pages do not embed the map: they load /maps/<kind>/<pk>.geojson (or
+the standalone .html page) on demand. Those URLs carry a version derived from
+the geometry hash, so responses get a strong ETag and can be cached for a year.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .models import Research, Site, ArchaeologicalEvidence
+from .spatial import LAYER_BY_MODEL, SPATIAL_LAYERS, display_zoom, load_shape, quantized_feature
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'map_render'
+DEFAULT_TIMEOUT = 60 * 60 * 24
+DEFAULT_DISK_MAX_BYTES = 256 * 1024 * 1024
+# Each worker scans the disk tier after writing max_bytes / EVICTION_SLACK bytes
+EVICTION_SLACK = 16
+STAT_NAMES = ('memory_hits', 'disk_hits', 'misses')
+# Bump when the document format changes so old entries are not served
+FORMAT_VERSION = 3
+
+MAP_TITLES = {'research': 'Research Area', 'site': 'Site Location', 'evidence': 'Evidence Location'}
+MAP_FORMATS = ('html', 'geojson')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def geometry_digest(instance):
+    """Hash of a row's geometry; the stored WKB is used when available so nothing is parsed."""
+    data = instance.geometry_wkb
+    if data:
+        return hashlib.sha256(bytes(data)).hexdigest()
+    return hashlib.sha256(str(instance.geometry or '').encode()).hexdigest()
+
+
+def map_cache_key(instance, title):
+    """Cache key for a map document: sha256 of (layer, pk, geometry hash, title, format version)."""
+    layer = LAYER_BY_MODEL[type(instance)]
+    payload = json.dumps([layer, instance.pk, geometry_digest(instance), title, FORMAT_VERSION])
+    return f'{KEY_PREFIX}:{hashlib.sha256(payload.encode()).hexdigest()}'
+
+
+def _owner_key(instance):
+    return f'{KEY_PREFIX}:owner:{instance._meta.label_lower}:{instance.pk}'
+
+
+# Counters
+def _count(name):
+    key = f'{KEY_PREFIX}:stats:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_map_cache_stats():
+    """Return hit/miss counters (shared by all workers using the same cache backend)."""
+    values = cache.get_many([f'{KEY_PREFIX}:stats:{name}' for name in STAT_NAMES])
+    stats = {name: values.get(f'{KEY_PREFIX}:stats:{name}', 0) for name in STAT_NAMES}
+    lookups = sum(stats.values())
+    stats['hit_ratio'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else None
+    return stats
+
+
+def reset_map_cache_stats():
+    cache.delete_many([f'{KEY_PREFIX}:stats:{name}' for name in STAT_NAMES])
+
+
+# Disk tier
+def _disk_path(key):
+    directory = _setting('MAP_CACHE_DIR', None)
+    if not directory:
+        return None
+    return os.path.join(directory, key.rsplit(':', 1)[-1] + '.geojson')
+
+
+def _read_disk(key):
+    path = _disk_path(key)
+    if not path:
+        return None
+    try:
+        with open(path, encoding='utf-8') as handle:
+            document = handle.read()
+        os.utime(path)  # mtime doubles as last access for LRU eviction
+        return document
+    except OSError:
+        return None
+
+
+_eviction_lock = threading.Lock()
+# Bytes this process wrote since its last eviction scan; None until the first scan
+_written_since_eviction = None
+
+
+def _note_disk_write(size):
+    """Account for a written file and tell whether the disk tier is due for an eviction scan."""
+    global _written_since_eviction
+    max_bytes = _setting('MAP_CACHE_DISK_MAX_BYTES', DEFAULT_DISK_MAX_BYTES)
+    with _eviction_lock:
+        if _written_since_eviction is not None:
+            _written_since_eviction += size
+            if _written_since_eviction < max_bytes // EVICTION_SLACK:
+                return False
+        _written_since_eviction = 0
+        return True
+
+
+def _write_disk(key, document):
+    path = _disk_path(key)
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False) as handle:
+            handle.write(document)
+        os.replace(handle.name, path)
+        if _note_disk_write(len(document)):
+            evict_disk_cache()
+    except OSError as e:
+        logger.warning(f"Could not write map cache file {path}: {e}")
+
+
+def _delete_disk(key):
+    path = _disk_path(key)
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def evict_disk_cache(max_bytes=None):
+    """
+    Delete the least recently used files until the disk tier fits in max_bytes.
+
+    Returns:
+        Number of files removed
+    """
+    directory = _setting('MAP_CACHE_DIR', None)
+    if not directory or not os.path.isdir(directory):
+        return 0
+    if max_bytes is None:
+        max_bytes = _setting('MAP_CACHE_DISK_MAX_BYTES', DEFAULT_DISK_MAX_BYTES)
+
+    entries = []
+    total = 0
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            if entry.is_file() and entry.name.endswith('.geojson'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def map_title(instance):
+    """Popup title of a row's map: its name, or a default per layer."""
+    layer = LAYER_BY_MODEL[type(instance)]
+    return getattr(instance, SPATIAL_LAYERS[layer][1]) or MAP_TITLES[layer]
+
+
+def render_map(instance, title=None):
+    """
+    Return the map document (quantized GeoJSON Feature) of a Research, Site or
+    ArchaeologicalEvidence.
+
+    Looks in the Django cache, then the disk tier, and serializes only on a miss.
+
+    Args:
+        instance: Row with geometry / geometry_wkb
+        title: Popup title (defaults to map_title(instance))
+
+    Returns:
+        GeoJSON string, or None if the geometry cannot be drawn
+    """
+    if title is None:
+        title = map_title(instance)
+    key = map_cache_key(instance, title)
+    timeout = _setting('MAP_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    document = cache.get(key)
+    if document is not None:
+        _count('memory_hits')
+        return document
+
+    document = _read_disk(key)
+    if document is not None:
+        _count('disk_hits')
+        # The owner key is written with the document, so hits cost no writes
+        cache.set_many({key: document, _owner_key(instance): key}, timeout)
+        return document
+
+    _count('misses')
+    shape = load_shape(instance, zoom=display_zoom(instance))
+    if shape is None:
+        return None
+    document = quantized_feature(LAYER_BY_MODEL[type(instance)], instance.pk, title, shape)
+    cache.set_many({key: document, _owner_key(instance): key}, timeout)
+    _write_disk(key, document)
+    return document
+
+
+def map_version(instance):
+    """
+    Content version of a row's map, used as strong ETag and as ?v= in its URLs.
+
+    Returns:
+        Hex digest of the row that changes whenever the geometry or the title changes
+    """
+    return map_cache_key(instance, map_title(instance)).rsplit(':', 1)[-1]
+
+
+def map_url(instance, map_format='geojson'):
+    """Versioned URL of a row's map fragment, or None when the row has no geometry."""
+    if not instance.geometry and not instance.geometry_wkb:
+        return None
+    layer = LAYER_BY_MODEL[type(instance)]
+    path = reverse('map-fragment', kwargs={'kind': layer, 'pk': instance.pk, 'map_format': map_format})
+    return f'{path}?v={map_version(instance)[:16]}'
+
+
+def invalidate_map(instance):
+    """Drop the map last rendered for a row from both tiers."""
+    owner_key = _owner_key(instance)
+    key = cache.get(owner_key)
+    if key:
+        cache.delete_many([key, owner_key])
+        _delete_disk(key)
+
+
+@receiver(post_save, sender=Research)
+@receiver(post_save, sender=Site)
+@receiver(post_save, sender=ArchaeologicalEvidence)
+@receiver(post_delete, sender=Research)
+@receiver(post_delete, sender=Site)
+@receiver(post_delete, sender=ArchaeologicalEvidence)
+def invalidate_map_on_change(sender, instance, **kwargs):
+    invalidate_map(instance)
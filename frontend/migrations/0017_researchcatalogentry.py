@@ -0,0 +1,23 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0016_siteinvestigation_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResearchCatalogEntry',
+            fields=[
+                ('id_research', models.OneToOneField(db_column='id_research', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='frontend.research')),
+                ('tree', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'research_catalog_entry',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Create the GIN index and fill the vectors (PostgreSQL only)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS research_search_vector_gin ON research USING gin (search_vector);"
+    )
+    schema_editor.execute("""
+        UPDATE research SET search_vector =
+            setweight(to_tsvector('italian', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('italian', coalesce(keywords, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(keywords, '')), 'B') ||
+            setweight(to_tsvector('italian', coalesce(abstract, '')), 'C') ||
+            setweight(to_tsvector('english', coalesce(abstract, '')), 'C');
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS research_search_vector_gin;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0017_researchcatalogentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='research',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,24 @@
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0018_research_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='research',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('year', models.Value('')).desc(), models.F('id').desc(), name='research_year_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='research',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('title', models.Value('')), models.F('id'), name='research_title_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='research',
+            index=models.Index(models.F('submitted_by'), django.db.models.functions.comparison.Coalesce('year', models.Value('')).desc(), models.F('id').desc(), name='research_user_year_keyset_idx'),
+        ),
+    ]
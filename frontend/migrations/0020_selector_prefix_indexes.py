@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# istartswith compiles to UPPER(column) LIKE UPPER(%s) on PostgreSQL; the
+# pattern_ops opclass lets the prefix LIKE use a btree under any collation.
+PREFIX_INDEXES = (
+    ('site_name_prefix_idx', 'site', 'site_name'),
+    ('evidence_name_prefix_idx', 'archaeological_evidence', 'evidence_name'),
+)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    """Indexes for the q= prefix filter of the selector list APIs (PostgreSQL only)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in PREFIX_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} (UPPER({column}) text_pattern_ops);"
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in PREFIX_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name};")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0019_research_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
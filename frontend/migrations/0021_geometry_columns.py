@@ -0,0 +1,131 @@
+# Derived geometry columns; fill existing rows with
+# `python manage.py backfill_geometry_columns`.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0020_selector_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='research',
+            name='geometry_wkb',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='research',
+            name='bbox_minx',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='research',
+            name='bbox_miny',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='research',
+            name='bbox_maxx',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='research',
+            name='bbox_maxy',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='research',
+            name='centroid_x',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='research',
+            name='centroid_y',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='geometry_wkb',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='bbox_minx',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='bbox_miny',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='bbox_maxx',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='bbox_maxy',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='centroid_x',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='centroid_y',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='geometry_wkb',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='bbox_minx',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='bbox_miny',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='bbox_maxx',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='bbox_maxy',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='centroid_x',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='centroid_y',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='research',
+            index=models.Index(fields=['bbox_minx', 'bbox_maxx', 'bbox_miny', 'bbox_maxy'], name='research_bbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='site',
+            index=models.Index(fields=['bbox_minx', 'bbox_maxx', 'bbox_miny', 'bbox_maxy'], name='site_bbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archaeologicalevidence',
+            index=models.Index(fields=['bbox_minx', 'bbox_maxx', 'bbox_miny', 'bbox_maxy'], name='evidence_bbox_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Simplified geometry per zoom level; fill existing rows with
+# `python manage.py backfill_geometry_columns`.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0021_geometry_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='research',
+            name='geometry_wkb_z5',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='research',
+            name='geometry_wkb_z9',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='research',
+            name='geometry_wkb_z13',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='geometry_wkb_z5',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='geometry_wkb_z9',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='geometry_wkb_z13',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='geometry_wkb_z5',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='geometry_wkb_z9',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archaeologicalevidence',
+            name='geometry_wkb_z13',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
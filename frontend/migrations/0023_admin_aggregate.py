@@ -0,0 +1,35 @@
+# Site / evidence counts per admin unit, chronology and typology; fill with
+# `python manage.py refresh_admin_aggregates`.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0022_geometry_pyramid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layer', models.CharField(max_length=16)),
+                ('level', models.CharField(max_length=16)),
+                ('unit_id', models.IntegerField()),
+                ('chronology_id', models.IntegerField()),
+                ('typology_id', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'admin_aggregate',
+                'constraints': [
+                    models.UniqueConstraint(
+                        fields=('level', 'unit_id', 'layer', 'chronology_id', 'typology_id'),
+                        name='admin_aggregate_key',
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -7,6 +7,9 @@
 # Feel free to rename the models, but don't rename db_table values or field names.
 import uuid
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
 
 
@@ -155,7 +158,29 @@ class FirstDiscoveryMethod(models.Model):
         return self.desc_first_discovery_method
 
 
-class Site(models.Model):
+class GeometryColumns(models.Model):
+    """
+    Derived copies of the text geometry column, maintained by frontend/spatial.py:
+    WKB for readers that need the shape, bbox and centroid for range queries,
+    and simplified WKB per zoom level for overview maps (null when simplifying
+    would not drop any vertex).
+    """
+    geometry_wkb = models.BinaryField(blank=True, null=True, editable=False)
+    geometry_wkb_z5 = models.BinaryField(blank=True, null=True, editable=False)
+    geometry_wkb_z9 = models.BinaryField(blank=True, null=True, editable=False)
+    geometry_wkb_z13 = models.BinaryField(blank=True, null=True, editable=False)
+    bbox_minx = models.FloatField(blank=True, null=True, editable=False)
+    bbox_miny = models.FloatField(blank=True, null=True, editable=False)
+    bbox_maxx = models.FloatField(blank=True, null=True, editable=False)
+    bbox_maxy = models.FloatField(blank=True, null=True, editable=False)
+    centroid_x = models.FloatField(blank=True, null=True, editable=False)
+    centroid_y = models.FloatField(blank=True, null=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+
+class Site(GeometryColumns):
     site_name = models.CharField(max_length=255)
     site_environment_relationship = models.TextField(blank=True, null=True)
     additional_topography = models.TextField(blank=True, null=True)
@@ -183,6 +208,9 @@ class Site(models.Model):
 
     class Meta:
         db_table = 'site'
+        indexes = [
+            models.Index(fields=['bbox_minx', 'bbox_maxx', 'bbox_miny', 'bbox_maxy'], name='site_bbox_idx'),
+        ]
 
     def __str__(self):
         return f'{self.site_name} - {self.site_environment_relationship} - {self.additional_topography} - {self.elevation} - {self.id_country} - {self.id_region} - {self.id_province} - {self.id_municipality} - {self.id_physiography} - {self.id_base_map} - {self.id_positioning_mode} - {self.id_positional_accuracy} - {self.id_first_discovery_method} - {self.locality_name} - {self.lat} - {self.lon}'
@@ -279,7 +307,7 @@ class SiteInvestigation(models.Model):
         return f'{self.id_site} - {self.id_investigation}'
 
 
-class ArchaeologicalEvidence(models.Model):
+class ArchaeologicalEvidence(GeometryColumns):
     id = models.AutoField(primary_key=True)
     id_archaeological_evidence_typology = models.ForeignKey('ArchaeologicalEvidenceTypology', models.DO_NOTHING,
                                                             blank=True, null=True,
@@ -312,6 +340,9 @@ class ArchaeologicalEvidence(models.Model):
 
     class Meta:
         db_table = 'archaeological_evidence'
+        indexes = [
+            models.Index(fields=['bbox_minx', 'bbox_maxx', 'bbox_miny', 'bbox_maxy'], name='evidence_bbox_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id}'
@@ -447,7 +478,7 @@ class InterpretationBibliography(models.Model):
         return f'{self.id_interpretation} - {self.id_bibliography}'
 
 
-class Research(models.Model):
+class Research(GeometryColumns):
     title = models.CharField(blank=True, null=True)
     year = models.CharField(blank=True, null=True, max_length=4)
     keywords = models.CharField(blank=True, null=True)
@@ -456,9 +487,19 @@ class Research(models.Model):
     submitted_by = models.ForeignKey(User, blank=True, null=True, on_delete=models.DO_NOTHING, db_column='submitted_by')
     geometry = models.CharField()
     id = models.AutoField(primary_key=True, editable=False)
+    # Weighted title/keywords/abstract lexemes, maintained by frontend/search.py
+    search_vector = SearchVectorField(blank=True, null=True, editable=False)
 
     class Meta:
         db_table = 'research'
+        # Keyset pagination orderings (see frontend/pagination.py)
+        indexes = [
+            models.Index(Coalesce('year', Value('')).desc(), F('id').desc(), name='research_year_keyset_idx'),
+            models.Index(Coalesce('title', Value('')), F('id'), name='research_title_keyset_idx'),
+            models.Index(F('submitted_by'), Coalesce('year', Value('')).desc(), F('id').desc(),
+                         name='research_user_year_keyset_idx'),
+            models.Index(fields=['bbox_minx', 'bbox_maxx', 'bbox_miny', 'bbox_maxy'], name='research_bbox_idx'),
+        ]
 
     def __str__(self):
         return f'{self.title} - {self.year} - {self.keywords} - {self.abstract} - {self.type} - {self.geometry}'
@@ -608,3 +649,51 @@ class TypologyDetail(models.Model):
 
     def __str__(self):
         return self.desc_typology_detail
+
+
+class ResearchCatalogEntry(models.Model):
+    """
+    Denormalized research → site → evidence tree shown on the public catalog.
+    Holds only display fields and is kept up to date by the signal handlers in
+    frontend/catalog.py, so a catalog page reads one row per research.
+    """
+    id_research = models.OneToOneField(Research, on_delete=models.CASCADE, primary_key=True,
+                                       db_column='id_research', related_name='catalog_entry')
+    tree = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'research_catalog_entry'
+
+    def __str__(self):
+        return f'Catalog entry for research {self.id_research_id}'
+
+
+class AdminAggregate(models.Model):
+    """
+    Number of sites or evidence per administrative unit, chronology and typology.
+    Rows for every combination present in the data plus rollups over all
+    chronologies and/or all typologies (ANY), kept up to date by the signal
+    handlers in frontend/admin_aggregates.py, so dashboards read one row per unit
+    instead of scanning the fact tables.
+    """
+    ANY = -1  # rollup over every chronology / typology
+    NOT_RECORDED = -2  # no chronology / typology recorded
+
+    layer = models.CharField(max_length=16)
+    level = models.CharField(max_length=16)
+    unit_id = models.IntegerField()
+    chronology_id = models.IntegerField()
+    typology_id = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'admin_aggregate'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['level', 'unit_id', 'layer', 'chronology_id', 'typology_id'], name='admin_aggregate_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.layer} {self.level} {self.unit_id} ({self.chronology_id}, {self.typology_id}): {self.count}'
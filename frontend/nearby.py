@@ -0,0 +1,225 @@
+"""
+Nearest sites and evidence to a coordinate, for duplicate checks while editing.
+Positions (the stored centroids, or lat/lon when a row has no geometry) are
+held as unit vectors in a KD-tree (frontend/utils/kdtree.py), so neighbours
+are found by great-circle distance.
+
+The index lives in each worker and is updated in place when a site or
+evidence row is saved or deleted: the old slot is masked out and the new
+position goes to a small pending block scanned by brute force, which is
+folded into the tree once it grows past REBUILD_PENDING. A version key in the
+Django cache tells the other workers to rebuild theirs.
+"""
+
+import threading
+
+import numpy as np
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Site, ArchaeologicalEvidence
+from .spatial import (
+    COORDINATE_DECIMALS, POINT_LAYERS, LAYER_BY_MODEL, SPATIAL_LAYERS, geometries_bulk_changed, load_layer_points,
+    point_position,
+)
+from .utils.kdtree import KDTree, arc_length, chord_length, unit_vectors
+from .utils.versioned_index import SharedIndex
+
+NEARBY_DEFAULT_K = 10
+NEARBY_MAX_K = 100
+REBUILD_PENDING = 2048
+NEARBY_VERSION_KEY = 'nearby_index_version'
+
+
+class NearbyIndex:
+    """Positions of all POINT_LAYERS; slots below self.indexed are in the tree, the rest are pending."""
+
+    def __init__(self, layers, ids, names, lon, lat, version=None):
+        self.version = version
+        self._load(layers, ids, names, lon, lat)
+
+    @classmethod
+    def build(cls, version=None):
+        layers, ids, names, lon, lat = [], [], [], [], []
+        for layer in POINT_LAYERS:
+            layer_ids, layer_names, layer_lon, layer_lat = load_layer_points(layer)
+            layers.extend([layer] * len(layer_ids))
+            ids.extend(layer_ids)
+            names.extend(layer_names)
+            lon.append(layer_lon)
+            lat.append(layer_lat)
+        return cls(layers, ids, names, np.concatenate(lon), np.concatenate(lat), version=version)
+
+    def _load(self, layers, ids, names, lon, lat):
+        self.layers = list(layers)
+        self.codes = np.array([POINT_LAYERS.index(layer) for layer in self.layers], dtype=np.int8)
+        self.ids = list(ids)
+        self.names = list(names)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.vectors = unit_vectors(self.lon, self.lat)
+        self.live = np.ones(len(self.ids), dtype=bool)
+        self.slots = {(layer, pk): slot for slot, (layer, pk) in enumerate(zip(self.layers, self.ids))}
+        self.tree = KDTree(self.vectors)
+        self.indexed = len(self.ids)
+
+    def _compact(self):
+        """Rebuild the tree from the live slots."""
+        live = np.flatnonzero(self.live)
+        self._load(
+            [self.layers[slot] for slot in live], [self.ids[slot] for slot in live],
+            [self.names[slot] for slot in live], self.lon[live], self.lat[live],
+        )
+
+    def remove(self, layer, pk):
+        slot = self.slots.pop((layer, pk), None)
+        if slot is not None:
+            self.live[slot] = False
+
+    def upsert(self, layer, pk, name, lon, lat):
+        """Move, rename or add a point (or remove it when it has no position)."""
+        self.remove(layer, pk)
+        if lon is None or lat is None:
+            return
+        self.slots[(layer, pk)] = len(self.ids)
+        self.layers.append(layer)
+        self.codes = np.append(self.codes, np.int8(POINT_LAYERS.index(layer)))
+        self.ids.append(pk)
+        self.names.append(name or '')
+        self.lon = np.append(self.lon, lon)
+        self.lat = np.append(self.lat, lat)
+        self.vectors = np.vstack([self.vectors, unit_vectors([lon], [lat])])
+        self.live = np.append(self.live, True)
+        if len(self.ids) - self.indexed > REBUILD_PENDING:
+            self._compact()
+
+    def query(self, lon, lat, k=NEARBY_DEFAULT_K, radius_m=None, layers=POINT_LAYERS):
+        """
+        The k rows nearest to lon/lat.
+
+        Args:
+            lon, lat: Query position in degrees
+            k: Maximum number of results
+            radius_m: Ignore rows farther than this many meters
+            layers: Point layers to search
+
+        Returns:
+            List of (distance in meters, slot), nearest first
+        """
+        point = unit_vectors([lon], [lat])[0]
+        max_distance = np.inf if radius_m is None else float(chord_length(radius_m))
+        skip = ~self.live
+        if set(layers) != set(POINT_LAYERS):
+            skip = skip | ~np.isin(self.codes, [POINT_LAYERS.index(layer) for layer in layers])
+
+        distances, slots = self.tree.query(point, k, max_distance, skip=skip[:self.indexed])
+        pending = np.arange(self.indexed, len(self.ids))[~skip[self.indexed:]]
+        if len(pending):
+            offsets = self.vectors[pending] - point
+            pending_distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+            near = pending_distances <= max_distance
+            distances = np.concatenate([distances, pending_distances[near]])
+            slots = np.concatenate([slots, pending[near]])
+            ranking = np.argsort(distances, kind='stable')[:k]
+            distances, slots = distances[ranking], slots[ranking]
+        return list(zip(arc_length(distances).tolist(), slots.tolist()))
+
+    def result(self, distance, slot):
+        return {
+            'layer': self.layers[slot],
+            'id': self.ids[slot],
+            'name': self.names[slot],
+            'lat': round(float(self.lat[slot]), COORDINATE_DECIMALS),
+            'lon': round(float(self.lon[slot]), COORDINATE_DECIMALS),
+            'distance_m': round(distance, 1),
+        }
+
+
+_nearby_lock = threading.RLock()
+_nearby_index = SharedIndex(NEARBY_VERSION_KEY, NearbyIndex.build, _nearby_lock)
+
+
+def get_nearby_index():
+    """Return this worker's nearby index, rebuilding it when the shared version changed."""
+    return _nearby_index.get()
+
+
+def reset_nearby_index():
+    _nearby_index.reset()
+
+
+def parse_nearby_query(params):
+    """
+    Parse lat, lon and the optional k, radius_m and layers parameters.
+
+    Returns:
+        Dict with lon, lat, k, radius_m and layers
+
+    Raises:
+        ValueError: If a parameter is missing or out of range
+    """
+    try:
+        lat, lon = float(params.get('lat')), float(params.get('lon'))
+    except (TypeError, ValueError):
+        raise ValueError('lat and lon are required numbers')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat must be between -90 and 90, lon between -180 and 180')
+
+    try:
+        k = int(params.get('k') or NEARBY_DEFAULT_K)
+    except ValueError:
+        k = 0
+    if not 1 <= k <= NEARBY_MAX_K:
+        raise ValueError(f'k must be an integer between 1 and {NEARBY_MAX_K}')
+
+    radius_m = None
+    if params.get('radius_m'):
+        try:
+            radius_m = float(params['radius_m'])
+        except ValueError:
+            radius_m = -1.0
+        if not radius_m > 0:
+            raise ValueError('radius_m must be a positive number')
+
+    layers = POINT_LAYERS
+    if params.get('layers'):
+        layers = tuple(dict.fromkeys(layer.strip() for layer in params['layers'].split(',') if layer.strip()))
+        unknown = [layer for layer in layers if layer not in POINT_LAYERS]
+        if unknown or not layers:
+            raise ValueError(f"layers must be a subset of {','.join(POINT_LAYERS)}")
+    return {'lon': lon, 'lat': lat, 'k': k, 'radius_m': radius_m, 'layers': layers}
+
+
+def find_nearby(lon, lat, k=NEARBY_DEFAULT_K, radius_m=None, layers=POINT_LAYERS):
+    """
+    Sites and evidence nearest to a position.
+
+    Returns:
+        List of dicts (layer, id, name, lat, lon, distance_m), nearest first
+    """
+    with _nearby_lock:
+        index = get_nearby_index()
+        return [index.result(distance, slot) for distance, slot in index.query(lon, lat, k, radius_m, layers)]
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_save, sender=ArchaeologicalEvidence)
+def update_nearby_point(sender, instance, **kwargs):
+    layer = LAYER_BY_MODEL[sender]
+    name = getattr(instance, SPATIAL_LAYERS[layer][1])
+    lon, lat = point_position(instance)
+    _nearby_index.update(lambda index: index.upsert(layer, instance.pk, name, lon, lat))
+
+
+@receiver(post_delete, sender=Site)
+@receiver(post_delete, sender=ArchaeologicalEvidence)
+def remove_nearby_point(sender, instance, **kwargs):
+    layer = LAYER_BY_MODEL[sender]
+    _nearby_index.update(lambda index: index.remove(layer, instance.pk))
+
+
+@receiver(geometries_bulk_changed)
+def rebuild_nearby_index(sender, **kwargs):
+    """Bulk writes are not applied in place: every worker rebuilds on next use."""
+    if LAYER_BY_MODEL[sender] in POINT_LAYERS:
+        _nearby_index.invalidate()
@@ -0,0 +1,196 @@
+"""
+Keyset (cursor) pagination for the research lists.
+Pages are selected with a WHERE on the sort key of the last row shown instead
+of OFFSET, so a deep page costs the same as the first one. Cursors are signed,
+opaque tokens and the total is an optional count capped at COUNT_LIMIT.
+"""
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
+
+CURSOR_SALT = 'frontend.pagination.cursor'
+COUNT_LIMIT = 1000
+
+
+def keyset_expression(model, name):
+    """
+    Sort expression for one ordering field.
+    Nullable text columns are coalesced to '' so every row has a comparable
+    key (the same expressions back the keyset indexes on Research).
+    """
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # Annotations such as search_rank
+        return F(name)
+    if field.null and isinstance(field, (models.CharField, models.TextField)):
+        return Coalesce(F(name), Value(''))
+    return F(name)
+
+
+def encode_cursor(direction, values):
+    return signing.dumps({'d': direction, 'v': list(values)}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """
+    Returns:
+        Tuple (direction, values), or (None, None) for a missing or tampered cursor
+    """
+    if not token:
+        return None, None
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+        return data['d'], data['v']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None, None
+
+
+class KeysetPage:
+    """A page of results; exposes the parts of django.core.paginator.Page the templates use."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return ''
+        return encode_cursor('next', self.paginator.key_values(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return ''
+        return encode_cursor('prev', self.paginator.key_values(self.object_list[0]))
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset on a fixed ordering.
+
+    Args:
+        queryset: Queryset to paginate
+        per_page: Rows per page
+        ordering: Field names, '-' prefixed for descending; 'id' is appended
+            as tiebreaker when missing
+        count_limit: Cap for the optional total
+    """
+
+    def __init__(self, queryset, per_page, ordering, count_limit=COUNT_LIMIT):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_limit = count_limit
+
+        ordering = list(ordering)
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering.append('id')
+        self.keys = []
+        for position, name in enumerate(ordering):
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            self.keys.append((f'keyset_{position}', keyset_expression(queryset.model, name), descending))
+
+    def key_values(self, obj):
+        """Sort key of a row (model instance, or dict from a .values() queryset)."""
+        if isinstance(obj, dict):
+            return [obj[alias] for alias, _, _ in self.keys]
+        return [getattr(obj, alias) for alias, _, _ in self.keys]
+
+    def _ordered(self, reverse=False):
+        queryset = self.queryset.annotate(**{alias: expression for alias, expression, _ in self.keys})
+        order_by = []
+        for alias, _, descending in self.keys:
+            order_by.append(F(alias).asc() if descending == reverse else F(alias).desc())
+        return queryset.order_by(*order_by)
+
+    def _beyond(self, values, reverse=False):
+        """
+        Q matching rows after values in the ordering (before them when reverse).
+
+        The OR of ANDs is wrapped in a redundant bound on the leading key
+        (k0 <= v0 AND (k0 < v0 OR (k0 = v0 AND k1 < v1) ...)) so the planner
+        can turn it into a range scan of the keyset index instead of a filter.
+        """
+        condition = Q()
+        for position, (alias, _, descending) in enumerate(self.keys):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{alias}__{lookup}': values[position]})
+            for earlier, (earlier_alias, _, _) in enumerate(self.keys[:position]):
+                step &= Q(**{earlier_alias: values[earlier]})
+            condition |= step
+        alias, _, descending = self.keys[0]
+        return Q(**{f"{alias}__{'lte' if descending != reverse else 'gte'}": values[0]}) & condition
+
+    def get_page(self, cursor=None):
+        direction, values = decode_cursor(cursor)
+        if values is not None and len(values) != len(self.keys):
+            direction = None
+
+        if direction == 'prev':
+            rows = list(self._ordered(reverse=True).filter(self._beyond(values, reverse=True))[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(rows, self, has_next=True, has_previous=has_previous)
+
+        queryset = self._ordered()
+        if direction == 'next':
+            queryset = queryset.filter(self._beyond(values))
+        rows = list(queryset[:self.per_page + 1])
+        return KeysetPage(
+            rows[:self.per_page], self,
+            has_next=len(rows) > self.per_page,
+            has_previous=direction == 'next',
+        )
+
+    @cached_property
+    def _capped_count(self):
+        return self.queryset.order_by()[:self.count_limit + 1].count()
+
+    @property
+    def count(self):
+        """Total number of rows, at most count_limit (see count_is_capped)."""
+        return min(self._capped_count, self.count_limit)
+
+    @property
+    def count_is_capped(self):
+        return self._capped_count > self.count_limit
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin replacing OFFSET pagination with KeysetPaginator.
+    The page is selected by the ?cursor= token; paginate_by still sets the page size.
+    """
+    keyset_ordering = ('-id',)
+    cursor_kwarg = 'cursor'
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.get_keyset_ordering())
+        page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
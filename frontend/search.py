@@ -0,0 +1,265 @@
+"""
+Full-text search for the research catalog.
+On PostgreSQL, research rows carry a maintained tsvector (title > keywords >
+abstract) backed by a GIN index and results are ordered with SearchRank.
+On other databases (e.g. SQLite in tests) an in-process inverted index with
+the same weights is used instead.
+"""
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Research
+
+# Supported catalog languages -> PostgreSQL text search configurations
+SEARCH_LANGUAGES = {
+    'it': 'italian',
+    'en': 'english',
+}
+DEFAULT_SEARCH_LANGUAGE = getattr(settings, 'RESEARCH_SEARCH_LANGUAGE', 'it')
+
+# Same weights PostgreSQL's ts_rank uses for labels A, B and C
+FIELD_WEIGHTS = (
+    ('title', 'A', 1.0),
+    ('keywords', 'B', 0.4),
+    ('abstract', 'C', 0.2),
+)
+
+# Highlight markers; private-use characters cannot clash with user text and
+# let the snippet be HTML-escaped before <mark> tags are inserted.
+_START_SEL = '\ue000'
+_STOP_SEL = '\ue001'
+SNIPPET_WORDS = 35
+
+
+def get_search_language(code):
+    """Return a supported language code, falling back to the default."""
+    return code if code in SEARCH_LANGUAGES else DEFAULT_SEARCH_LANGUAGE
+
+
+def uses_postgres_search():
+    return connection.vendor == 'postgresql'
+
+
+def research_search_vector():
+    """
+    Weighted tsvector for a research.
+    Lexemes from both the Italian and English dictionaries are stored so that
+    either language can be chosen at query time.
+    """
+    vector = None
+    for field, weight, _ in FIELD_WEIGHTS:
+        for config in SEARCH_LANGUAGES.values():
+            part = SearchVector(field, config=config, weight=weight)
+            vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vectors(research_ids=None):
+    """Recompute the stored search vectors (all researches when no ids are given)."""
+    if not uses_postgres_search():
+        return 0
+    queryset = Research.objects.all()
+    if research_ids is not None:
+        queryset = queryset.filter(id__in=research_ids)
+    return queryset.update(search_vector=research_search_vector())
+
+
+def render_snippet(text):
+    """Escape a highlighted snippet and turn the markers into <mark> tags."""
+    if not text:
+        return ''
+    html = escape(text).replace(_START_SEL, '<mark>').replace(_STOP_SEL, '</mark>')
+    return mark_safe(html)
+
+
+# Pure-Python fallback index
+def normalize_token(token):
+    """Lowercase and strip accents so 'Età' and 'eta' match."""
+    token = unicodedata.normalize('NFKD', token.lower())
+    return ''.join(char for char in token if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return [normalize_token(token) for token in re.findall(r'\w+', text or '')]
+
+
+class FallbackSearchIndex:
+    """
+    In-memory inverted index over research title, keywords and abstract.
+    Scores follow the PostgreSQL weights; every query term must match
+    (as a prefix of an indexed token), like websearch_to_tsquery's AND.
+    """
+
+    def __init__(self, rows):
+        # token -> {research_id: weighted term frequency}
+        self.postings = defaultdict(lambda: defaultdict(float))
+        for row in rows:
+            for field, _, weight in FIELD_WEIGHTS:
+                for token in tokenize(row[field]):
+                    self.postings[token][row['id']] += weight
+        self.tokens = sorted(self.postings)
+
+    @classmethod
+    def build(cls):
+        return cls(Research.objects.values('id', 'title', 'keywords', 'abstract'))
+
+    def _matching_tokens(self, term):
+        # Binary search on the sorted vocabulary for tokens starting with term
+        index = bisect_left(self.tokens, term)
+        while index < len(self.tokens) and self.tokens[index].startswith(term):
+            yield self.tokens[index]
+            index += 1
+
+    def search(self, query):
+        """
+        Returns:
+            Dict of research_id -> rank for researches matching every term
+        """
+        scores = None
+        for term in set(tokenize(query)):
+            term_scores = defaultdict(float)
+            for token in self._matching_tokens(term):
+                for research_id, score in self.postings[token].items():
+                    term_scores[research_id] += score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {rid: scores[rid] + term_scores[rid] for rid in scores if rid in term_scores}
+            if not scores:
+                return {}
+        return dict(scores or {})
+
+
+_fallback_lock = threading.Lock()
+_fallback_index = None
+
+
+def get_fallback_index():
+    global _fallback_index
+    with _fallback_lock:
+        if _fallback_index is None:
+            _fallback_index = FallbackSearchIndex.build()
+        return _fallback_index
+
+
+def reset_fallback_index():
+    global _fallback_index
+    with _fallback_lock:
+        _fallback_index = None
+
+
+def highlight_text(text, query, max_words=SNIPPET_WORDS):
+    """Python counterpart of ts_headline: a window of text with query terms marked."""
+    if not text:
+        return ''
+    terms = tokenize(query)
+    words = text.split()
+    first_hit = None
+    marked = []
+    for position, word in enumerate(words):
+        normalized = tokenize(word)
+        if normalized and any(token.startswith(term) for token in normalized for term in terms):
+            if first_hit is None:
+                first_hit = position
+            marked.append(f'{_START_SEL}{word}{_STOP_SEL}')
+        else:
+            marked.append(word)
+    start = max(0, (first_hit or 0) - 5)
+    return ' '.join(marked[start:start + max_words])
+
+
+# Public API used by the catalog view
+def search_research(queryset, query, language=None):
+    """
+    Filter and rank a Research queryset by a free-text query.
+
+    Args:
+        queryset: Base Research queryset
+        query: User search string
+        language: 'it' or 'en' (dictionary used for stemming the query)
+
+    Returns:
+        Queryset ordered by descending rank (annotated with search_rank)
+    """
+    language = get_search_language(language)
+    if uses_postgres_search():
+        search_query = SearchQuery(query, config=SEARCH_LANGUAGES[language], search_type='websearch')
+        return (
+            queryset
+            .filter(search_vector=search_query)
+            # ts_rank is real; as double precision the rank survives the float round trip of
+            # a keyset cursor (see pagination.KeysetPaginator), so boundary ties compare equal
+            .annotate(search_rank=Cast(SearchRank(F('search_vector'), search_query), FloatField()))
+            .order_by('-search_rank', 'title', 'id')
+        )
+
+    scores = get_fallback_index().search(query)
+    ranked_ids = sorted(scores, key=lambda research_id: -scores[research_id])
+    return (
+        queryset
+        .filter(id__in=ranked_ids)
+        .annotate(search_rank=Case(
+            *[When(id=research_id, then=Value(scores[research_id])) for research_id in ranked_ids],
+            default=Value(0.0), output_field=FloatField(),
+        ))
+        .order_by('-search_rank', 'title', 'id')
+    )
+
+
+def attach_snippets(researches, query, language=None):
+    """
+    Set a highlighted abstract snippet (search_snippet) on each research of a page.
+    Only the rows being displayed are processed.
+    """
+    researches = list(researches)
+    if not researches or not query:
+        return researches
+    language = get_search_language(language)
+
+    if uses_postgres_search():
+        search_query = SearchQuery(query, config=SEARCH_LANGUAGES[language], search_type='websearch')
+        headlines = dict(
+            Research.objects
+            .filter(id__in=[research.id for research in researches])
+            .annotate(headline=SearchHeadline(
+                'abstract', search_query, config=SEARCH_LANGUAGES[language],
+                start_sel=_START_SEL, stop_sel=_STOP_SEL,
+                max_words=SNIPPET_WORDS, min_words=15,
+            ))
+            .values_list('id', 'headline')
+        )
+    else:
+        headlines = {research.id: highlight_text(research.abstract, query) for research in researches}
+
+    for research in researches:
+        research.search_snippet = render_snippet(headlines.get(research.id))
+    return researches
+
+
+# Keep the search data in sync with research changes
+@receiver(post_save, sender=Research)
+def refresh_search_vector(sender, instance, **kwargs):
+    if uses_postgres_search():
+        update_search_vectors([instance.id])
+    else:
+        reset_fallback_index()
+
+
+@receiver(post_delete, sender=Research)
+def drop_from_fallback_index(sender, instance, **kwargs):
+    if not uses_postgres_search():
+        reset_fallback_index()
@@ -0,0 +1,189 @@
+"""
+Background processing of the shapefile / GeoPackage / GeoJSON upload preview.
+
+An upload is spooled to disk while its SHA-256 is computed; the digest is the
+job id. Summaries (normalized geometry, feature count, bbox, source CRS, see
+shapefile_utils.summarize_dataset) are cached in the Django cache under the
+digest, so uploading the same file again answers immediately. Otherwise the
+file is handed to a per-process thread pool of PREVIEW_WORKERS threads and the
+request returns at once with the job id to poll: a large survey no longer
+ties up a web worker, and the pending entry (claimed with cache.add) keeps two
+workers from processing the same file. With PREVIEW_WORKERS = 0 the preview is
+built inside the request.
+
+Poll results come from the cache, so any worker can answer as long as the
+cache is shared (settings.CACHES defaults to a file-based cache; check
+frontend.W001 warns about a per-process one).
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .ingest import UPLOAD_EXTENSIONS, dataset_path
+from .shapefile_utils import summarize_dataset
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'shapefile_preview'
+# Bump when the summary format changes so old entries are not served
+FORMAT_VERSION = 2
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 60 * 60 * 24
+# A pending entry older than this is considered lost (e.g. the worker restarted) and the file is processed again
+DEFAULT_JOB_TIMEOUT = 60 * 10
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+PENDING, DONE, ERROR = 'pending', 'done', 'error'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def preview_key(job_id):
+    return f'{KEY_PREFIX}:{FORMAT_VERSION}:{job_id}'
+
+
+_executor_lock = threading.Lock()
+_executor = None
+_futures = {}
+
+
+def get_executor():
+    """Return this process's preview thread pool (created on first use, so after any fork)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_setting('PREVIEW_WORKERS', DEFAULT_WORKERS), thread_name_prefix='shapefile-preview',
+            )
+        return _executor
+
+
+def spool_upload(upload, directory):
+    """
+    Write an uploaded file into directory, hashing it on the way.
+
+    Returns:
+        Tuple (SHA-256 hex digest, path of the spooled file)
+
+    Raises:
+        ValueError: If the file extension is not supported
+    """
+    suffix = os.path.splitext(upload.name or '')[1].lower()
+    if suffix not in UPLOAD_EXTENSIONS:
+        raise ValueError(f"Unsupported file type; upload one of {', '.join(UPLOAD_EXTENSIONS)}.")
+    digest = hashlib.sha256()
+    path = os.path.join(directory, f'upload{suffix}')
+    with open(path, 'wb') as handle:
+        for chunk in upload.chunks():
+            digest.update(chunk)
+            handle.write(chunk)
+    return digest.hexdigest(), path
+
+
+def build_preview(job_id, path, directory=None):
+    """
+    Summarize a spooled file and store the outcome under its job id.
+
+    Args:
+        job_id: SHA-256 of the file
+        path: Spooled file (see spool_upload)
+        directory: Spool directory to delete afterwards
+
+    Returns:
+        The stored cache entry
+    """
+    try:
+        entry = {'status': DONE, 'result': summarize_dataset(dataset_path(path))}
+        timeout = _setting('PREVIEW_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    except Exception as e:
+        if not isinstance(e, ValueError):
+            logger.exception('Shapefile preview %s failed', job_id)
+        # Kept briefly: a corrupt file fails again anyway, a transient error should not stick
+        entry = {'status': ERROR, 'error': str(e)}
+        timeout = _setting('PREVIEW_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+    cache.set(preview_key(job_id), entry, timeout=timeout)
+    return entry
+
+
+def submit_preview(upload):
+    """
+    Return the cached preview of an upload, or start building it in the background.
+
+    Args:
+        upload: Uploaded file (.zip shapefile, .gpkg, .geojson or .json)
+
+    Returns:
+        Tuple (job id, cache entry): the entry has status 'done' with a result,
+        'error' with a message, or 'pending'
+
+    Raises:
+        ValueError: If the file extension is not supported
+    """
+    directory = tempfile.mkdtemp(prefix='shapefile-preview-')
+    try:
+        job_id, path = spool_upload(upload, directory)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    key = preview_key(job_id)
+    if not cache.add(key, {'status': PENDING}, timeout=_setting('PREVIEW_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)):
+        # Cached, or another request is already processing the same file
+        shutil.rmtree(directory, ignore_errors=True)
+        return job_id, cache.get(key) or {'status': PENDING}
+
+    if not _setting('PREVIEW_WORKERS', DEFAULT_WORKERS):
+        return job_id, build_preview(job_id, path, directory)
+    future = get_executor().submit(build_preview, job_id, path, directory)
+    _futures[job_id] = future
+    future.add_done_callback(lambda done: _futures.pop(job_id, None))
+    return job_id, {'status': PENDING}
+
+
+def get_preview(job_id):
+    """Cache entry of a preview job, or None for an unknown or expired job id."""
+    if not JOB_ID_PATTERN.fullmatch(job_id or ''):
+        return None
+    return cache.get(preview_key(job_id))
+
+
+def wait_for_preview(job_id, timeout=None):
+    """Block until a job running in this process finishes, then return its entry (see get_preview)."""
+    future = _futures.get(job_id)
+    if future is not None:
+        future.result(timeout=timeout)
+    return get_preview(job_id)
+
+
+def preview_geometry(upload):
+    """
+    Geometry text of an upload, built inside the request unless the same file was previewed before.
+
+    Raises:
+        ValueError: If the file type is not supported or the file holds no usable geometry
+    """
+    directory = tempfile.mkdtemp(prefix='shapefile-preview-')
+    try:
+        job_id, path = spool_upload(upload, directory)
+        entry = get_preview(job_id)
+        if not entry or entry['status'] != DONE:
+            entry = build_preview(job_id, path)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if entry['status'] == ERROR:
+        raise ValueError(entry['error'])
+    return entry['result']['geometry']
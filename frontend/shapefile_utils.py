@@ -1,29 +1,60 @@
-import geopandas as gpd
+import json
 
-def extract_geometry_from_shapefile(shapefile_path):
+import pyogrio
+import shapely
+
+from .ingest import read_feature_batches
+from .spatial import COORDINATE_DECIMALS, round_coordinates
+from .utils.geometry_parser import format_geometry
+
+
+def summarize_dataset(path):
     """
-    Extracts the geometry from a shapefile and returns it in a format suitable for Django.
+    Summarize a dataset (shapefile, GeoPackage, GeoJSON) for the upload preview.
+    All features are merged, keeping every part and hole, and reprojected to WGS84.
 
     Args:
-        shapefile_path (str): Path to the shapefile (.shp).
+        path (str): Dataset path (see ingest.dataset_path / ingest.uploaded_dataset).
 
     Returns:
-        str: Geometry in the format '((x1,y1),(x2,y2),...)'.
-    """
-    # Read the shapefile using geopandas
-    gdf = gpd.read_file(shapefile_path)
+        dict: geometry (stored text), geojson (the same geometry as a GeoJSON object, for
+            drawing), centroid ([lon, lat]), feature_count, bbox ([minx, miny, maxx, maxy]
+            in WGS84) and crs (source CRS, e.g. 'EPSG:3004', or None when the dataset declares none).
 
-    # Check if the GeoDataFrame is empty
-    if gdf.empty:
+    Raises:
+        ValueError: If the dataset contains no geometries.
+    """
+    parts = []
+    feature_count = 0
+    for batch in read_feature_batches(path, columns=[]):
+        feature_count += len(batch.fids)
+        shapes = batch.shapes[~shapely.is_missing(batch.shapes)]
+        parts.extend(shapes[~shapely.is_empty(shapes)])
+
+    if not parts:
         raise ValueError("The shapefile does not contain any geometries.")
 
-    # Get the first geometry
-    geometry = gdf.geometry.iloc[0]
+    geometry = parts[0] if len(parts) == 1 else shapely.union_all(shapely.make_valid(parts))
+    centroid = shapely.centroid(geometry)
+    return {
+        'geometry': format_geometry(geometry),
+        'geojson': json.loads(shapely.to_geojson(round_coordinates(geometry))),
+        'centroid': [round(centroid.x, COORDINATE_DECIMALS), round(centroid.y, COORDINATE_DECIMALS)],
+        'feature_count': feature_count,
+        'bbox': [round(value, 6) for value in shapely.bounds(geometry).tolist()],
+        'crs': pyogrio.read_info(path)['crs'],
+    }
 
-    # Convert to a list of coordinates
-    coords = list(geometry.exterior.coords)
 
-    # Format the coordinates as a string
-    formatted = '(' + ','.join(f'({x:.6f},{y:.6f})' for x, y in coords) + ')'
+def extract_geometry_from_shapefile(path):
+    """
+    Extracts the geometry of a dataset (shapefile, GeoPackage, GeoJSON) in a format suitable for Django.
+    All features are merged, keeping every part and hole, and reprojected to WGS84.
+
+    Args:
+        path (str): Dataset path (see ingest.dataset_path / ingest.uploaded_dataset).
 
-    return formatted
\ No newline at end of file
+    Returns:
+        str: Geometry as stored text, e.g. '((x1,y1),(x2,y2),...)' for a simple polygon.
+    """
+    return summarize_dataset(path)['geometry']
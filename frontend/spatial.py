@@ -0,0 +1,610 @@
+"""
+Derived geometry columns and the in-memory spatial index.
+Research, Site and ArchaeologicalEvidence keep their geometry as text; this
+module mirrors it into WKB plus bbox/centroid columns (GeometryColumns) on
+every save that changes it, so maps and spatial queries read parsed data and can filter with
+indexed range predicates instead of reparsing strings.
+
+Each geometry also gets a simplification pyramid: Douglas-Peucker copies at
+PYRAMID_ZOOMS with a tolerance of one screen pixel at that zoom. Overview maps
+draw the level matching the requested zoom (or the bbox / feature extent)
+instead of the full vertex list.
+
+Viewport queries (/api/spatial/) are answered from a per-process STRtree per
+layer, built lazily from the stored WKB and dropped when a row's geometry,
+position or name changes; a version key in the Django cache propagates the change to other workers.
+"""
+
+import json
+import threading
+from functools import partial
+
+import numpy as np
+import shapely
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+from shapely import STRtree, box, wkb
+from shapely.errors import GEOSException
+
+from .models import Research, Site, ArchaeologicalEvidence
+from .utils.geometry import geometry_to_shape
+from .utils.geometry_parser import parse_geometries
+from .utils.versioned_index import SharedIndex
+
+GEOMETRY_MODELS = (Research, Site, ArchaeologicalEvidence)
+
+# Simplification pyramid levels (web map zoom); above the finest level the
+# full geometry is drawn
+PYRAMID_ZOOMS = (5, 9, 13)
+PYRAMID_FIELDS = {zoom: f'geometry_wkb_z{zoom}' for zoom in PYRAMID_ZOOMS}
+MAX_ZOOM = 22
+VIEWPORT_PIXELS = 1024
+TILE_PIXELS = 256
+
+DERIVED_FIELDS = (
+    'geometry_wkb', 'bbox_minx', 'bbox_miny', 'bbox_maxx', 'bbox_maxy',
+    'centroid_x', 'centroid_y',
+) + tuple(PYRAMID_FIELDS.values())
+
+
+MAX_LATITUDE = 85.05112878
+
+
+def mercator(lon, lat):
+    """Project lon/lat arrays to Web Mercator coordinates in [0, 1] (y down)."""
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    sin = np.sin(np.radians(lat))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)
+    return np.clip(x, 0.0, 1.0), np.clip(y, 0.0, 1.0)
+
+
+def tile_bounds(zoom, x, y):
+    """Lon/lat bbox (minx, miny, maxx, maxy) of a web map tile."""
+    tiles = 2 ** zoom
+
+    def lat(row):
+        return float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * row / tiles)))))
+
+    return x / tiles * 360.0 - 180.0, lat(y + 1), (x + 1) / tiles * 360.0 - 180.0, lat(y)
+
+
+def pixel_size(zoom):
+    """Width of one screen pixel in degrees at a web map zoom level."""
+    return 360.0 / (TILE_PIXELS * 2 ** zoom)
+
+
+def zoom_for_bbox(bbox, viewport_pixels=VIEWPORT_PIXELS):
+    """Zoom level at which bbox (minx, miny, maxx, maxy) fills a viewport."""
+    minx, miny, maxx, maxy = bbox
+    extent = max(maxx - minx, maxy - miny)
+    if extent <= 0:
+        return MAX_ZOOM
+    zoom = np.floor(np.log2(viewport_pixels * 360.0 / (TILE_PIXELS * extent)))
+    return int(np.clip(zoom, 0, MAX_ZOOM))
+
+
+def pyramid_level(zoom):
+    """Coarsest pyramid level precise enough for zoom, or None for the full geometry."""
+    if zoom is None:
+        return None
+    for level in PYRAMID_ZOOMS:
+        if zoom <= level:
+            return level
+    return None
+
+
+def simplify_levels(shape):
+    """
+    Simplified copies of a geometry for each pyramid level.
+
+    Returns:
+        Dict zoom -> Shapely geometry, only for levels that drop vertices
+    """
+    if shape is None or shape.geom_type in ('Point', 'MultiPoint'):
+        return {}
+    count = shapely.get_num_coordinates(shape)
+    levels = {}
+    for zoom in PYRAMID_ZOOMS:
+        simplified = shapely.simplify(shape, pixel_size(zoom), preserve_topology=True)
+        if not simplified.is_empty and shapely.get_num_coordinates(simplified) < count:
+            levels[zoom] = simplified
+    return levels
+
+
+def geometry_columns_many(shapes):
+    """
+    Compute the derived columns for many geometries with vectorized Shapely calls.
+
+    Args:
+        shapes: Sequence of Shapely geometries (None for rows without one)
+
+    Returns:
+        Dict of DERIVED_FIELDS -> list aligned with shapes (None where there is no geometry)
+    """
+    shapes = np.asarray(shapes, dtype=object).reshape(-1)
+    columns = {field: [None] * len(shapes) for field in DERIVED_FIELDS}
+    present = ~shapely.is_missing(shapes)
+    present[present] = ~shapely.is_empty(shapes[present])
+    positions = np.flatnonzero(present)
+    if not len(positions):
+        return columns
+    valid = shapes[positions]
+    bounds = shapely.bounds(valid)
+    centroids = shapely.centroid(valid)
+    values = {
+        'geometry_wkb': shapely.to_wkb(valid).tolist(),
+        'bbox_minx': bounds[:, 0].tolist(),
+        'bbox_miny': bounds[:, 1].tolist(),
+        'bbox_maxx': bounds[:, 2].tolist(),
+        'bbox_maxy': bounds[:, 3].tolist(),
+        'centroid_x': shapely.get_x(centroids).tolist(),
+        'centroid_y': shapely.get_y(centroids).tolist(),
+    }
+    # Levels are only stored when simplifying drops vertices (see simplify_levels)
+    counts = shapely.get_num_coordinates(valid)
+    simplifiable = ~np.isin(shapely.get_type_id(valid), [shapely.GeometryType.POINT, shapely.GeometryType.MULTIPOINT])
+    for zoom, field in PYRAMID_FIELDS.items():
+        level = np.full(len(valid), None, dtype=object)
+        simplified = shapely.simplify(valid[simplifiable], pixel_size(zoom), preserve_topology=True)
+        keep = ~shapely.is_empty(simplified) & (shapely.get_num_coordinates(simplified) < counts[simplifiable])
+        level[np.flatnonzero(simplifiable)[keep]] = shapely.to_wkb(simplified[keep])
+        values[field] = level.tolist()
+    for field, field_values in values.items():
+        column = columns[field]
+        for position, value in zip(positions.tolist(), field_values):
+            column[position] = value
+    return columns
+
+
+def geometry_columns(geometry, shape=None):
+    """
+    Compute the derived columns for a geometry value.
+
+    Args:
+        geometry: Stored geometry value
+        shape: Already parsed geometry, if available
+
+    Returns:
+        Dict of DERIVED_FIELDS -> value (all None when the geometry cannot be parsed)
+    """
+    if shape is None:
+        shape = geometry_to_shape(geometry)
+    return {field: values[0] for field, values in geometry_columns_many([shape]).items()}
+
+
+def load_shape(instance, zoom=None):
+    """
+    Return the Shapely geometry of a row, from WKB when available.
+
+    Args:
+        instance: Row with geometry / derived columns
+        zoom: Display zoom; the matching pyramid level is returned when stored
+    """
+    level = pyramid_level(zoom)
+    if level is not None:
+        # A level is only stored when it drops vertices; fall back to finer ones
+        for candidate in PYRAMID_ZOOMS[PYRAMID_ZOOMS.index(level):]:
+            data = getattr(instance, PYRAMID_FIELDS[candidate])
+            if data:
+                return wkb.loads(bytes(data))
+    if instance.geometry_wkb:
+        return wkb.loads(bytes(instance.geometry_wkb))
+    shape = geometry_to_shape(instance.geometry)
+    if level is not None and shape is not None:
+        return simplify_levels(shape).get(level, shape)
+    return shape
+
+
+def display_zoom(instance, headroom=2):
+    """Zoom at which a row's map is drawn: the zoom fitting its bbox, plus headroom for zooming in."""
+    if instance.bbox_minx is None:
+        return None
+    bbox = (instance.bbox_minx, instance.bbox_miny, instance.bbox_maxx, instance.bbox_maxy)
+    return min(zoom_for_bbox(bbox) + headroom, MAX_ZOOM)
+
+
+def sync_geometry_columns(instance, shape=None):
+    """Set the derived columns of an instance from its geometry (does not save)."""
+    for field, value in geometry_columns(instance.geometry, shape).items():
+        setattr(instance, field, value)
+
+
+def sync_geometry_columns_many(instances, shapes):
+    """Set the derived columns of many instances from their parsed geometries (does not save)."""
+    for field, values in geometry_columns_many(shapes).items():
+        for instance, value in zip(instances, values):
+            setattr(instance, field, value)
+
+
+def backfill_geometry_columns(model, batch_size=500, only_missing=False):
+    """
+    Recompute the derived columns of every row of a model.
+
+    Args:
+        model: One of GEOMETRY_MODELS
+        batch_size: Rows read and written per batch
+        only_missing: Skip rows that already have a bbox
+
+    Returns:
+        Number of rows written
+    """
+    queryset = model.objects.order_by('pk').only('pk', 'geometry')
+    if only_missing:
+        queryset = queryset.filter(bbox_minx__isnull=True)
+
+    def write(batch):
+        sync_geometry_columns_many(batch, parse_geometries(instance.geometry for instance in batch))
+        model.objects.bulk_update(batch, DERIVED_FIELDS)
+        return len(batch)
+
+    written = 0
+    batch = []
+    for instance in queryset.iterator(chunk_size=batch_size):
+        batch.append(instance)
+        if len(batch) >= batch_size:
+            written += write(batch)
+            batch = []
+    if batch:
+        written += write(batch)
+    return written
+
+
+# Per-process spatial index
+SPATIAL_LAYERS = {
+    'site': (Site, 'site_name'),
+    'evidence': (ArchaeologicalEvidence, 'evidence_name'),
+    'research': (Research, 'title'),
+}
+LAYER_BY_MODEL = {model: layer for layer, (model, _) in SPATIAL_LAYERS.items()}
+
+COORDINATE_DECIMALS = 6  # ~0.1 m, enough for display
+# Detail maps snap to a grid of about QUANTIZE_STEPS cells across the feature
+QUANTIZE_STEPS = 10000
+QUANTIZE_MIN_DECIMALS = 2
+QUANTIZE_MAX_DECIMALS = 5  # ~1 m
+MAX_FEATURES = 5000
+SPATIAL_VERSION_KEY = 'spatial_index_version:{}'
+
+
+def round_coordinates(shapes):
+    """Round the coordinates of a geometry (or array of geometries) for output."""
+    return shapely.transform(shapes, lambda coords: np.round(coords, COORDINATE_DECIMALS))
+
+
+def feature_json(layer, pk, name, geometry_json):
+    """Compact GeoJSON Feature string; geometry_json is already serialized."""
+    properties = json.dumps({'layer': layer, 'id': pk, 'name': name}, separators=(',', ':'))
+    return f'{{"type":"Feature","id":"{layer}.{pk}","geometry":{geometry_json},"properties":{properties}}}'
+
+
+def shape_feature(layer, pk, name, shape):
+    """Compact GeoJSON Feature string for one Shapely geometry."""
+    return feature_json(layer, pk, name, shapely.to_geojson(round_coordinates(shape)))
+
+
+def quantize_shape(shape, steps=QUANTIZE_STEPS):
+    """
+    Snap a geometry to a decimal grid sized to its extent for compact output.
+    Vertices collapsing onto the same grid cell are removed; when snapping would
+    make the geometry invalid or empty it is only rounded.
+
+    Returns:
+        Tuple (quantized shape, number of decimals kept)
+    """
+    minx, miny, maxx, maxy = shape.bounds
+    extent = max(maxx - minx, maxy - miny)
+    if extent > 0:
+        decimals = int(np.clip(np.ceil(np.log10(steps / extent)), QUANTIZE_MIN_DECIMALS, QUANTIZE_MAX_DECIMALS))
+    else:
+        decimals = QUANTIZE_MAX_DECIMALS
+    try:
+        snapped = shapely.set_precision(shape, 10.0 ** -decimals)
+    except GEOSException:
+        snapped = shape
+    if snapped.is_empty:
+        snapped = shape
+    return shapely.transform(snapped, lambda coords: np.round(coords, decimals)), decimals
+
+
+def quantized_feature(layer, pk, name, shape):
+    """Compact GeoJSON Feature string of a geometry quantized with quantize_shape."""
+    quantized, _ = quantize_shape(shape)
+    return feature_json(layer, pk, name, shapely.to_geojson(quantized))
+
+
+def _from_wkb(values):
+    """Decode a list of WKB values (None allowed) into an object array."""
+    result = np.full(len(values), None, dtype=object)
+    present = [position for position, data in enumerate(values) if data]
+    if present:
+        result[present] = shapely.from_wkb([bytes(values[position]) for position in present])
+    return result
+
+
+def load_layer_shapes(layer):
+    """
+    Read the ids, names, geometries and pyramid levels of a layer with two queries.
+    Rows not yet backfilled are parsed from their text geometry.
+
+    Returns:
+        Tuple (ids, names, shapes, levels): shapes is a numpy array (unparsable
+        rows dropped) and levels maps each pyramid zoom to an array aligned
+        with it, None where the level is not stored
+    """
+    model, name_field = SPATIAL_LAYERS[layer]
+    fields = [PYRAMID_FIELDS[zoom] for zoom in PYRAMID_ZOOMS]
+    rows = list(model.objects.filter(geometry_wkb__isnull=False).values_list(
+        'id', name_field, 'geometry_wkb', *fields
+    ))
+    ids = [row[0] for row in rows]
+    names = [row[1] or '' for row in rows]
+    shapes = list(_from_wkb([row[2] for row in rows]))
+    levels = {zoom: list(_from_wkb([row[3 + offset] for row in rows])) for offset, zoom in enumerate(PYRAMID_ZOOMS)}
+
+    pending = list(model.objects.filter(geometry_wkb__isnull=True).values_list('id', name_field, 'geometry'))
+    parsed = parse_geometries(geometry for _, _, geometry in pending)
+    for (row_id, name, _), shape in zip(pending, parsed):
+        if shape is not None:
+            ids.append(row_id)
+            names.append(name or '')
+            shapes.append(shape)
+            simplified = simplify_levels(shape)
+            for zoom in PYRAMID_ZOOMS:
+                levels[zoom].append(simplified.get(zoom))
+    return (ids, names, np.array(shapes, dtype=object),
+            {zoom: np.array(level, dtype=object) for zoom, level in levels.items()})
+
+
+# Sites and evidence are also read as points: their geometry centroid, or their
+# lat/lon fields when they have no usable geometry
+POINT_LAYERS = ('site', 'evidence')
+
+
+def point_position(instance):
+    """(lon, lat) of a site or evidence row, or (None, None) when it has no position."""
+    if instance.centroid_x is not None:
+        return instance.centroid_x, instance.centroid_y
+    if instance.lon is not None and instance.lat is not None:
+        return float(instance.lon), float(instance.lat)
+    return None, None
+
+
+def load_layer_points(layer):
+    """
+    Read the position of every row of a point layer.
+
+    Returns:
+        Tuple (ids, names, lon, lat): lists of ids and names and float64 arrays,
+        rows without a position dropped
+    """
+    model, name_field = SPATIAL_LAYERS[layer]
+    ids, names, lon, lat = [], [], [], []
+    rows = model.objects.values_list('id', name_field, 'centroid_x', 'centroid_y', 'lon', 'lat')
+    for row_id, name, centroid_x, centroid_y, row_lon, row_lat in rows.iterator(chunk_size=5000):
+        if centroid_x is None:
+            if row_lon is None or row_lat is None:
+                continue
+            centroid_x, centroid_y = float(row_lon), float(row_lat)
+        ids.append(row_id)
+        names.append(name or '')
+        lon.append(centroid_x)
+        lat.append(centroid_y)
+    return ids, names, np.array(lon, dtype=np.float64), np.array(lat, dtype=np.float64)
+
+
+class LayerIndex:
+    """STRtree over the geometries of one layer, with the pyramid levels for output."""
+
+    def __init__(self, layer, ids, names, shapes, levels=None, version=None):
+        self.layer = layer
+        self.version = version
+        self.ids = ids
+        self.names = names
+        self.shapes = shapes
+        self.tree = STRtree(shapes)
+        # Fill missing levels from the next finer one so every level is complete
+        self.levels = {}
+        finer = shapes
+        for zoom in reversed(PYRAMID_ZOOMS):
+            level = (levels or {}).get(zoom)
+            if level is None or not len(level):
+                level = finer
+            else:
+                level = np.where(shapely.is_missing(level), finer, level)
+            self.levels[zoom] = finer = level
+
+    @classmethod
+    def build(cls, layer, version=None):
+        return cls(layer, *load_layer_shapes(layer), version=version)
+
+    def query(self, bbox):
+        """Return the positions of the geometries intersecting bbox, in id order."""
+        positions = self.tree.query(box(*bbox), predicate='intersects')
+        return sorted(positions.tolist(), key=lambda position: self.ids[position])
+
+    def features(self, positions, zoom=None):
+        """Yield compact GeoJSON Feature strings for the given positions, simplified for zoom."""
+        if not positions:
+            return
+        level = pyramid_level(zoom)
+        shapes = self.shapes if level is None else self.levels[level]
+        geometries = shapely.to_geojson(round_coordinates(shapes[positions]))
+        for position, geometry in zip(positions, geometries):
+            yield feature_json(self.layer, self.ids[position], self.names[position], geometry)
+
+
+_spatial_lock = threading.Lock()
+_layer_indexes = {
+    layer: SharedIndex(SPATIAL_VERSION_KEY.format(layer), partial(LayerIndex.build, layer), _spatial_lock)
+    for layer in SPATIAL_LAYERS
+}
+
+
+def get_layer_version(layer):
+    return _layer_indexes[layer].version()
+
+
+def get_layer_index(layer):
+    """Return this worker's index of a layer, rebuilding it when the shared version changed."""
+    return _layer_indexes[layer].get()
+
+
+def reset_spatial_index(layer=None):
+    for name in SPATIAL_LAYERS if layer is None else (layer,):
+        _layer_indexes[name].reset()
+
+
+def parse_bbox(value):
+    """
+    Parse a "minx,miny,maxx,maxy" parameter.
+
+    Raises:
+        ValueError: If the value is missing, malformed or inverted
+    """
+    try:
+        minx, miny, maxx, maxy = (float(part) for part in (value or '').split(','))
+    except ValueError:
+        raise ValueError('bbox must be minx,miny,maxx,maxy')
+    if not all(np.isfinite([minx, miny, maxx, maxy])) or minx > maxx or miny > maxy:
+        raise ValueError('bbox must be minx,miny,maxx,maxy with min <= max')
+    return minx, miny, maxx, maxy
+
+
+def parse_layers(value):
+    """
+    Parse a comma-separated layers parameter (all layers when missing).
+
+    Raises:
+        ValueError: If a layer is unknown
+    """
+    if not value:
+        return list(SPATIAL_LAYERS)
+    layers = list(dict.fromkeys(layer.strip() for layer in value.split(',') if layer.strip()))
+    unknown = [layer for layer in layers if layer not in SPATIAL_LAYERS]
+    if unknown:
+        raise ValueError(f"Unknown layer(s): {', '.join(unknown)}")
+    return layers
+
+
+def parse_zoom(value):
+    """
+    Parse an optional zoom parameter.
+
+    Raises:
+        ValueError: If the value is not an integer between 0 and MAX_ZOOM
+    """
+    if value in (None, ''):
+        return None
+    try:
+        zoom = int(value)
+    except ValueError:
+        raise ValueError(f'zoom must be an integer between 0 and {MAX_ZOOM}')
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f'zoom must be an integer between 0 and {MAX_ZOOM}')
+    return zoom
+
+
+def spatial_feature_collection(bbox, layers, limit=MAX_FEATURES, zoom=None):
+    """
+    GeoJSON FeatureCollection of the features of the given layers intersecting bbox.
+
+    Args:
+        bbox: (minx, miny, maxx, maxy)
+        layers: Layer names (see SPATIAL_LAYERS)
+        limit: Maximum number of features
+        zoom: Display zoom selecting the pyramid level; derived from bbox when None
+
+    Returns:
+        JSON string; "truncated" is true when more than limit features matched
+    """
+    if zoom is None:
+        zoom = zoom_for_bbox(bbox)
+    features = []
+    truncated = False
+    for layer in layers:
+        index = get_layer_index(layer)
+        positions = index.query(bbox)
+        if len(features) + len(positions) > limit:
+            positions = positions[:limit - len(features)]
+            truncated = True
+        features.extend(index.features(positions, zoom))
+        if truncated:
+            break
+    return (f'{{"type":"FeatureCollection","truncated":{"true" if truncated else "false"},'
+            f'"features":[{",".join(features)}]}}')
+
+
+# Sent after bulk writes, which skip post_save: sender is the model and bbox the
+# (minx, miny, maxx, maxy) extent of the rows written, or None when unknown
+geometries_bulk_changed = Signal()
+
+
+# Columns whose change moves or renames a row in the per-process indexes
+INDEXED_FIELDS = {
+    model: frozenset(('geometry', name_field) + (('lat', 'lon') if layer in POINT_LAYERS else ()))
+    for layer, (model, name_field) in SPATIAL_LAYERS.items()
+}
+
+
+def _stored_values(sender, instance, fields):
+    """Stored values of fields for a row loaded from the database, or None for a new row."""
+    if instance._state.adding or instance.pk is None:
+        return None
+    return sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+# Keep the derived columns in sync with the text geometry
+@receiver(pre_save, sender=Research)
+@receiver(pre_save, sender=Site)
+@receiver(pre_save, sender=ArchaeologicalEvidence)
+def update_derived_geometry(sender, instance, update_fields=None, **kwargs):
+    """
+    Recompute the derived columns when the geometry changed, and note on the
+    instance whether an indexed column changed (see invalidate_spatial_index_on_save).
+    """
+    fields = INDEXED_FIELDS[sender]
+    if update_fields is not None:
+        fields = fields & set(update_fields)
+        if not fields:
+            instance._spatial_changed = False
+            return
+    stored = _stored_values(sender, instance, fields)
+    changed = {field for field in fields if stored is None or stored[field] != getattr(instance, field)}
+    instance._spatial_changed = bool(changed)
+    # Rows saved before the derived columns existed get them on their next save
+    derived_missing = 'bbox_minx' not in instance.get_deferred_fields() and instance.bbox_minx is None
+    instance._geometry_synced = 'geometry' in changed or (
+        'geometry' in fields and derived_missing and bool(instance.geometry)
+    )
+    if instance._geometry_synced:
+        sync_geometry_columns(instance)
+
+
+@receiver(post_save, sender=Research)
+@receiver(post_save, sender=Site)
+@receiver(post_save, sender=ArchaeologicalEvidence)
+def save_derived_geometry(sender, instance, update_fields=None, **kwargs):
+    """save(update_fields=[..., 'geometry']) skips the derived columns; write them here."""
+    if (update_fields and 'geometry' in update_fields and 'geometry_wkb' not in update_fields
+            and getattr(instance, '_geometry_synced', True)):
+        sender.objects.filter(pk=instance.pk).update(
+            **{field: getattr(instance, field) for field in DERIVED_FIELDS}
+        )
+
+
+@receiver(post_save, sender=Research)
+@receiver(post_save, sender=Site)
+@receiver(post_save, sender=ArchaeologicalEvidence)
+def invalidate_spatial_index_on_save(sender, instance, **kwargs):
+    """Edits that leave the geometry, position and name alone (e.g. a description) keep the indexes."""
+    if getattr(instance, '_spatial_changed', True):
+        invalidate_spatial_index(sender)
+
+
+@receiver(post_delete, sender=Research)
+@receiver(post_delete, sender=Site)
+@receiver(post_delete, sender=ArchaeologicalEvidence)
+@receiver(geometries_bulk_changed)
+def invalidate_spatial_index(sender, **kwargs):
+    _layer_indexes[LAYER_BY_MODEL[sender]].invalidate()
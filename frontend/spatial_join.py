@@ -0,0 +1,134 @@
+"""
+Point-in-polygon join of sites and evidence against research areas.
+Suggests the SiteResearch / ArchEvResearch links implied by geometry: every
+site or evidence point lying inside a research polygon. Candidate pairs come
+from one bulk STRtree query over the points, and are then confirmed with a
+single vectorized shapely.contains_xy call on prepared polygons, so even
+100k points x 10k polygons take seconds.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import shapely
+from django.db import transaction
+from shapely import STRtree
+
+from .catalog import schedule_catalog_refresh
+from .models import ArchEvResearch, SiteResearch
+from .spatial import POINT_LAYERS, load_layer_points, load_layer_shapes
+
+LinkSuggestions = namedtuple('LinkSuggestions', ['layer', 'point_ids', 'research_ids'])
+
+_PAIR_SHIFT = 32
+
+
+def _pair_keys(point_ids, research_ids):
+    return (np.asarray(research_ids, dtype=np.int64) << _PAIR_SHIFT) | np.asarray(point_ids, dtype=np.int64)
+
+
+def existing_links(layer):
+    """Pair keys of the links already stored for a layer."""
+    if layer == 'site':
+        pairs = SiteResearch.objects.values_list('id_site_id', 'id_research_id')
+    else:
+        pairs = ArchEvResearch.objects.filter(
+            id_archaeological_evidence__isnull=False
+        ).values_list('id_archaeological_evidence_id', 'id_research')
+    pairs = np.array(list(pairs.iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 2)
+    return _pair_keys(pairs[:, 0], pairs[:, 1])
+
+
+def load_research_polygons(research_ids=None):
+    """
+    Research areas usable for the join (polygonal geometries only).
+
+    Returns:
+        Tuple (ids as int64 array, prepared polygons as object array)
+    """
+    ids, _, shapes, _ = load_layer_shapes('research')
+    ids = np.array(ids, dtype=np.int64)
+    keep = shapely.get_dimensions(shapes) == 2 if len(shapes) else np.zeros(0, dtype=bool)
+    if research_ids is not None:
+        keep &= np.isin(ids, list(research_ids))
+    polygons = shapes[keep]
+    shapely.prepare(polygons)
+    return ids[keep], polygons
+
+
+def join_points(lon, lat, polygons):
+    """
+    Find the polygons containing each point.
+
+    Args:
+        lon, lat: float64 arrays of point coordinates
+        polygons: Array of (preferably prepared) polygons
+
+    Returns:
+        Tuple (point positions, polygon positions) of the containing pairs
+    """
+    if not len(lon) or not len(polygons):
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    tree = STRtree(polygons)
+    point_positions, polygon_positions = tree.query(shapely.points(lon, lat))
+    inside = shapely.contains_xy(polygons[polygon_positions], lon[point_positions], lat[point_positions])
+    return point_positions[inside], polygon_positions[inside]
+
+
+def suggest_research_links(layers=POINT_LAYERS, research_ids=None, include_existing=False):
+    """
+    Suggest research links for sites and evidence lying inside research areas.
+
+    Args:
+        layers: Point layers to join ('site', 'evidence')
+        research_ids: Restrict to these researches (default: all)
+        include_existing: Also return pairs that are already linked
+
+    Returns:
+        List of LinkSuggestions, one per layer, pairs sorted by research then point
+    """
+    polygon_ids, polygons = load_research_polygons(research_ids)
+    suggestions = []
+    for layer in layers:
+        point_ids, _, lon, lat = load_layer_points(layer)
+        point_positions, polygon_positions = join_points(lon, lat, polygons)
+        keys = np.unique(_pair_keys(np.array(point_ids, dtype=np.int64)[point_positions],
+                                    polygon_ids[polygon_positions]))
+        if not include_existing:
+            keys = keys[~np.isin(keys, existing_links(layer))]
+        suggestions.append(LinkSuggestions(layer, keys & ((1 << _PAIR_SHIFT) - 1), keys >> _PAIR_SHIFT))
+    return suggestions
+
+
+def create_research_links(suggestions, batch_size=1000):
+    """
+    Store suggested links with bulk inserts and refresh the affected catalog entries.
+    Pairs that are already linked (e.g. suggestions made with include_existing,
+    or stored by a concurrent run) are skipped.
+
+    Args:
+        suggestions: LinkSuggestions from suggest_research_links
+        batch_size: Rows per INSERT
+
+    Returns:
+        Dict layer -> number of links written
+    """
+    written = {}
+    with transaction.atomic():
+        for suggestion in suggestions:
+            keys = np.unique(_pair_keys(suggestion.point_ids, suggestion.research_ids))
+            keys = keys[~np.isin(keys, existing_links(suggestion.layer))]
+            pairs = zip((keys & ((1 << _PAIR_SHIFT) - 1)).tolist(), (keys >> _PAIR_SHIFT).tolist())
+            if suggestion.layer == 'site':
+                links = [SiteResearch(id_site_id=point_id, id_research_id=research_id) for point_id, research_id in pairs]
+                SiteResearch.objects.bulk_create(links, batch_size=batch_size, ignore_conflicts=True)
+            else:
+                links = [ArchEvResearch(id_archaeological_evidence_id=point_id, id_research=research_id)
+                         for point_id, research_id in pairs]
+                # unique_arch_ev_research_pair (migration 0016) catches a run racing this one
+                ArchEvResearch.objects.bulk_create(links, batch_size=batch_size, ignore_conflicts=True)
+            written[suggestion.layer] = len(links)
+            if links:
+                # bulk_create sends no post_save, so refresh the catalog here
+                schedule_catalog_refresh(np.unique(keys >> _PAIR_SHIFT).tolist())
+    return written
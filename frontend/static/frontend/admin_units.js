@@ -0,0 +1,92 @@
+/*
+ * Fills the country, region, province and municipality selects of the site
+ * and evidence forms from the lat/lon fields with one /api/admin-units/
+ * request (see frontend/admin_units.py). Selects the user already filled are
+ * left alone; values filled here are replaced when the position changes.
+ * Scripts that set lat/lon programmatically should dispatch a change event.
+ */
+(function () {
+  'use strict';
+
+  var URL = '/api/admin-units/';
+  var FIELDS = ['country', 'region', 'province', 'municipality'];
+
+  function select(name) {
+    return document.getElementById('id_id_' + name);
+  }
+
+  function fill(element, unit) {
+    if (!element || !unit || !unit.id) {
+      return;
+    }
+    if (element.value && element.dataset.autoFilled !== 'true') {
+      return;
+    }
+    var value = String(unit.id);
+    var option = Array.prototype.find.call(element.options, function (opt) {
+      return opt.value === value;
+    });
+    if (!option) {
+      // The cascading handlers may have narrowed the options
+      option = new Option(unit.name || value, value);
+      element.add(option);
+    }
+    element.value = value;
+    element.dataset.autoFilled = 'true';
+  }
+
+  function resolve(lat, lon) {
+    fetch(URL + '?lat=' + encodeURIComponent(lat) + '&lon=' + encodeURIComponent(lon))
+      .then(function (response) {
+        return response.ok ? response.json() : null;
+      })
+      .then(function (data) {
+        if (!data || !data.result) {
+          return;
+        }
+        FIELDS.forEach(function (name) {
+          fill(select(name), data.result[name]);
+        });
+      })
+      .catch(function () {});
+  }
+
+  function init() {
+    var latField = document.getElementById('id_lat');
+    var lonField = document.getElementById('id_lon');
+    if (!latField || !lonField || !select('municipality')) {
+      return;
+    }
+    var timer = null;
+    function changed() {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var lat = parseFloat(latField.value);
+        var lon = parseFloat(lonField.value);
+        if (isFinite(lat) && isFinite(lon)) {
+          resolve(lat, lon);
+        }
+      }, 300);
+    }
+    latField.addEventListener('change', changed);
+    lonField.addEventListener('change', changed);
+    FIELDS.forEach(function (name) {
+      var element = select(name);
+      if (element) {
+        element.addEventListener('change', function (event) {
+          if (event.isTrusted) {
+            element.dataset.autoFilled = 'false';
+          }
+        });
+      }
+    });
+  }
+
+  window.ShareLandAdminUnits = {resolve: resolve};
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', init);
+  } else {
+    init();
+  }
+})();
@@ -0,0 +1,94 @@
+/*
+ * Shared Leaflet renderer for research, site and evidence maps.
+ * Elements with data-geojson (an inline Feature) or data-geojson-url (a
+ * long-cached, versioned /maps/<kind>/<pk>.geojson URL) are turned into maps;
+ * URL-backed maps are fetched only once they scroll into view. The features
+ * are the quantized GeoJSON built by frontend/map_cache.py.
+ *
+ * ShareLandMap.render(element, feature) can be called directly as well.
+ */
+(function () {
+  'use strict';
+
+  var STYLE = {color: 'blue', weight: 2, fillColor: 'blue', fillOpacity: 0.3};
+  var POINT_ZOOM = 13;
+  var MAX_FIT_ZOOM = 15;
+
+  function render(element, feature) {
+    if (element._leaflet_map) {
+      element._leaflet_map.remove();
+    }
+    var map = L.map(element);
+    element._leaflet_map = map;
+    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+      maxZoom: 19,
+      attribution: '&copy; OpenStreetMap contributors'
+    }).addTo(map);
+    var layer = L.geoJSON(feature, {style: STYLE}).addTo(map);
+    if (feature.properties && feature.properties.name) {
+      layer.bindPopup(feature.properties.name);
+    }
+    var bounds = layer.getBounds();
+    if (feature.geometry && feature.geometry.type === 'Point') {
+      map.setView(bounds.getCenter(), POINT_ZOOM);
+    } else {
+      map.fitBounds(bounds, {maxZoom: MAX_FIT_ZOOM});
+    }
+    return map;
+  }
+
+  function unavailable(element) {
+    element.innerHTML = '<p class="text-muted small p-3">Map unavailable.</p>';
+  }
+
+  function load(element) {
+    fetch(element.dataset.geojsonUrl, {headers: {'Accept': 'application/geo+json'}})
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error('HTTP ' + response.status);
+        }
+        return response.json();
+      })
+      .then(function (feature) {
+        render(element, feature);
+      })
+      .catch(function () {
+        unavailable(element);
+      });
+  }
+
+  function init() {
+    document.querySelectorAll('[data-geojson]').forEach(function (element) {
+      try {
+        render(element, JSON.parse(element.dataset.geojson));
+      } catch (e) {
+        unavailable(element);
+      }
+    });
+
+    var elements = document.querySelectorAll('[data-geojson-url]');
+    if (!('IntersectionObserver' in window)) {
+      elements.forEach(load);
+      return;
+    }
+    var observer = new IntersectionObserver(function (entries) {
+      entries.forEach(function (entry) {
+        if (entry.isIntersecting) {
+          observer.unobserve(entry.target);
+          load(entry.target);
+        }
+      });
+    }, {rootMargin: '200px'});
+    elements.forEach(function (element) {
+      observer.observe(element);
+    });
+  }
+
+  window.ShareLandMap = {render: render, load: load};
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', init);
+  } else {
+    init();
+  }
+})();
@@ -0,0 +1,67 @@
+/*
+ * window.previewShapefile(formData): posts an upload to /api/preview-shapefile/
+ * and resolves with the preview (geometry, geojson, centroid, feature_count,
+ * bbox, crs) or {error}. window.drawShapefilePreview(map, data) draws the
+ * previewed geometry (any type, every part and hole) on a Leaflet map. Previews are built in the background (see
+ * frontend/shapefile_preview.py): a 202 answer carries a poll_url, polled
+ * with a growing delay until the job is done. The CSRF token of the form
+ * (or the csrftoken cookie) is sent along in the X-CSRFToken header.
+ */
+(function () {
+  'use strict';
+
+  var URL = '/api/preview-shapefile/';
+  var FIRST_DELAY_MS = 300;
+  var MAX_DELAY_MS = 3000;
+
+  function poll(data, delay) {
+    if (data.status !== 'pending') {
+      return Promise.resolve(data);
+    }
+    return new Promise(function (resolve) {
+      setTimeout(resolve, delay);
+    }).then(function () {
+      return fetch(data.poll_url).then(function (response) {
+        return response.json();
+      });
+    }).then(function (next) {
+      return poll(next, Math.min(delay * 2, MAX_DELAY_MS));
+    });
+  }
+
+  function csrfToken(formData) {
+    var field = formData.get('csrfmiddlewaretoken') || document.querySelector('[name=csrfmiddlewaretoken]');
+    if (field) {
+      return typeof field === 'string' ? field : field.value;
+    }
+    var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]*)/);
+    return match ? decodeURIComponent(match[1]) : '';
+  }
+
+  window.previewShapefile = function (formData) {
+    return fetch(URL, {
+      method: 'POST',
+      body: formData,
+      headers: { 'X-CSRFToken': csrfToken(formData) },
+      credentials: 'same-origin'
+    })
+      .then(function (response) {
+        return response.json();
+      })
+      .then(function (data) {
+        return poll(data, FIRST_DELAY_MS);
+      });
+  };
+
+  var drawn = new WeakMap();
+
+  window.drawShapefilePreview = function (map, data) {
+    if (drawn.has(map)) {
+      map.removeLayer(drawn.get(map));
+    }
+    var layer = L.geoJSON(data.geojson).addTo(map);
+    drawn.set(map, layer);
+    map.fitBounds(layer.getBounds());
+    return layer;
+  };
+})();
@@ -1,3 +1,1362 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import math
+import os
+import tempfile
+import zipfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pyogrio
+import pyproj
+import shapely
+from pyogrio.raw import open_arrow
+
+from django.contrib.auth.models import User, update_last_login
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import (
+    Research, Site, SiteResearch, ArchaeologicalEvidence, ArchEvResearch,
+    SiteArchEvidence, SiteToponymy, SiteBibliography, Bibliography, Image,
+    ArchEvBiblio, PositioningMode, PositionalAccuracy, FirstDiscoveryMethod,
+    ResearchCatalogEntry, Country, Region, Province, Municipality, Chronology, Interpretation, Typology,
+    AdminAggregate,
+)
+from .catalog import build_catalog_trees, get_catalog_trees
+from .pagination import KeysetPaginator
+from .map_cache import (
+    evict_disk_cache, get_map_cache_stats, map_cache_key, map_url, render_map, reset_map_cache_stats
+)
+from .clusters import get_cluster_index, reset_cluster_index
+from .spatial import (
+    backfill_geometry_columns, geometries_bulk_changed, get_layer_version, load_shape, mercator, reset_spatial_index,
+)
+from .tiles import clear_tile_cache
+from .spatial_join import create_research_links, join_points, suggest_research_links
+from .nearby import get_nearby_index, reset_nearby_index
+from .admin_units import backfill_admin_units, reset_municipality_index, resolve_admin_units
+from .density import reset_density_points
+from .admin_aggregates import discard_pending_aggregates, rebuild_admin_aggregates
+from .checks import check_shared_cache
+from .ingest import dataset_path, ingest_features, read_feature_batches
+from .shapefile_preview import wait_for_preview
+from .utils.kdtree import KDTree, unit_vectors
+from .search import search_research, attach_snippets, reset_fallback_index
+from .utils.geometry import parse_geometry_string
+from .utils.geometry_parser import format_geometry, parse_coordinates, parse_geometries, parse_geometry
+from .utils.author_search import search_users, search_users_in_database, reset_author_index
+from .utils.research_details import load_public_research_details, load_research_details
+
+
+class ResearchFixturesMixin:
+    """Helpers creating a research with linked sites, evidence and relations."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.positioning_mode = PositioningMode.objects.create(id=1, desc_positioning_mode='GPS')
+        cls.positional_accuracy = PositionalAccuracy.objects.create(id=1, description='High')
+        cls.discovery_method = FirstDiscoveryMethod.objects.create(id=1, desc_first_discovery_method='Survey')
+
+    def create_evidence(self, name):
+        return ArchaeologicalEvidence.objects.create(
+            evidence_name=name,
+            geometry='((12.1,41.1))',
+            id_positioning_mode=self.positioning_mode,
+            id_positional_accuracy=self.positional_accuracy,
+            id_first_discovery_method=self.discovery_method,
+        )
+
+    def create_research(self, site_count):
+        research = Research.objects.create(title=f'Research {site_count}', geometry='((12.1,41.1),(12.2,41.2))')
+        for index in range(site_count):
+            site = Site.objects.create(site_name=f'Site {index}')
+            SiteResearch.objects.create(id_site=site, id_research=research)
+            SiteToponymy.objects.create(id_site=site, ancient_place_name=f'Ancient {index}')
+            bibliography = Bibliography.objects.create(title=f'Book {index}')
+            SiteBibliography.objects.create(id_site=site, id_bibliography=bibliography)
+            Image.objects.create(id_site=site, file_name=f'image_{index}.jpg')
+
+            evidence = self.create_evidence(f'Site evidence {index}')
+            SiteArchEvidence.objects.create(id_site=site, id_archaeological_evidence=evidence)
+            ArchEvBiblio.objects.create(id_archaeological_evidence=evidence, id_bibliography=bibliography)
+
+            direct_evidence = self.create_evidence(f'Direct evidence {index}')
+            ArchEvResearch.objects.create(id_archaeological_evidence=direct_evidence, id_research=research.id)
+        return research
+
+
+class ResearchDetailsLoaderTests(ResearchFixturesMixin, TestCase):
+    """The batch loader must issue the same number of queries for any number of sites."""
+
+    def count_queries(self, research):
+        with CaptureQueriesContext(connection) as queries:
+            sites_with_details, evidences_with_details = load_public_research_details(research)
+            # Touch the relations the template renders
+            for site_data in sites_with_details:
+                str(site_data['site'].id_country)
+                list(site_data['images'])
+            for evidence_data in evidences_with_details:
+                str(evidence_data['evidence'].id_archaeological_evidence_typology)
+        return len(queries), sites_with_details, evidences_with_details
+
+    def test_query_count_is_constant(self):
+        small_count, _, _ = self.count_queries(self.create_research(1))
+        large_count, sites, evidences = self.count_queries(self.create_research(20))
+
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(len(sites), 20)
+        self.assertEqual(len(evidences), 40)
+
+    def test_details_are_grouped_per_site(self):
+        research = self.create_research(3)
+        sites, evidences = load_public_research_details(research)
+
+        for site_data in sites:
+            index = site_data['site'].site_name.split()[-1]
+            self.assertEqual(site_data['toponymy'].ancient_place_name, f'Ancient {index}')
+            self.assertEqual(site_data['bibliography'].id_bibliography.title, f'Book {index}')
+            self.assertEqual([image.file_name for image in site_data['images']], [f'image_{index}.jpg'])
+            self.assertEqual([e.evidence_name for e in site_data['evidences']], [f'Site evidence {index}'])
+            self.assertIsNone(site_data['interpretation'])
+
+        with_biblio = [e for e in evidences if e['bibliography'] is not None]
+        self.assertEqual(len(with_biblio), 3)
+
+    def test_research_details_query_count_is_constant(self):
+        def count(research):
+            with CaptureQueriesContext(connection) as queries:
+                sites, evidences = load_research_details(research)
+            return len(queries), sites, evidences
+
+        small_count, _, _ = count(self.create_research(1))
+        large_count, sites, evidences = count(self.create_research(20))
+
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(len(sites), 20)
+        # Only evidence linked directly to the research is listed
+        self.assertEqual(len(evidences), 20)
+        self.assertTrue(all(len(site_data['bibliographies']) == 1 for site_data in sites))
+        self.assertTrue(all(len(site_data['evidences']) == 1 for site_data in sites))
+
+
+class ResearchCatalogTests(ResearchFixturesMixin, TestCase):
+    """The materialized catalog must follow changes to research, sites and evidence."""
+
+    def test_tree_holds_display_fields_only(self):
+        research = self.create_research(2)
+        tree = build_catalog_trees([research.id])[research.id]
+
+        self.assertEqual([site['site_name'] for site in tree['sites']], ['Site 0', 'Site 1'])
+        self.assertEqual(tree['sites'][0]['evidences'][0]['evidence_name'], 'Site evidence 0')
+        self.assertEqual(len(tree['direct_evidences']), 2)
+        self.assertNotIn('geometry', tree['direct_evidences'][0])
+
+    def test_missing_entries_are_built_on_read(self):
+        research = self.create_research(1)
+        ResearchCatalogEntry.objects.all().delete()
+
+        trees = get_catalog_trees([research.id])
+
+        self.assertEqual(len(trees[research.id]['sites']), 1)
+        self.assertTrue(ResearchCatalogEntry.objects.filter(id_research=research).exists())
+
+    def test_signals_refresh_entries_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            research = self.create_research(1)
+        entry = ResearchCatalogEntry.objects.get(id_research=research)
+        self.assertEqual(entry.tree['sites'][0]['site_name'], 'Site 0')
+
+        site = Site.objects.get(site_name='Site 0')
+        with self.captureOnCommitCallbacks(execute=True):
+            site.site_name = 'Renamed site'
+            site.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.tree['sites'][0]['site_name'], 'Renamed site')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteResearch.objects.filter(id_research=research).delete()
+        entry.refresh_from_db()
+        self.assertEqual(entry.tree['sites'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            research.delete()
+        self.assertFalse(ResearchCatalogEntry.objects.filter(id_research_id=research.id).exists())
+
+
+class ResearchSearchTests(TestCase):
+    """Catalog search ranks title matches above keyword and abstract matches."""
+
+    def setUp(self):
+        reset_fallback_index()
+        self.abstract_match = Research.objects.create(
+            title='Survey of the coast', abstract='A Roman villa near the harbour.', geometry='((1,1))')
+        self.title_match = Research.objects.create(
+            title='Roman villa excavation', abstract='Trenches and finds.', geometry='((1,1))')
+        self.keyword_match = Research.objects.create(
+            title='Landscape study', keywords='roman, villa', geometry='((1,1))')
+        Research.objects.create(title='Medieval castle', abstract='Nothing relevant.', geometry='((1,1))')
+
+    def test_results_are_ranked_by_field_weight(self):
+        results = list(search_research(Research.objects.all(), 'roman villa'))
+        self.assertEqual(results, [self.title_match, self.keyword_match, self.abstract_match])
+
+    def test_every_term_must_match(self):
+        results = list(search_research(Research.objects.all(), 'roman castle'))
+        self.assertEqual(results, [])
+
+    def test_index_follows_saves(self):
+        self.assertEqual(list(search_research(Research.objects.all(), 'necropolis')), [])
+        self.title_match.abstract = 'A necropolis next to the villa.'
+        self.title_match.save()
+        self.assertEqual(list(search_research(Research.objects.all(), 'necropolis')), [self.title_match])
+
+    def test_keyset_pages_with_tied_ranks(self):
+        for position in range(5):
+            Research.objects.create(title=f'Roman villa {position % 2}', abstract='Trenches.', geometry='((1,1))')
+        results = search_research(Research.objects.all(), 'roman villa')
+        paginator = KeysetPaginator(results, 2, ('-search_rank', 'title', 'id'))
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        seen = [research.id for page in pages for research in page]
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(seen, [research.id for research in results])
+
+    def test_snippets_are_escaped_and_highlighted(self):
+        self.abstract_match.abstract = '<script>x</script> Roman villa'
+        research, = attach_snippets([self.abstract_match], 'villa')
+        self.assertIn('&lt;script&gt;', research.search_snippet)
+        self.assertIn('<mark>villa</mark>', research.search_snippet)
+
+
+class AuthorSearchTests(TestCase):
+    """Author search returns users in surname > first name > username > email order."""
+
+    def setUp(self):
+        reset_author_index()
+        self.by_email = User.objects.create(username='u1', email='rossi@example.com', first_name='Anna', last_name='Bianchi')
+        self.by_username = User.objects.create(username='rossi_m', email='m@example.com', first_name='Marco', last_name='Verdi')
+        self.by_first_name = User.objects.create(username='u3', email='r@example.com', first_name='Rossina', last_name='Neri')
+        self.by_surname = User.objects.create(username='u4', email='p@example.com', first_name='Paolo', last_name='Rossi')
+        User.objects.create(username='u5', email='x@example.com', first_name='Luca', last_name='Gialli')
+        self.expected = [
+            (self.by_surname.id, 'surname'), (self.by_first_name.id, 'firstname'),
+            (self.by_username.id, 'username'), (self.by_email.id, 'email'),
+        ]
+
+    def test_matches_are_ordered_by_field_priority(self):
+        results = search_users('Ross')
+        self.assertEqual([(author.id, match_type) for author, match_type in results], self.expected)
+
+    def test_database_search_uses_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = search_users_in_database('ross')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([(author.id, match_type) for author, match_type in results], self.expected)
+
+    def test_lookups_are_served_from_memory(self):
+        search_users('ross')
+        with CaptureQueriesContext(connection) as queries:
+            results = search_users('ross', limit=2)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([author.id for author, _ in results], [self.by_surname.id, self.by_first_name.id])
+
+    def test_index_follows_user_saves(self):
+        self.assertEqual(search_users('nicolo'), [])
+        self.by_email.last_name = 'De Nicolò'
+        self.by_email.save()
+        author, match_type = search_users('nicolo')[0]
+        self.assertEqual((author.id, author.last_name, match_type), (self.by_email.id, 'De Nicolò', 'surname'))
+
+    def test_logins_keep_the_index(self):
+        search_users('ross')
+        update_last_login(None, self.by_surname)
+        with CaptureQueriesContext(connection) as queries:
+            search_users('ross')
+        self.assertEqual(len(queries), 0)
+
+    def test_blank_query(self):
+        self.assertEqual(search_users('  '), [])
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages cover every row once, in order, in both directions."""
+
+    def setUp(self):
+        years = ['2020', '2018', None, '2020', '2019', None, '2018']
+        for position, year in enumerate(years):
+            Research.objects.create(title=f'Research {position % 3}', year=year, geometry='((1,1))')
+        self.expected = list(Research.objects.all().order_by(
+            Coalesce('year', Value('')).desc(), F('id').desc()))
+
+    def walk_forward(self, paginator):
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        return pages
+
+    def test_forward_and_backward_walks_match_ordering(self):
+        paginator = KeysetPaginator(Research.objects.all(), 3, ('-year', '-id'))
+        pages = self.walk_forward(paginator)
+        self.assertEqual([research for page in pages for research in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        previous = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual(previous.object_list, pages[-2].object_list)
+        self.assertTrue(previous.has_next())
+
+    def test_deep_pages_do_not_use_offset(self):
+        paginator = KeysetPaginator(Research.objects.all(), 2, ('-year', '-id'))
+        cursor = paginator.get_page().next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            list(paginator.get_page(cursor))
+        self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+
+    def test_cursor_bounds_the_leading_key(self):
+        paginator = KeysetPaginator(Research.objects.all(), 2, ('-year', '-id'))
+        values = paginator.key_values(paginator.get_page().object_list[-1])
+        condition = paginator._beyond(values)
+        self.assertEqual(condition.connector, Q.AND)
+        self.assertIn(('keyset_0__lte', values[0]), condition.children)
+        self.assertIn(('keyset_0__gte', values[0]), paginator._beyond(values, reverse=True).children)
+        sql = str(paginator._ordered().filter(condition).query)
+        self.assertIn(f"<= {values[0]}", sql.replace("'", ''))
+
+    def test_tampered_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(Research.objects.all(), 3, ('-year', '-id'))
+        page = paginator.get_page('not-a-cursor')
+        self.assertEqual(page.object_list, self.expected[:3])
+
+    def test_capped_count(self):
+        paginator = KeysetPaginator(Research.objects.all(), 3, ('title',), count_limit=5)
+        self.assertEqual((paginator.count, paginator.count_is_capped), (5, True))
+
+    def test_catalog_view_follows_cursor(self):
+        response = self.client.get(reverse('research-catalog'))
+        page = response.context['page_obj']
+        response = self.client.get(reverse('research-catalog'), {'cursor': page.next_cursor})
+        titles = [research.title for research in response.context['researches']]
+        self.assertEqual(titles, ['Research 2', 'Research 2'])
+
+
+class SelectorListApiTests(ResearchFixturesMixin, TestCase):
+    """Site/evidence selector APIs stream, paginate, project and filter."""
+
+    def setUp(self):
+        for name in ['Alba', 'Albano', 'Bosco', 'Campo']:
+            Site.objects.create(site_name=name, locality_name=f'{name} loc', geometry='POINT(1 1)')
+        self.create_evidence('')
+
+    def test_full_list_is_streamed(self):
+        response = self.client.get(reverse('api-sites-list'))
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['count'], 4)
+        self.assertEqual([site['site_name'] for site in data['results']], ['Alba', 'Albano', 'Bosco', 'Campo'])
+        self.assertEqual(set(data['results'][0]), {'id', 'site_name', 'locality_name'})
+
+    def test_pages_follow_cursor(self):
+        names = []
+        params = {'limit': 3}
+        while True:
+            data = self.client.get(reverse('api-sites-list'), params).json()
+            names.extend(site['site_name'] for site in data['results'])
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(names, ['Alba', 'Albano', 'Bosco', 'Campo'])
+
+    def test_prefix_filter_and_fields(self):
+        data = json.loads(b''.join(self.client.get(
+            reverse('api-sites-list'), {'q': 'alb', 'fields': 'site_name'}).streaming_content))
+        self.assertEqual([sorted(site) for site in data['results']], [['id', 'site_name']] * 2)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('api-evidence-list'), {'fields': 'geometry'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unnamed_evidence_gets_display_name(self):
+        data = self.client.get(reverse('api-evidence-list'), {'limit': 10}).json()
+        evidence = data['results'][0]
+        self.assertEqual(evidence['evidence_name'], f"Evidence #{evidence['id']}")
+
+
+class GeometryColumnsTests(ResearchFixturesMixin, TestCase):
+    """Derived WKB/bbox/centroid columns follow the text geometry."""
+
+    def test_columns_are_set_on_save(self):
+        research = Research.objects.create(title='Area', geometry='((-1.5,40.0),(2.5,40.0),(2.5,44.0),(-1.5,44.0))')
+        research.refresh_from_db()
+        self.assertEqual(
+            (research.bbox_minx, research.bbox_miny, research.bbox_maxx, research.bbox_maxy),
+            (-1.5, 40.0, 2.5, 44.0),
+        )
+        self.assertEqual((research.centroid_x, research.centroid_y), (0.5, 42.0))
+        self.assertEqual(load_shape(research).geom_type, 'Polygon')
+
+    def test_point_sites_and_update_fields(self):
+        site = Site.objects.create(site_name='Point', geometry='(12.5, 41.9)')
+        site.geometry = '(13.0, 42.0)'
+        site.save(update_fields=['geometry'])
+        site.refresh_from_db()
+        self.assertEqual((site.bbox_minx, site.centroid_y), (13.0, 42.0))
+
+    def test_edits_that_keep_the_geometry_skip_columns_and_indexes(self):
+        research = Research.objects.create(title='Area', geometry='((0,0),(1,0),(1,1))')
+        version = get_layer_version('research')
+        with mock.patch('frontend.spatial.sync_geometry_columns') as sync:
+            research.abstract = 'Updated'
+            research.save()
+            Research.objects.get(pk=research.pk).save(update_fields=['abstract'])
+        sync.assert_not_called()
+        self.assertEqual(get_layer_version('research'), version)
+
+        research.title = 'Renamed'  # shown by the spatial index
+        research.save()
+        self.assertEqual(get_layer_version('research'), version + 1)
+        research.geometry = '((0,0),(2,0),(2,2))'
+        research.save()
+        research.refresh_from_db()
+        self.assertEqual((research.bbox_maxx, get_layer_version('research')), (2.0, version + 2))
+
+    def test_unparsable_geometry_clears_columns(self):
+        evidence = self.create_evidence('Broken')
+        evidence.geometry = 'not a geometry'
+        evidence.save()
+        evidence.refresh_from_db()
+        self.assertIsNone(evidence.geometry_wkb)
+        self.assertIsNone(evidence.bbox_minx)
+
+    def test_backfill_fills_rows_written_with_raw_updates(self):
+        site = Site.objects.create(site_name='Raw', geometry='(12.5, 41.9)')
+        Site.objects.filter(pk=site.pk).update(geometry='(10.0, 45.0)', bbox_minx=None)
+        self.assertEqual(backfill_geometry_columns(Site, only_missing=True), 1)
+        site.refresh_from_db()
+        self.assertEqual((site.bbox_minx, site.bbox_miny), (10.0, 45.0))
+        call_command('backfill_geometry_columns', '--model', 'site', stdout=StringIO())
+
+
+class SpatialApiTests(ResearchFixturesMixin, TestCase):
+    """Viewport queries return the intersecting features as GeoJSON."""
+
+    def setUp(self):
+        reset_spatial_index()
+        self.rome = Site.objects.create(site_name='Roma', geometry='(12.49, 41.89)')
+        self.milan = Site.objects.create(site_name='Milano', geometry='(9.19, 45.46)')
+        self.area = Research.objects.create(title='Lazio survey', geometry='((12.0,41.5),(13.0,41.5),(13.0,42.5),(12.0,42.5))')
+
+    def query(self, **params):
+        response = self.client.get(reverse('api-spatial'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_only_features_in_view_are_returned(self):
+        data = self.query(bbox='12,41,13,42', layers='site,research')
+        self.assertEqual([feature['id'] for feature in data['features']],
+                         [f'site.{self.rome.id}', f'research.{self.area.id}'])
+        self.assertEqual(data['features'][0]['geometry'], {'type': 'Point', 'coordinates': [12.49, 41.89]})
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(self.query(bbox='9,45,10,46', layers='site')['features'][0]['properties']['name'], 'Milano')
+        self.milan.geometry = '(7.68, 45.07)'
+        self.milan.save()
+        self.assertEqual(self.query(bbox='9,45,10,46', layers='site')['features'], [])
+        self.rome.delete()
+        self.assertEqual(self.query(bbox='12,41,13,42', layers='site')['features'], [])
+
+    def test_invalid_parameters(self):
+        for params in ({'bbox': '1,2,3'}, {'bbox': '3,0,1,1'}, {'bbox': '0,0,1,1', 'layers': 'roads'}):
+            self.assertEqual(self.client.get(reverse('api-spatial'), params).status_code, 400)
+
+
+class GeometryPyramidTests(TestCase):
+    """Large geometries are stored with simplified levels picked by zoom."""
+
+    def setUp(self):
+        reset_spatial_index()
+        angles = [2 * math.pi * step / 2000 for step in range(2000)]
+        ring = ','.join(f'({12.5 + 0.5 * math.cos(a):.6f},{42.0 + 0.5 * math.sin(a):.6f})' for a in angles)
+        self.research = Research.objects.create(title='Circle', geometry=f'({ring})')
+        self.point = Site.objects.create(site_name='Roma', geometry='(12.49, 41.89)')
+
+    def vertex_count(self, geometry):
+        return len(geometry['coordinates'][0])
+
+    def test_levels_are_stored_and_coarser_with_lower_zoom(self):
+        counts = [shapely.get_num_coordinates(load_shape(self.research, zoom)) for zoom in (3, 8, 12, 18)]
+        self.assertEqual(counts[-1], 2001)
+        self.assertEqual(counts, sorted(counts))
+        self.assertLess(counts[0], 100)
+        self.assertIsNotNone(self.research.geometry_wkb_z5)
+        self.assertIsNone(self.point.geometry_wkb_z5)
+        self.assertEqual(load_shape(self.point, 3).coords[0], (12.49, 41.89))
+
+    def test_spatial_api_picks_level_from_zoom_or_bbox(self):
+        def research_vertices(**params):
+            response = self.client.get(reverse('api-spatial'), {'layers': 'research', **params})
+            return self.vertex_count(json.loads(response.content)['features'][0]['geometry'])
+
+        overview = research_vertices(bbox='0,30,25,50')
+        detail = research_vertices(bbox='12.4,41.9,12.6,42.1')
+        self.assertLess(overview, 100)
+        self.assertTrue(overview < detail < 2001)
+        self.assertEqual(research_vertices(bbox='12.4,41.9,12.6,42.1', zoom=4), overview)
+        self.assertEqual(research_vertices(bbox='12.4,41.9,12.6,42.1', zoom=18), 2001)
+        response = self.client.get(reverse('api-spatial'), {'bbox': '0,0,1,1', 'zoom': '30'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_map_document_is_simplified(self):
+        cache.clear()
+        self.assertLess(self.vertex_count(json.loads(render_map(self.research))['geometry']), 2001)
+
+
+class ClusterApiTests(ResearchFixturesMixin, TestCase):
+    """Sites and evidence are clustered per zoom and expand to points when zoomed in."""
+
+    def setUp(self):
+        cache.clear()
+        reset_cluster_index()
+        self.sites = [
+            Site.objects.create(site_name=f'Roma {number}', geometry=f'({12.49 + number * 0.001}, 41.89)')
+            for number in range(5)
+        ]
+        self.milan = Site.objects.create(site_name='Milano', geometry='(9.19, 45.46)')
+        # Evidence without a usable geometry is placed by its lat/lon
+        self.evidence = self.create_evidence('Tomba')
+        self.evidence.geometry, self.evidence.lat, self.evidence.lon = '', 41.9, 12.5
+        self.evidence.save()
+
+    def query(self, **params):
+        response = self.client.get(reverse('api-clusters'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['features']
+
+    def counts(self, features):
+        return sorted(feature['properties'].get('count', 1) for feature in features)
+
+    def test_clusters_expand_with_zoom(self):
+        self.assertEqual(self.counts(self.query(z=5)), [1, 6])
+        points = self.query(z=18, bbox='12,41,13,42')
+        self.assertEqual(len(points), 6)
+        self.assertIn({'layer': 'evidence', 'id': self.evidence.id, 'name': 'Tomba'},
+                      [feature['properties'] for feature in points])
+        milan, = self.query(z=5, bbox='9,45,10,46')
+        self.assertEqual(milan['id'], f'site.{self.milan.id}')
+
+    def test_index_is_updated_in_place(self):
+        self.query(z=5)
+        index = get_cluster_index()
+        self.milan.geometry = '(12.495, 41.891)'
+        self.milan.save()
+        self.sites[0].delete()
+        self.assertIs(get_cluster_index(), index)
+        self.assertEqual(self.counts(self.query(z=5)), [6])
+        reset_cluster_index()
+        self.assertEqual(self.counts(self.query(z=5)), [6])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'z': 'x'}, {'z': 40}, {'z': 3, 'bbox': '1,2'}):
+            self.assertEqual(self.client.get(reverse('api-clusters'), params).status_code, 400)
+
+
+class NearbyApiTests(ResearchFixturesMixin, TestCase):
+    """Nearest sites and evidence by great-circle distance, kept current on writes."""
+
+    def setUp(self):
+        cache.clear()
+        reset_nearby_index()
+        self.rome = Site.objects.create(site_name='Roma', geometry='(12.4964, 41.9028)')
+        self.ostia = Site.objects.create(site_name='Ostia', geometry='(12.2920, 41.7556)')
+        self.milan = Site.objects.create(site_name='Milano', geometry='(9.19, 45.46)')
+        self.evidence = self.create_evidence('Tomba')
+        self.evidence.geometry, self.evidence.lat, self.evidence.lon = '', 41.9, 12.5
+        self.evidence.save()
+
+    def query(self, **params):
+        response = self.client.get(reverse('api-nearby'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['results']
+
+    def test_kdtree_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        lon, lat = rng.uniform(6, 19, 5000), rng.uniform(36, 47, 5000)
+        tree = KDTree(unit_vectors(lon, lat))
+        skip = rng.random(5000) < 0.2
+        for point in unit_vectors(rng.uniform(6, 19, 20), rng.uniform(36, 47, 20)):
+            distances, positions = tree.query(point, 7, skip=skip)
+            expected = np.linalg.norm(tree.points - point, axis=1)
+            expected[skip] = np.inf
+            self.assertEqual(sorted(positions.tolist()), sorted(np.argsort(expected)[:7].tolist()))
+            self.assertTrue(np.allclose(distances, np.sort(expected)[:7]))
+
+    def test_nearest_first_with_distances(self):
+        results = self.query(lat=41.9028, lon=12.4964, k=3)
+        self.assertEqual([(result['layer'], result['id']) for result in results],
+                         [('site', self.rome.id), ('evidence', self.evidence.id), ('site', self.ostia.id)])
+        self.assertEqual(results[0]['distance_m'], 0)
+        # Rome - Ostia is about 23 km
+        self.assertAlmostEqual(results[2]['distance_m'] / 1000, 23.4, delta=0.5)
+
+        self.assertEqual([result['name'] for result in self.query(lat=41.9, lon=12.5, radius_m=1000)],
+                         ['Tomba', 'Roma'])
+        self.assertEqual([result['name'] for result in self.query(lat=41.9, lon=12.5, layers='site', k=1)],
+                         ['Roma'])
+
+    def test_index_is_updated_in_place(self):
+        self.query(lat=45, lon=9)
+        index = get_nearby_index()
+        self.milan.geometry = '(12.4965, 41.9029)'
+        self.milan.save()
+        self.rome.delete()
+        new = Site.objects.create(site_name='Tivoli', geometry='(12.80, 41.96)')
+        self.assertIs(get_nearby_index(), index)
+        names = [result['name'] for result in self.query(lat=41.9028, lon=12.4964)]
+        self.assertEqual(names, ['Milano', 'Tomba', 'Ostia', 'Tivoli'])
+        reset_nearby_index()
+        self.assertEqual([result['name'] for result in self.query(lat=41.9028, lon=12.4964)], names)
+        self.assertEqual(self.query(lat=41.96, lon=12.80, k=1)[0]['id'], new.id)
+
+    def test_layer_emptied_by_deletes(self):
+        self.query(lat=41.9, lon=12.5)
+        index = get_nearby_index()
+        Site.objects.all().delete()
+        ArchaeologicalEvidence.objects.all().delete()
+        self.assertEqual(self.query(lat=41.9, lon=12.5), [])
+        index._compact()
+        self.assertEqual(self.query(lat=41.9, lon=12.5), [])
+
+    def test_empty_layers(self):
+        Site.objects.all().delete()
+        ArchaeologicalEvidence.objects.all().delete()
+        reset_nearby_index()
+        self.assertEqual(self.query(lat=41.9, lon=12.5), [])
+        self.assertEqual(KDTree([]).query(unit_vectors([12.5], [41.9])[0], 3)[1].tolist(), [])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'lat': 'x', 'lon': 1}, {'lat': 91, 'lon': 1}, {'lat': 1, 'lon': 1, 'k': 0},
+                       {'lat': 1, 'lon': 1, 'radius_m': -5}, {'lat': 1, 'lon': 1, 'layers': 'research'}):
+            self.assertEqual(self.client.get(reverse('api-nearby'), params).status_code, 400)
+
+
+class AdminUnitsTests(ResearchFixturesMixin, TestCase):
+    """Coordinates resolve to the nearest municipality with its province and region."""
+
+    def setUp(self):
+        cache.clear()
+        reset_municipality_index()
+        Country.objects.create(id=113, name_country='Italia')
+        lazio = Region.objects.create(id_region=12, denominazione_regione='Lazio')
+        lombardia = Region.objects.create(id_region=3, denominazione_regione='Lombardia')
+        self.roma_province = Province.objects.create(
+            id=58, codice_regione=lazio, sigla_provincia='RM', denominazione_provincia='Roma'
+        )
+        milano_province = Province.objects.create(
+            id=15, codice_regione=lombardia, sigla_provincia='MI', denominazione_provincia='Milano'
+        )
+        self.roma = Municipality.objects.create(
+            id=58091, denominazione_comune='Roma', lat=41.8931, lon=12.4828, id_province=self.roma_province
+        )
+        self.fiumicino = Municipality.objects.create(
+            id=58120, denominazione_comune='Fiumicino', lat=41.7711, lon=12.2275, id_province=self.roma_province
+        )
+        Municipality.objects.create(
+            id=15146, denominazione_comune='Milano', lat=45.4643, lon=9.1895, id_province=milano_province
+        )
+
+    def test_resolve_nearest_municipality(self):
+        result = resolve_admin_units(12.2920, 41.7556)  # Ostia antica
+        self.assertEqual(result['municipality'], {'id': 58120, 'name': 'Fiumicino'})
+        self.assertEqual(result['province'], {'id': 58, 'name': 'Roma', 'code': 'RM'})
+        self.assertEqual(result['region'], {'id': 12, 'name': 'Lazio'})
+        self.assertIsNone(resolve_admin_units(2.35, 48.85))  # Paris
+
+        response = self.client.get(reverse('api-admin-units'), {'lat': 45.47, 'lon': 9.2})
+        self.assertEqual(json.loads(response.content)['result']['region']['name'], 'Lombardia')
+        for params in ({}, {'lat': 'x', 'lon': 1}, {'lat': 100, 'lon': 1}):
+            self.assertEqual(self.client.get(reverse('api-admin-units'), params).status_code, 400)
+
+    def test_no_municipalities(self):
+        Municipality.objects.all().delete()
+        site = Site.objects.create(site_name='Ostia', geometry='(12.2920, 41.7556)')
+        self.assertIsNone(resolve_admin_units(12.2920, 41.7556))
+        response = self.client.get(reverse('api-admin-units'), {'lat': 41, 'lon': 12})
+        self.assertEqual((response.status_code, response.json()['result']), (200, None))
+        self.assertEqual(backfill_admin_units(Site), (1, 0, 1))
+        self.assertIsNone(Site.objects.get(pk=site.pk).id_municipality_id)
+
+    def test_index_follows_admin_changes(self):
+        self.assertEqual(resolve_admin_units(12.2920, 41.7556)['municipality']['name'], 'Fiumicino')
+        self.fiumicino.delete()
+        self.assertEqual(resolve_admin_units(12.2920, 41.7556)['municipality']['name'], 'Roma')
+
+    def test_backfill_command(self):
+        missing = Site.objects.create(site_name='Ostia', geometry='(12.2920, 41.7556)')
+        partial = Site.objects.create(site_name='Colosseo', lat=41.8902, lon=12.4922, id_province=self.roma_province,
+                                      id_municipality=self.fiumicino)
+        unplaced = Site.objects.create(site_name='Senza posizione')
+        evidence = self.create_evidence('Tomba')
+        evidence.geometry, evidence.lat, evidence.lon = '', 45.46, 9.19
+        evidence.save()
+
+        out = StringIO()
+        call_command('backfill_admin_units', '--dry-run', stdout=out)
+        self.assertIn('would update 2', out.getvalue())
+        self.assertIsNone(Site.objects.get(pk=missing.pk).id_municipality_id)
+
+        call_command('backfill_admin_units', stdout=StringIO())
+        missing.refresh_from_db()
+        self.assertEqual((missing.id_country_id, missing.id_region_id, missing.id_province_id,
+                          missing.id_municipality_id), (113, 12, 58, 58120))
+        # Codes already set are kept unless --overwrite
+        partial.refresh_from_db()
+        self.assertEqual((partial.id_region_id, partial.id_municipality_id), (12, 58120))
+        self.assertIsNone(Site.objects.get(pk=unplaced.pk).id_municipality_id)
+        self.assertEqual(ArchaeologicalEvidence.objects.get(pk=evidence.pk).id_municipality_id, 15146)
+
+        call_command('backfill_admin_units', '--overwrite', '--model', 'site', stdout=StringIO())
+        partial.refresh_from_db()
+        self.assertEqual(partial.id_municipality_id, 58091)
+
+
+class DensityApiTests(ResearchFixturesMixin, TestCase):
+    """Site and evidence positions are binned into a snapped, cached grid."""
+
+    def setUp(self):
+        cache.clear()
+        reset_density_points()
+        for index, (lon, lat) in enumerate([(12.49, 41.89), (12.491, 41.891), (12.6, 41.95), (9.19, 45.46)]):
+            Site.objects.create(site_name=f'Site {index}', geometry=f'({lon}, {lat})')
+
+    def grid(self, **params):
+        response = self.client.get(reverse('api-density'), params)
+        data = response.json()
+        counts = np.frombuffer(base64.b64decode(data['counts']), dtype='<u4').reshape(data['shape'])
+        return data, counts
+
+    def test_grid_counts(self):
+        data, counts = self.grid(layer='site', cell_km=5, bbox='12,41,13,42')
+        self.assertEqual((data['total'], data['max']), (3, 2))
+        minx, miny, maxx, maxy = data['bbox']
+        self.assertTrue(minx <= 12 and miny <= 41 and maxx >= 13 and maxy >= 42)
+        # North row first: the densest cell holds the two points near Rome
+        row, column = np.unravel_index(np.argmax(counts), counts.shape)
+        width, height = data['cell_size']
+        self.assertLessEqual(minx + column * width, 12.49)
+        self.assertGreaterEqual(maxy - row * height, 41.89)
+        self.assertLessEqual(maxy - (row + 1) * height, 41.89)
+        # Default bbox: the layer extent
+        self.assertEqual(self.grid(layer='site', cell_km=50)[0]['total'], 4)
+
+    def test_grid_follows_writes(self):
+        self.assertEqual(self.grid(cell_km=20)[0]['total'], 4)
+        Site.objects.create(site_name='Nuovo', geometry='(12.0, 42.0)')
+        self.assertEqual(self.grid(cell_km=20)[0]['total'], 5)
+        Site.objects.filter(site_name='Nuovo').get().delete()
+        self.assertEqual(self.grid(cell_km=20)[0]['total'], 4)
+
+    def test_png_and_errors(self):
+        response = self.client.get(reverse('api-density'), {'cell_km': 10, 'bbox': '12,41,13,42', 'format': 'png'})
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(len(response['X-Density-Bbox'].split(',')), 4)
+        self.assertEqual(response.content[:8], b'\x89PNG\r\n\x1a\n')
+        invalid = [{'layer': 'research'}, {'cell_km': '0'}, {'bbox': '1,2,3'}, {'cell_km': 0.1, 'bbox': '0,0,40,40'}]
+        for params in invalid:
+            self.assertEqual(self.client.get(reverse('api-density'), params).status_code, 400, params)
+
+
+class AdminAggregateTests(ResearchFixturesMixin, TestCase):
+    """Counts per admin unit, chronology and typology follow every write and match a full rebuild."""
+
+    def setUp(self):
+        discard_pending_aggregates()
+        self.lazio = Region.objects.create(id_region=12, denominazione_regione='Lazio')
+        self.umbria = Region.objects.create(id_region=10, denominazione_regione='Umbria')
+        self.roma = Province.objects.create(id=58, codice_regione=self.lazio, denominazione_provincia='Roma')
+        self.roman = Chronology.objects.create(id=5, chronological_period='Età romana')
+        self.medieval = Chronology.objects.create(id=6, chronological_period='Medioevo')
+        self.villa = Typology.objects.create(id=3, desc_typology='Villa')
+
+    def table(self):
+        return sorted(AdminAggregate.objects.values_list(
+            'layer', 'level', 'unit_id', 'chronology_id', 'typology_id', 'count'
+        ))
+
+    def assertMatchesRebuild(self):
+        incremental = self.table()
+        rebuild_admin_aggregates()
+        self.assertEqual(incremental, self.table())
+
+    def region_count(self, layer, region, chronology=AdminAggregate.ANY):
+        row = AdminAggregate.objects.filter(
+            layer=layer, level='region', unit_id=region.id_region, chronology_id=chronology,
+            typology_id=AdminAggregate.ANY,
+        ).first()
+        return row.count if row else 0
+
+    def test_incremental_updates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            site = Site.objects.create(site_name='Villa', id_region=self.lazio, id_province=self.roma)
+            Site.objects.create(site_name='Altro', id_region=self.lazio)
+        with self.captureOnCommitCallbacks(execute=True):
+            Interpretation.objects.create(id_site=site, id_chronology=self.roman, id_typology=self.villa)
+            Interpretation.objects.create(id_site=site, id_chronology=self.medieval, id_typology=self.villa)
+            evidence = self.create_evidence('Tomba')
+            evidence.id_region, evidence.id_chronology = self.lazio, self.roman
+            evidence.save()
+        self.assertEqual(self.region_count('site', self.lazio), 2)
+        self.assertEqual(self.region_count('site', self.lazio, self.roman.id), 1)
+        self.assertEqual(self.region_count('evidence', self.lazio, self.roman.id), 1)
+        self.assertMatchesRebuild()
+
+        # Moving a site to another region
+        with self.captureOnCommitCallbacks(execute=True):
+            site.id_region = self.umbria
+            site.save()
+        self.assertEqual((self.region_count('site', self.lazio), self.region_count('site', self.umbria)), (1, 1))
+        self.assertMatchesRebuild()
+
+        # Cascading delete of a site and its interpretations is counted once
+        with self.captureOnCommitCallbacks(execute=True):
+            site.delete()
+        self.assertEqual(self.region_count('site', self.umbria), 0)
+        self.assertFalse(AdminAggregate.objects.filter(unit_id=self.umbria.id_region).exists())
+        self.assertMatchesRebuild()
+
+    def test_api_and_home_page(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            site = Site.objects.create(site_name='Villa', id_region=self.lazio, id_province=self.roma)
+            Interpretation.objects.create(id_site=site, id_chronology=self.roman, id_typology=self.villa)
+            Site.objects.create(site_name='Senza cronologia', id_region=self.lazio)
+
+        data = self.client.get(reverse('api-admin-aggregates')).json()
+        self.assertEqual(data['results'], [{'layer': 'site', 'unit': {'id': 12, 'name': 'Lazio'}, 'count': 2}])
+        data = self.client.get(reverse('api-admin-aggregates'), {'level': 'province', 'by': 'chronology,typology'})
+        self.assertEqual(data.json()['results'], [{
+            'layer': 'site', 'unit': {'id': 58, 'name': 'Roma'}, 'count': 1,
+            'chronology': {'id': 5, 'name': 'Età romana'}, 'typology': {'id': 3, 'name': 'Villa'},
+        }])
+        data = self.client.get(reverse('api-admin-aggregates'), {'by': 'chronology'}).json()
+        counts = {(row['chronology'] or {}).get('id'): row['count'] for row in data['results']}
+        self.assertEqual(counts, {5: 1, None: 1})
+        self.assertEqual(self.client.get(reverse('api-admin-aggregates'), {'level': 'country'}).status_code, 400)
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['region_totals'], [{'id': 12, 'name': 'Lazio', 'sites': 2, 'evidence': 0}])
+
+    def test_bulk_import_rebuilds(self):
+        self.create_evidence('Esistente')
+        with self.captureOnCommitCallbacks(execute=True):
+            geometries_bulk_changed.send(sender=ArchaeologicalEvidence, bbox=None)
+        self.assertFalse(AdminAggregate.objects.exists())  # no admin unit set
+        ArchaeologicalEvidence.objects.update(id_region=self.lazio)
+        out = StringIO()
+        call_command('refresh_admin_aggregates', stdout=out)
+        self.assertIn('Wrote 4 aggregate rows', out.getvalue())
+        self.assertEqual(self.region_count('evidence', self.lazio), 1)
+
+
+class VectorTileTests(TestCase):
+    """Tiles are encoded as MVT, cached on disk and invalidated per feature."""
+
+    def setUp(self):
+        reset_spatial_index()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(TILE_CACHE_DIR=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.rome = Site.objects.create(site_name='Roma', geometry='(12.49, 41.89)')
+        self.milan = Site.objects.create(site_name='Milano', geometry='(9.19, 45.46)')
+        self.area = Research.objects.create(
+            title='Lazio survey', geometry='((12.0,41.5),(13.0,41.5),(13.0,42.5),(12.0,42.5))'
+        )
+
+    def tile_of(self, lon, lat, zoom):
+        x, y = mercator(np.array([lon]), np.array([lat]))
+        return zoom, int(x[0] * 2 ** zoom), int(y[0] * 2 ** zoom)
+
+    def get_tile(self, layer, zoom, x, y):
+        response = self.client.get(reverse('vector-tile', args=[layer, zoom, x, y]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        return response.content
+
+    def decode(self, data, layer, zoom, x, y):
+        """Read a tile back with GDAL's MVT driver (georeferenced from the z/x/y path)."""
+        path = os.path.join(self.directory.name, 'decoded', str(zoom), str(x), f'{y}.pbf')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.write(data)
+        return pyogrio.read_dataframe(path, layer=layer).to_crs(4326)
+
+    def test_tile_contains_features(self):
+        tile = self.tile_of(12.49, 41.89, 8)
+        sites = self.decode(self.get_tile('site', *tile), 'site', *tile)
+        self.assertEqual(list(sites['name']), ['Roma'])
+        self.assertEqual(list(sites['mvt_id']), [self.rome.id])
+        self.assertAlmostEqual(sites.geometry[0].x, 12.49, places=3)
+        tile = self.tile_of(12.49, 41.89, 6)  # holds the whole research area
+        research = self.decode(self.get_tile('research', *tile), 'research', *tile)
+        self.assertEqual(research.geometry[0].geom_type, 'Polygon')
+        self.assertAlmostEqual(research.geometry[0].area, 1.0, places=2)
+
+    def test_tiles_are_cached_and_deduplicated(self):
+        first = self.tile_of(0.0, 0.0, 6)
+        second = self.tile_of(20.0, 0.0, 6)
+        self.get_tile('site', *first)
+        self.get_tile('site', *second)
+        path = os.path.join(self.directory.name, 'site', *map(str, first[:2]), f'{first[2]}.mvt')
+        self.assertEqual(os.stat(path).st_nlink, 3)  # both empty tiles link to one object
+
+    def test_save_invalidates_touched_tiles_only(self):
+        rome_tile = self.tile_of(12.49, 41.89, 10)
+        milan_tile = self.tile_of(9.19, 45.46, 10)
+        self.get_tile('site', *rome_tile)
+        self.get_tile('site', *milan_tile)
+
+        def cached(zoom, x, y):
+            return os.path.exists(os.path.join(self.directory.name, 'site', str(zoom), str(x), f'{y}.mvt'))
+
+        self.milan.geometry = '(7.68, 45.07)'
+        self.milan.save()
+        self.assertFalse(cached(*milan_tile))
+        self.assertTrue(cached(*rome_tile))
+        self.assertEqual(len(self.decode(self.get_tile('site', *milan_tile), 'site', *milan_tile)), 0)
+        self.rome.delete()
+        self.assertFalse(cached(*rome_tile))
+        clear_tile_cache()
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, '_objects')), [])
+
+    def test_unknown_tiles(self):
+        for args in (['roads', 0, 0, 0], ['site', 2, 4, 0], ['site', 30, 0, 0]):
+            self.assertEqual(self.client.get(reverse('vector-tile', args=args)).status_code, 404)
+
+
+class SpatialJoinTests(ResearchFixturesMixin, TestCase):
+    """Sites and evidence inside research areas are suggested as links."""
+
+    def setUp(self):
+        self.area = Research.objects.create(
+            title='Lazio survey', geometry='((12.0,41.5),(13.0,41.5),(13.0,42.5),(12.0,42.5))'
+        )
+        self.line = Research.objects.create(title='Transect', geometry='((12.0,41.0),(13.0,41.0))')
+        self.inside = Site.objects.create(site_name='Roma', geometry='(12.49, 41.89)')
+        self.linked = Site.objects.create(site_name='Ostia', geometry='(12.29, 41.75)')
+        self.outside = Site.objects.create(site_name='Milano', geometry='(9.19, 45.46)')
+        SiteResearch.objects.create(id_site=self.linked, id_research=self.area)
+        self.evidence = self.create_evidence('Tomba')
+        self.evidence.geometry = '((12.5,42.0))'
+        self.evidence.save()
+
+    def test_join_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        lon, lat = rng.uniform(0, 10, 2000), rng.uniform(0, 10, 2000)
+        polygons = shapely.buffer(shapely.points(rng.uniform(0, 10, 50), rng.uniform(0, 10, 50)), 0.5)
+        points, matched = join_points(lon, lat, polygons)
+        expected = np.argwhere(shapely.contains_xy(polygons[None, :], lon[:, None], lat[:, None]))
+        self.assertEqual(sorted(zip(points.tolist(), matched.tolist())), sorted(map(tuple, expected.tolist())))
+
+    def test_suggest_and_create_links(self):
+        site, evidence = suggest_research_links()
+        self.assertEqual(list(zip(site.point_ids, site.research_ids)), [(self.inside.id, self.area.id)])
+        self.assertEqual(list(zip(evidence.point_ids, evidence.research_ids)), [(self.evidence.id, self.area.id)])
+
+        out = StringIO()
+        call_command('suggest_research_links', '--create', stdout=out)
+        self.assertIn('site: created 1 links.', out.getvalue())
+        self.assertTrue(SiteResearch.objects.filter(id_site=self.inside, id_research=self.area).exists())
+        self.assertTrue(ArchEvResearch.objects.filter(
+            id_archaeological_evidence=self.evidence, id_research=self.area.id
+        ).exists())
+        self.assertEqual([len(suggestion.point_ids) for suggestion in suggest_research_links()], [0, 0])
+
+    def test_create_skips_existing_links(self):
+        suggestions = suggest_research_links(include_existing=True)
+        self.assertEqual(create_research_links(suggestions), {'site': 1, 'evidence': 1})
+        self.assertEqual(create_research_links(suggest_research_links(include_existing=True)),
+                         {'site': 0, 'evidence': 0})
+        self.assertEqual(ArchEvResearch.objects.filter(id_archaeological_evidence=self.evidence).count(), 1)
+        self.assertEqual(SiteResearch.objects.filter(id_research=self.area).count(), 2)
+
+
+class GeometryParserTests(TestCase):
+    """Native, WKT and GeoJSON geometries parse to the same shapes one by one and in bulk."""
+
+    SAMPLES = [
+        '((-122.4,37.7),(-122.3,37.7),(-122.3,37.8))',
+        '(-3.5, 40.2)',
+        '((1e1,-.5),(2,3))',
+        '(((0,0),(10,0),(10,10),(0,10)),((2,2),(3,2),(3,3)))',
+        '((((0,0),(1,0),(1,1))),(((5,5),(6,5),(6,6))))',
+        'POLYGON ((0 0, 1 0, 1 1, 0 0))',
+        '{"type": "Point", "coordinates": [-70.1, -33.4]}',
+        '((1,2),(3))',
+        '',
+    ]
+
+    def test_negative_coordinates_are_kept(self):
+        self.assertEqual(parse_geometry_string('((-1.5,-40.0),(2.5,-40.0),(2.5,-44.0))')[0], [-40.0, -1.5])
+        self.assertEqual(parse_coordinates('(-3.5, 40.2)').tolist(), [[-3.5, 40.2]])
+
+    def test_holes_and_multipolygons(self):
+        polygon = parse_geometry(self.SAMPLES[3])
+        self.assertEqual((polygon.geom_type, len(polygon.interiors)), ('Polygon', 1))
+        self.assertEqual(parse_geometry(self.SAMPLES[4]).geom_type, 'MultiPolygon')
+
+    def test_format_round_trip(self):
+        for value in self.SAMPLES[:7]:
+            shape = parse_geometry(value)
+            self.assertTrue(parse_geometry(format_geometry(shape)).equals(shape), value)
+        self.assertTrue(format_geometry(shape).startswith('('))
+        self.assertIsNone(format_geometry(None))
+
+    def test_invalid_values(self):
+        self.assertIsNone(parse_geometry('((1,2),(3))'))
+        self.assertIsNone(parse_geometry('(((0,0),(1,0)))'))
+        self.assertIsNone(parse_geometry(None))
+
+    def test_batch_matches_single_parse(self):
+        shapes = parse_geometries(self.SAMPLES)
+        for value, shape in zip(self.SAMPLES, shapes):
+            expected = parse_geometry(value)
+            if expected is None:
+                self.assertIsNone(shape)
+            else:
+                self.assertTrue(shape.equals(expected), value)
+
+
+class IngestTests(ResearchFixturesMixin, TestCase):
+    """Survey files are streamed in batches, reprojected and stored with every part and hole."""
+
+    def setUp(self):
+        cache.clear()
+        reset_nearby_index()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # Monte Mario / Italy zone 2 (EPSG:3004) around Rome
+        to_3004 = pyproj.Transformer.from_crs('EPSG:4326', 'EPSG:3004', always_xy=True)
+        x, y = to_3004.transform(12.49, 41.89)
+        holed = shapely.Polygon(
+            [(x, y), (x + 1000, y), (x + 1000, y + 1000), (x, y + 1000)],
+            [[(x + 400, y + 400), (x + 600, y + 400), (x + 600, y + 600), (x + 400, y + 600)]],
+        )
+        parts = shapely.MultiPolygon([shapely.box(x + 5000, y, x + 5100, y + 100),
+                                      shapely.box(x + 6000, y, x + 6100, y + 100)])
+        folder = os.path.join(self.directory.name, 'survey')
+        os.mkdir(folder)
+        pyogrio.raw.write(
+            os.path.join(folder, 'survey.shp'),
+            geometry=np.array([shapely.to_wkb(holed), shapely.to_wkb(parts), None], dtype=object),
+            field_data=[np.array(['Villa', 'Necropoli', 'Vuoto'], dtype=object), np.array([20, 35, 0])],
+            fields=['NOME', 'QUOTA'], geometry_type='MultiPolygon', crs='EPSG:3004', driver='ESRI Shapefile',
+        )
+        self.archive = os.path.join(self.directory.name, 'survey.zip')
+        with zipfile.ZipFile(self.archive, 'w') as archive:
+            for name in os.listdir(folder):
+                archive.write(os.path.join(folder, name), f'survey/{name}')
+
+    def test_zipped_shapefile_is_reprojected_and_kept_whole(self):
+        path = dataset_path(self.archive)
+        result = ingest_features(path, 'site', mapping={'site_name': 'NOME', 'elevation': 'QUOTA'}, batch_size=2)
+        self.assertEqual(result, (2, 1, 0))
+        villa, necropoli = Site.objects.order_by('site_name').reverse()
+        self.assertEqual(villa.elevation, 20)
+        shape = load_shape(villa)
+        self.assertEqual(len(shape.interiors), 1)
+        self.assertAlmostEqual(shape.bounds[0], 12.49, places=3)
+        self.assertAlmostEqual(float(villa.lat), villa.centroid_y, places=5)
+        self.assertEqual(len(load_shape(necropoli).geoms), 2)
+        # Bulk writes reach the per-process indexes
+        self.assertEqual(self.client.get(reverse('api-nearby'), {'lat': 41.89, 'lon': 12.49, 'k': 1}).json()
+                         ['results'][0]['name'], 'Villa')
+
+    def test_geojson_is_read_in_one_pass(self):
+        path = os.path.join(self.directory.name, 'points.geojson')
+        features = [{'type': 'Feature', 'properties': {'NOME': f'P{index}'},
+                     'geometry': {'type': 'Point', 'coordinates': [12 + index / 10, 41.9]}} for index in range(5)]
+        with open(path, 'w') as handle:
+            json.dump({'type': 'FeatureCollection', 'features': features}, handle)
+        with mock.patch('frontend.ingest.open_arrow', wraps=open_arrow) as opened:
+            batches = list(read_feature_batches(path, batch_size=2))
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual([len(batch.fids) for batch in batches], [2, 2, 1])
+        self.assertEqual([name for batch in batches for name in batch.attributes['NOME']], [f'P{i}' for i in range(5)])
+        self.assertAlmostEqual(batches[-1].shapes[0].x, 12.4)
+
+    def test_mapping_is_validated(self):
+        path = dataset_path(self.archive)
+        with self.assertRaisesRegex(ValueError, 'site_name'):
+            ingest_features(path, 'site')
+        with self.assertRaisesRegex(ValueError, 'MISSING'):
+            ingest_features(path, 'site', mapping={'site_name': 'MISSING'})
+        with self.assertRaisesRegex(ValueError, 'id_positioning_mode'):
+            ingest_features(path, 'evidence', mapping={'evidence_name': 'NOME'})
+        self.assertFalse(Site.objects.exists())
+
+    def test_command_with_defaults(self):
+        out = StringIO()
+        call_command(
+            'import_features', self.archive, '--layer', 'evidence', '--map', 'evidence_name=NOME',
+            '--set', f'id_positioning_mode={self.positioning_mode.id}',
+            '--set', f'id_positional_accuracy={self.positional_accuracy.id}',
+            '--set', f'id_first_discovery_method={self.discovery_method.id}', stdout=out,
+        )
+        self.assertIn('created 2 rows', out.getvalue())
+        self.assertEqual(ArchaeologicalEvidence.objects.filter(id_positioning_mode=self.positioning_mode).count(), 2)
+
+    def test_preview_keeps_holes_and_parts(self):
+        with open(self.archive, 'rb') as handle:
+            response = self.client.post(reverse('preview_shapefile'), {'shapefile': handle})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        wait_for_preview(job_id, timeout=30)
+        data = self.client.get(response.json()['poll_url']).json()
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual((data['feature_count'], data['crs']), (3, 'EPSG:3004'))
+        self.assertAlmostEqual(data['bbox'][0], 12.49, places=3)
+        shape = parse_geometry(data['geometry'])
+        self.assertEqual(shape.geom_type, 'MultiPolygon')
+        self.assertEqual(len(shape.geoms), 3)
+        # The forms draw the GeoJSON copy and fill lat/lon from the centroid
+        self.assertEqual((data['geojson']['type'], len(data['geojson']['coordinates'])), ('MultiPolygon', 3))
+        self.assertTrue(shapely.from_geojson(json.dumps(data['geojson'])).equals_exact(shape, 1e-5))
+        minx, miny, maxx, maxy = data['bbox']
+        self.assertTrue(minx <= data['centroid'][0] <= maxx and miny <= data['centroid'][1] <= maxy)
+
+    def test_preview_is_cached_by_content(self):
+        with open(self.archive, 'rb') as handle:
+            job_id = self.client.post(reverse('preview_shapefile'), {'shapefile': handle}).json()['job_id']
+        wait_for_preview(job_id, timeout=30)
+        # Same bytes under another name: answered from the cache without a job
+        with open(self.archive, 'rb') as handle:
+            upload = SimpleUploadedFile('renamed.zip', handle.read())
+        response = self.client.post(reverse('preview_shapefile'), {'shapefile': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['job_id'], response.json()['feature_count']), (job_id, 3))
+
+    def test_per_process_cache_is_reported(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['frontend.W001'])
+
+    @override_settings(PREVIEW_WORKERS=0)
+    def test_preview_accepts_posts_without_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        with open(self.archive, 'rb') as handle:
+            response = client.post(reverse('preview_shapefile'), {'shapefile': handle})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['status'], response.json()['feature_count']), ('done', 3))
+
+    @override_settings(PREVIEW_WORKERS=0)
+    def test_preview_errors(self):
+        response = self.client.post(reverse('preview_shapefile'),
+                                    {'shapefile': SimpleUploadedFile('notes.txt', b'no geometry')})
+        self.assertEqual(response.status_code, 400)
+        empty = SimpleUploadedFile('empty.geojson', b'{"type": "FeatureCollection", "features": []}')
+        response = self.client.post(reverse('preview_shapefile'), {'shapefile': empty})
+        self.assertEqual((response.status_code, response.json()['status']), (400, 'error'))
+        self.assertEqual(self.client.get(reverse('preview_shapefile_job', args=['0' * 64])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('preview_shapefile_job', args=['unknown'])).status_code, 404)
+
+
+class ExportTests(ResearchFixturesMixin, TestCase):
+    """Layers are exported in batches as GeoJSON, GeoPackage and CSV, with the catalog filters."""
+
+    def setUp(self):
+        self.lazio = Region.objects.create(id_region=12, denominazione_regione='Lazio')
+        self.roman = Chronology.objects.create(id=5, chronological_period='Età romana')
+        self.research = self.create_research(2)
+        self.other = Research.objects.create(title='Altra ricerca', geometry='((9.0,45.0),(9.1,45.1))')
+        self.villa = Site.objects.create(site_name='Villa', geometry='(12.49, 41.89)', id_region=self.lazio)
+        SiteResearch.objects.create(id_site=self.villa, id_research=self.other)
+        Interpretation.objects.create(id_site=self.villa, id_chronology=self.roman)
+        Site.objects.filter(site_name='Site 0').update(geometry_wkb=None, geometry='(12.3, 41.7)')
+
+    def test_geojson_streams_every_row(self):
+        response = self.client.get(reverse('export-layer', args=['site', 'geojson']))
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        by_name = {feature['properties']['name']: feature for feature in data['features']}
+        self.assertEqual(sorted(by_name), ['Site 0', 'Site 1', 'Villa'])
+        self.assertEqual(by_name['Villa']['properties']['region'], 'Lazio')
+        # Rows not yet backfilled are parsed from their text geometry
+        self.assertEqual(by_name['Site 0']['geometry'], {'type': 'Point', 'coordinates': [12.3, 41.7]})
+        self.assertIsNone(by_name['Site 1']['geometry'])
+
+    def test_catalog_filters(self):
+        def names(layer, **params):
+            response = self.client.get(reverse('export-layer', args=[layer, 'csv']), params)
+            rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+            return sorted(row.get('name') or row['title'] for row in rows)
+
+        self.assertEqual(names('site', research=self.research.id), ['Site 0', 'Site 1'])
+        self.assertEqual(names('site', region=self.lazio.id_region), ['Villa'])
+        self.assertEqual(names('site', chronology=self.roman.id), ['Villa'])
+        self.assertEqual(names('evidence', research=self.research.id), [
+            'Direct evidence 0', 'Direct evidence 1', 'Site evidence 0', 'Site evidence 1',
+        ])
+        self.assertEqual(names('research', region=self.lazio.id_region), ['Altra ricerca'])
+        self.assertEqual(names('research', q='Altra'), ['Altra ricerca'])
+        response = self.client.get(reverse('export-layer', args=['site', 'csv']), {'region': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('export-layer', args=['site', 'shp'])).status_code, 404)
+
+    def test_geopackage_response_and_command(self):
+        response = self.client.get(reverse('export-layer', args=['evidence', 'gpkg']), {'research': self.research.id})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'download.gpkg')
+            with open(path, 'wb') as handle:
+                handle.write(b''.join(response.streaming_content))
+            info = pyogrio.read_info(path)
+            self.assertEqual((info['layer_name'], info['features'], info['crs']), ('evidence', 4, 'EPSG:4326'))
+
+            path = os.path.join(directory, 'sites.gpkg')
+            out = StringIO()
+            call_command('export_layer', 'site', path, '--region', str(self.lazio.id_region), '--batch-size', '1',
+                         stdout=out)
+            self.assertIn('wrote 1 features', out.getvalue())
+            _, _, geometries, fields = pyogrio.raw.read(path)
+            self.assertEqual(shapely.from_wkb(geometries[0]), shapely.Point(12.49, 41.89))
+            self.assertEqual(fields[1][0], 'Villa')
+
+
+class MapCacheTests(TestCase):
+    """Rendered maps are reused from memory or disk and dropped when the row changes."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(MAP_CACHE_DIR=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        reset_map_cache_stats()
+        self.research = Research.objects.create(title='Area', geometry='((12.0,41.5),(13.0,41.5),(13.0,42.5))')
+
+    def cached_files(self):
+        return os.listdir(self.directory.name)
+
+    def test_second_render_is_a_hit(self):
+        document = render_map(self.research, 'Area')
+        self.assertEqual(json.loads(document)['properties']['name'], 'Area')
+        self.assertEqual(render_map(self.research, 'Area'), document)
+        cache.delete(map_cache_key(self.research, 'Area'))
+        self.assertEqual(render_map(self.research, 'Area'), document)
+        stats = get_map_cache_stats()
+        self.assertEqual((stats['misses'], stats['memory_hits'], stats['disk_hits']), (1, 1, 1))
+
+    def test_hits_do_not_write_and_saves_still_invalidate(self):
+        document = render_map(self.research)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set, \
+                mock.patch.object(cache, 'set_many', wraps=cache.set_many) as cache_set_many:
+            self.assertEqual(render_map(self.research), document)
+        written = [call.args[0] for call in cache_set.call_args_list]
+        written += [key for call in cache_set_many.call_args_list for key in call.args[0]]
+        self.assertEqual([key for key in written if ':stats:' not in key], [])
+        self.research.title = 'Renamed'
+        self.research.save()
+        self.assertFalse(self.cached_files())
+        self.assertEqual(json.loads(render_map(self.research))['properties']['name'], 'Renamed')
+
+    def test_key_covers_title(self):
+        render_map(self.research, 'Area')
+        render_map(self.research, 'Other title')
+        render_map(self.research)
+        self.assertEqual(get_map_cache_stats()['misses'], 2)
+
+    def test_key_covers_row(self):
+        twin = Research.objects.create(title='Area', geometry=self.research.geometry)
+        self.assertEqual(json.loads(render_map(self.research))['properties']['id'], self.research.pk)
+        self.assertEqual(json.loads(render_map(twin))['properties']['id'], twin.pk)
+        self.assertNotEqual(map_url(twin), map_url(self.research))
+
+    def test_disk_tier_is_scanned_once_per_budget_slice(self):
+        with mock.patch('frontend.map_cache.evict_disk_cache') as evict:
+            for index in range(3):
+                render_map(self.research, f'Title {index}')
+        self.assertLessEqual(evict.call_count, 1)
+
+    def test_coordinates_are_quantized(self):
+        research = Research.objects.create(
+            title='Noisy', geometry='((12.0000001,41.5),(12.00002,41.50001),(13.0,41.5),(13.0,42.5))'
+        )
+        coordinates = json.loads(render_map(research))['geometry']['coordinates'][0]
+        self.assertEqual(len(coordinates), 4)  # vertices in the same grid cell are merged
+        self.assertIn([12.0, 41.5], coordinates)
+        for x, y in coordinates:
+            self.assertEqual((x, y), (round(x, 4), round(y, 4)))
+
+    def test_save_invalidates_entry(self):
+        render_map(self.research, 'Area')
+        self.assertEqual(len(self.cached_files()), 1)
+        self.research.save()
+        self.assertEqual(self.cached_files(), [])
+        render_map(self.research, 'Area')
+        self.assertEqual(get_map_cache_stats()['misses'], 2)
+
+    def test_disk_tier_evicts_least_recently_used(self):
+        render_map(self.research, 'First')
+        first, = self.cached_files()
+        os.utime(os.path.join(self.directory.name, first), (1, 1))
+        render_map(self.research, 'Second')
+        size = max(os.path.getsize(os.path.join(self.directory.name, name)) for name in self.cached_files())
+        self.assertEqual(evict_disk_cache(max_bytes=size), 1)
+        self.assertNotIn(first, self.cached_files())
+
+
+class MapFragmentTests(TestCase):
+    """Maps are served from their own versioned, conditionally cacheable endpoint."""
+
+    def setUp(self):
+        cache.clear()
+        self.research = Research.objects.create(title='Area', geometry='((12.0,41.5),(13.0,41.5),(13.0,42.5))')
+
+    def test_geojson_feature_with_versioned_url(self):
+        url = map_url(self.research)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        self.assertIn('immutable', response['Cache-Control'])
+        feature = json.loads(response.content)
+        self.assertEqual(feature['properties'], {'layer': 'research', 'id': self.research.pk, 'name': 'Area'})
+        self.assertEqual(feature['geometry']['type'], 'Polygon')
+
+    def test_only_the_current_version_is_immutable(self):
+        path = reverse('map-fragment', kwargs={'kind': 'research', 'pk': self.research.pk, 'map_format': 'geojson'})
+        version = map_url(self.research).split('?v=')[1]
+        for stale in ('', version[:1], version[:8], version + '0', version[:15] + 'x'):
+            response = self.client.get(path, {'v': stale})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_etag_revalidation(self):
+        path = reverse('map-fragment', kwargs={'kind': 'research', 'pk': self.research.pk, 'map_format': 'geojson'})
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.research.geometry = '(12.5,42.0)'
+        self.research.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_html_fragment_and_unknown_maps(self):
+        response = self.client.get(map_url(self.research, 'html'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'map_loader.js', response.content)
+        self.assertIn(b'data-geojson=', response.content)
+        self.assertNotIn(b'folium', response.content)
+        for kind, map_format in (('unknown', 'geojson'), ('research', 'kml')):
+            path = reverse('map-fragment', kwargs={'kind': kind, 'pk': self.research.pk, 'map_format': map_format})
+            self.assertEqual(self.client.get(path).status_code, 404)
+        self.assertIsNone(map_url(Research.objects.create(title='No geometry')))
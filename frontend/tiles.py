@@ -0,0 +1,268 @@
+"""
+Vector tiles of the site, evidence and research layers.
+/tiles/<layer>/<z>/<x>/<y>.mvt is encoded from the in-memory layer index
+(spatial.get_layer_index), using the simplification level matching the zoom,
+and written to TILE_CACHE_DIR at the same relative path so nginx can serve
+hot tiles straight from disk. Tile files are hard links into a
+content-addressed object store (_objects/<sha256>.mvt), so identical tiles,
+empty ones above all, are stored once.
+
+Saving or deleting a row deletes only the cached tiles its old and new
+bounding boxes touch.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import shapely
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from shapely.errors import GEOSException
+
+from .models import Research, Site, ArchaeologicalEvidence
+from .spatial import LAYER_BY_MODEL, geometries_bulk_changed, get_layer_index, mercator, pyramid_level, tile_bounds
+from .utils.mvt import encode_layer, encode_tile
+
+logger = logging.getLogger(__name__)
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64  # in tile units; features this close to the edge are drawn on both tiles
+OBJECTS_DIR = '_objects'
+BBOX_FIELDS = ('bbox_minx', 'bbox_miny', 'bbox_maxx', 'bbox_maxy')
+
+
+def tile_cache_dir():
+    return getattr(settings, 'TILE_CACHE_DIR', None)
+
+
+def tile_path(layer, zoom, x, y):
+    directory = tile_cache_dir()
+    if not directory:
+        return None
+    return os.path.join(directory, layer, str(zoom), str(x), f'{y}.mvt')
+
+
+def _object_path(directory, digest):
+    return os.path.join(directory, OBJECTS_DIR, digest[:2], f'{digest}.mvt')
+
+
+def _snap(shapes):
+    """Round tile coordinates to integers, row by row when a geometry is invalid."""
+    try:
+        return shapely.set_precision(shapes, 1.0)
+    except GEOSException:
+        snapped = np.empty(len(shapes), dtype=object)
+        for position, shape in enumerate(shapes):
+            try:
+                snapped[position] = shapely.set_precision(shape, 1.0)
+            except GEOSException:
+                snapped[position] = shapely.transform(shape, np.rint)
+        return snapped
+
+
+def render_tile(layer, zoom, x, y):
+    """
+    Encode one tile of a layer.
+
+    Returns:
+        MVT bytes (a tile with an empty layer when nothing intersects it)
+    """
+    index = get_layer_index(layer)
+    minx, miny, maxx, maxy = tile_bounds(zoom, x, y)
+    pad_x = (maxx - minx) * TILE_BUFFER / TILE_EXTENT
+    pad_y = (maxy - miny) * TILE_BUFFER / TILE_EXTENT
+    positions = index.query((minx - pad_x, miny - pad_y, maxx + pad_x, maxy + pad_y))
+    if not positions:
+        return encode_tile([encode_layer(layer, [], TILE_EXTENT)])
+
+    level = pyramid_level(zoom)
+    shapes = (index.shapes if level is None else index.levels[level])[positions]
+    tiles = 2 ** zoom
+
+    def to_tile(coords):
+        tile_x, tile_y = mercator(coords[:, 0], coords[:, 1])
+        return np.column_stack([(tile_x * tiles - x) * TILE_EXTENT, (tile_y * tiles - y) * TILE_EXTENT])
+
+    projected = shapely.transform(shapes, to_tile)
+    clipped = shapely.clip_by_rect(
+        projected, -TILE_BUFFER, -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER, TILE_EXTENT + TILE_BUFFER
+    )
+    features = (
+        (index.ids[position], shape, {'name': index.names[position]})
+        for position, shape in zip(positions, _snap(clipped))
+    )
+    return encode_tile([encode_layer(layer, features, TILE_EXTENT)])
+
+
+def store_tile(layer, zoom, x, y, data):
+    """Write a tile to the disk cache as a hard link to its content-addressed object."""
+    directory = tile_cache_dir()
+    if not directory:
+        return
+    digest = hashlib.sha256(data).hexdigest()
+    object_path = _object_path(directory, digest)
+    path = tile_path(layer, zoom, x, y)
+    try:
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(object_path), delete=False) as handle:
+                handle.write(data)
+            os.replace(handle.name, object_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.link(object_path, temporary)
+        except OSError:
+            shutil.copyfile(object_path, temporary)
+        os.replace(temporary, path)
+    except OSError as e:
+        logger.warning(f"Could not write tile {path}: {e}")
+
+
+def get_tile(layer, zoom, x, y):
+    """Return a tile from the disk cache, rendering and storing it on a miss."""
+    path = tile_path(layer, zoom, x, y)
+    if path:
+        try:
+            with open(path, 'rb') as handle:
+                return handle.read()
+        except OSError:
+            pass
+    data = render_tile(layer, zoom, x, y)
+    store_tile(layer, zoom, x, y, data)
+    return data
+
+
+def _tile_range(bbox, zoom):
+    """Inclusive x and y tile ranges covering bbox (with the tile buffer) at a zoom."""
+    minx, miny, maxx, maxy = bbox
+    tiles = 2 ** zoom
+    (left, right), (top, bottom) = mercator(np.array([minx, maxx]), np.array([maxy, miny]))
+    margin = TILE_BUFFER / TILE_EXTENT
+    first_x, last_x = int(left * tiles - margin), int(right * tiles + margin)
+    first_y, last_y = int(top * tiles - margin), int(bottom * tiles + margin)
+    return (max(first_x, 0), min(last_x, tiles - 1)), (max(first_y, 0), min(last_y, tiles - 1))
+
+
+def _numbered_entries(path):
+    try:
+        with os.scandir(path) as scan:
+            for entry in scan:
+                name = entry.name[:-4] if entry.name.endswith('.mvt') else entry.name
+                if name.isdigit():
+                    yield int(name), entry.path
+    except OSError:
+        return
+
+
+def invalidate_tiles(layer, bbox):
+    """
+    Delete the cached tiles of a layer touching bbox (minx, miny, maxx, maxy), at every zoom.
+    Only the directories present in the cache are visited.
+
+    Returns:
+        Number of tiles removed
+    """
+    directory = tile_cache_dir()
+    if not directory or bbox is None or None in bbox:
+        return 0
+    removed = 0
+    for zoom, zoom_path in _numbered_entries(os.path.join(directory, layer)):
+        (first_x, last_x), (first_y, last_y) = _tile_range(bbox, zoom)
+        for x, x_path in _numbered_entries(zoom_path):
+            if not first_x <= x <= last_x:
+                continue
+            for y, y_path in _numbered_entries(x_path):
+                if first_y <= y <= last_y:
+                    try:
+                        os.remove(y_path)
+                        removed += 1
+                    except OSError:
+                        pass
+    return removed
+
+
+def prune_tile_objects():
+    """
+    Delete stored objects no tile links to any more.
+
+    Returns:
+        Number of objects removed
+    """
+    directory = tile_cache_dir()
+    if not directory:
+        return 0
+    removed = 0
+    objects = os.path.join(directory, OBJECTS_DIR)
+    for root, _, files in os.walk(objects, topdown=False):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.stat(path).st_nlink <= 1:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        if root != objects:
+            try:
+                os.rmdir(root)  # only succeeds once the prefix directory is empty
+            except OSError:
+                pass
+    return removed
+
+
+def clear_tile_cache(layer=None):
+    """Delete the cached tiles of one layer (or all) and the objects left unreferenced."""
+    directory = tile_cache_dir()
+    if not directory:
+        return
+    layers = [layer] if layer else list(LAYER_BY_MODEL.values())
+    for name in layers:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    prune_tile_objects()
+
+
+def _bbox(instance):
+    return tuple(getattr(instance, field) for field in BBOX_FIELDS)
+
+
+# Per-feature invalidation
+@receiver(pre_save, sender=Research)
+@receiver(pre_save, sender=Site)
+@receiver(pre_save, sender=ArchaeologicalEvidence)
+def remember_tile_bbox(sender, instance, **kwargs):
+    """Keep the stored bbox: tiles showing the old position must go as well."""
+    instance._tile_bbox = None
+    if instance.pk and tile_cache_dir():
+        instance._tile_bbox = sender.objects.filter(pk=instance.pk).values_list(*BBOX_FIELDS).first()
+
+
+@receiver(post_save, sender=Research)
+@receiver(post_save, sender=Site)
+@receiver(post_save, sender=ArchaeologicalEvidence)
+def invalidate_saved_tiles(sender, instance, **kwargs):
+    layer = LAYER_BY_MODEL[sender]
+    invalidate_tiles(layer, getattr(instance, '_tile_bbox', None))
+    invalidate_tiles(layer, _bbox(instance))
+
+
+@receiver(post_delete, sender=Research)
+@receiver(post_delete, sender=Site)
+@receiver(post_delete, sender=ArchaeologicalEvidence)
+def invalidate_deleted_tiles(sender, instance, **kwargs):
+    invalidate_tiles(LAYER_BY_MODEL[sender], _bbox(instance))
+
+
+@receiver(geometries_bulk_changed)
+def invalidate_bulk_tiles(sender, bbox=None, **kwargs):
+    layer = LAYER_BY_MODEL[sender]
+    if bbox is None:
+        clear_tile_cache(layer)
+    else:
+        invalidate_tiles(layer, bbox)
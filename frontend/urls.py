@@ -31,6 +31,7 @@ urlpatterns = [
     path('research/<int:pk>/update/', ResearchUpdateView.as_view(), name='research-update'),
     path('research/<int:pk>/delete/', ResearchDeleteView.as_view(), name='research-delete'),
     path('api/preview-shapefile/', views.preview_shapefile, name='preview_shapefile'),
+    path('api/preview-shapefile/<str:job_id>/', views.preview_shapefile_job, name='preview_shapefile_job'),
     path('site_create/', views.SiteCreateView.as_view(), name='site_create'),
     path('evidence_create/', views.EvidenceCreateView.as_view(), name='evidence_create'),
     path('evidence/<int:pk>/update/', views.EvidenceUpdateView.as_view(), name='evidence_update'),
@@ -54,6 +55,15 @@ urlpatterns = [
     # API endpoints for relations
     path('api/sites/', views.api_sites_list, name='api-sites-list'),
     path('api/evidence/', views.api_evidence_list, name='api-evidence-list'),
+    path('api/spatial/', views.api_spatial, name='api-spatial'),
+    path('api/clusters/', views.api_clusters, name='api-clusters'),
+    path('api/nearby/', views.api_nearby, name='api-nearby'),
+    path('api/admin-units/', views.api_admin_units, name='api-admin-units'),
+    path('api/admin-aggregates/', views.api_admin_aggregates, name='api-admin-aggregates'),
+    path('api/density/', views.api_density, name='api-density'),
+    path('maps/<str:kind>/<int:pk>.<str:map_format>', views.map_fragment, name='map-fragment'),
+    path('tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt', views.vector_tile, name='vector-tile'),
+    path('export/<str:layer>.<str:export_format>', views.export_layer, name='export-layer'),
     path('api/site-research/', views.api_site_research_create, name='api-site-research-create'),
     path('api/site-evidence/', views.api_site_evidence_create, name='api-site-evidence-create'),
     path('api/research-evidence/', views.api_research_evidence_create, name='api-research-evidence-create'),
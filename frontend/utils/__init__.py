@@ -4,11 +4,18 @@ Organized collection of helper functions for views and models.
 """
 
 from .geometry import parse_geometry_string, create_folium_map
+from .geometry_parser import parse_geometry, parse_geometries, parse_coordinates
 from .author_user import get_or_update_user_profile, find_or_create_user_as_author
+from .research_details import load_public_research_details, load_research_details
 
 __all__ = [
     'parse_geometry_string',
     'create_folium_map',
+    'parse_geometry',
+    'parse_geometries',
+    'parse_coordinates',
     'get_or_update_user_profile',
     'find_or_create_user_as_author',
+    'load_public_research_details',
+    'load_research_details',
 ]
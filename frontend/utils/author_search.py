@@ -0,0 +1,231 @@
+"""
+User search shared by the author picker endpoints.
+Autocomplete lookups are answered from an in-process prefix index over
+surname, first name, username and email, built lazily once per worker.
+User and Profile saves bump a version key in the Django cache so every
+worker rebuilds its copy on the next lookup.
+
+search_users_in_database() is the single ranked query used when the index is
+disabled (AUTHOR_SEARCH_INDEX = False); on PostgreSQL its icontains filters
+are served by the pg_trgm GIN indexes created in users/migrations/0009.
+"""
+
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from users.models import Profile
+
+from .versioned_index import SharedIndex
+
+# Match priority, highest first; the index is the annotated priority
+MATCH_TYPES = ('surname', 'firstname', 'username', 'email')
+MATCH_FIELDS = ('last_name', 'first_name', 'username', 'email')
+
+MAX_RESULTS = 10
+
+INDEX_VERSION_KEY = 'author_search_index_version'
+# Columns read by AuthorPrefixIndex.build; saves touching none of them (e.g. last_login) keep the index
+INDEXED_FIELDS = {
+    User: frozenset(MATCH_FIELDS),
+    Profile: frozenset(('affiliation', 'orcid', 'contact_email', 'user')),
+}
+
+# Data returned to the author picker; built from a User and its Profile
+AuthorRecord = namedtuple('AuthorRecord', [
+    'id', 'username', 'email', 'first_name', 'last_name',
+    'affiliation', 'orcid', 'contact_email',
+])
+
+
+def get_profile(user):
+    """Return the user's profile, or None if it has not been created."""
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        return None
+
+
+def author_record(user):
+    """Build an AuthorRecord from a User (profile fields are blank without a profile)."""
+    profile = get_profile(user)
+    return AuthorRecord(
+        id=user.id,
+        username=user.username,
+        email=user.email or '',
+        first_name=user.first_name or '',
+        last_name=user.last_name or '',
+        affiliation=(profile.affiliation if profile else '') or '',
+        orcid=(profile.orcid if profile else '') or '',
+        contact_email=(profile.contact_email if profile else '') or '',
+    )
+
+
+def normalize(text):
+    """Lowercase and strip accents so 'Nicolò' and 'nicolo' match."""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    return ''.join(char for char in text if not unicodedata.combining(char)).strip()
+
+
+def field_keys(value):
+    """
+    Index keys for one field value: the whole value plus each word in it,
+    so 'De Luca' is found by both 'de l' and 'luca'.
+    """
+    value = normalize(value)
+    if not value:
+        return set()
+    keys = {value}
+    keys.update(word for word in re.split(r'[\W_]+', value) if word)
+    return keys
+
+
+class AuthorPrefixIndex:
+    """
+    Sorted array of (key, priority, user_id) entries.
+    A lookup is a binary search for the first key starting with the query
+    followed by a scan over the matching range.
+    """
+
+    def __init__(self, records, version=None):
+        self.version = version
+        self.records = {record.id: record for record in records}
+        entries = set()
+        for record in self.records.values():
+            for priority, field in enumerate(MATCH_FIELDS):
+                for key in field_keys(getattr(record, field)):
+                    entries.add((key, priority, record.id))
+        self.entries = sorted(entries)
+
+    @classmethod
+    def build(cls, version=None):
+        rows = User.objects.values_list(
+            'id', 'username', 'email', 'first_name', 'last_name',
+            'profile__affiliation', 'profile__orcid', 'profile__contact_email',
+        )
+        records = [AuthorRecord(user_id, *[value or '' for value in fields]) for user_id, *fields in rows]
+        return cls(records, version=version)
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Returns:
+            List of (AuthorRecord, match_type), best field match first
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        best = {}
+        position = bisect_left(self.entries, (query,))
+        while position < len(self.entries) and self.entries[position][0].startswith(query):
+            _, priority, user_id = self.entries[position]
+            if priority < best.get(user_id, len(MATCH_FIELDS)):
+                best[user_id] = priority
+            position += 1
+
+        ranked = sorted(
+            best.items(),
+            key=lambda item: (
+                item[1],
+                normalize(self.records[item[0]].last_name),
+                normalize(self.records[item[0]].first_name),
+                item[0],
+            ),
+        )
+        return [(self.records[user_id], MATCH_TYPES[priority]) for user_id, priority in ranked[:limit]]
+
+
+_index = SharedIndex(INDEX_VERSION_KEY, AuthorPrefixIndex.build)
+
+
+def get_author_index():
+    """Return this worker's index, rebuilding it when the shared version changed."""
+    return _index.get()
+
+
+def reset_author_index():
+    _index.reset()
+
+
+def search_users_in_database(query, limit=MAX_RESULTS):
+    """
+    Find users whose surname, first name, username or email contains query.
+
+    Results keep the surname > first name > username > email priority; on
+    PostgreSQL ties are broken by trigram similarity to the query.
+
+    Args:
+        query: Search string
+        limit: Maximum number of users returned
+
+    Returns:
+        List of (AuthorRecord, match_type) tuples
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    condition = Q()
+    priority_cases = []
+    for priority, field in enumerate(MATCH_FIELDS):
+        lookup = Q(**{f'{field}__icontains': query})
+        condition |= lookup
+        priority_cases.append(When(lookup, then=Value(priority)))
+
+    users = (
+        User.objects
+        .filter(condition)
+        .annotate(match_priority=Case(*priority_cases, output_field=IntegerField()))
+        .select_related('profile')
+    )
+    ordering = ['match_priority']
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        users = users.annotate(similarity=Greatest(
+            *[TrigramSimilarity(field, query) for field in MATCH_FIELDS]
+        ))
+        ordering.append('-similarity')
+    ordering.extend(['last_name', 'first_name', 'id'])
+
+    return [
+        (author_record(user), MATCH_TYPES[user.match_priority])
+        for user in users.order_by(*ordering)[:limit]
+    ]
+
+
+def search_users(query, limit=MAX_RESULTS):
+    """
+    Find users for the author picker.
+
+    Names and usernames match on any word prefix (e.g. 'ross' finds 'Rossi'
+    and 'De Rossi'), emails on the address or any part of it.
+
+    Args:
+        query: Search string
+        limit: Maximum number of users returned
+
+    Returns:
+        List of (AuthorRecord, match_type) tuples, surname matches first
+    """
+    if not getattr(settings, 'AUTHOR_SEARCH_INDEX', True):
+        return search_users_in_database(query, limit)
+    return get_author_index().search(query, limit)
+
+
+# Keep the index in sync with user and profile changes
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_author_index(sender, update_fields=None, **kwargs):
+    if update_fields and INDEXED_FIELDS[sender].isdisjoint(update_fields):
+        return
+    _index.invalidate()
@@ -1,10 +1,23 @@
 """
 Geometry and map utilities for ShareLand frontend.
 Handles parsing geometry strings and creating interactive Folium maps.
+Detail pages draw their maps client-side from GeoJSON (frontend/map_cache.py);
+create_folium_map is kept for offline use and imports Folium lazily.
 """
 
-import re
-import folium
+import shapely
+
+from .geometry_parser import parse_coordinates, parse_geometry
+
+# Map appearance of create_folium_map
+DEFAULT_MAP_STYLE = {
+    'tiles': 'OpenStreetMap',
+    'zoom_start': 12,
+    'color': 'blue',
+    'fill_color': 'blue',
+    'fill_opacity': 0.3,
+    'weight': 2,
+}
 
 
 def parse_geometry_string(geometry_str):
@@ -18,45 +31,44 @@ def parse_geometry_string(geometry_str):
     Returns:
         List of [lat, lon] tuples, or None if parsing fails
     """
-    if not geometry_str:
+    coordinates = parse_coordinates(geometry_str)
+    if coordinates is None:
         return None
     
-    # Remove outer parentheses and split by coordinate pairs
-    # Pattern: ((12.471998,41.846841),(12.473695,41.845806),...)
-    geometry_str = geometry_str.strip()
-    
-    # Remove outer parentheses if present
-    if geometry_str.startswith('((') and geometry_str.endswith('))'):
-        geometry_str = geometry_str[1:-1]
-    
-    # Find all coordinate pairs using regex
-    pattern = r'\(([\d.]+),([\d.]+)\)'
-    matches = re.findall(pattern, geometry_str)
-    
-    if not matches:
+    # Convert to list of [lat, lon] pairs (Folium expects lat, lon)
+    return coordinates[:, ::-1].tolist()
+
+
+def shape_to_latlon(shape):
+    """Return the vertices of a Shapely geometry as [lat, lon] pairs for Folium."""
+    if shape is None or shape.is_empty:
         return None
-    
-    # Convert to list of [lat, lon] tuples (Folium expects lat, lon)
-    coordinates = [[float(lat), float(lon)] for lon, lat in matches]
-    
-    return coordinates
+    return shapely.get_coordinates(shape)[:, ::-1].tolist()
 
 
-def create_folium_map(geometry_str, research_title="Research Area"):
+def create_folium_map(geometry, research_title="Research Area", style=None):
     """
     Create a Folium map with the geometry polygon.
     
     Args:
-        geometry_str: String representation of coordinates
+        geometry: String representation of coordinates, or a Shapely geometry
+            (e.g. frontend.spatial.load_shape() of a stored row)
         research_title: Title to display on the map
+        style: Overrides for DEFAULT_MAP_STYLE
         
     Returns:
         HTML string of the map, or None if geometry cannot be parsed
     """
-    coordinates = parse_geometry_string(geometry_str)
+    if geometry is None or isinstance(geometry, str):
+        coordinates = parse_geometry_string(geometry)
+    else:
+        coordinates = shape_to_latlon(geometry)
     
     if not coordinates:
         return None
+    import folium
+
+    style = {**DEFAULT_MAP_STYLE, **(style or {})}
     
     # Calculate center of polygon
     lats = [coord[0] for coord in coordinates]
@@ -67,18 +79,18 @@ def create_folium_map(geometry_str, research_title="Research Area"):
     # Create map centered on polygon
     m = folium.Map(
         location=[center_lat, center_lon],
-        zoom_start=12,
-        tiles='OpenStreetMap'
+        zoom_start=style['zoom_start'],
+        tiles=style['tiles']
     )
     
     # Add polygon to map
     folium.Polygon(
         locations=coordinates,
-        color='blue',
+        color=style['color'],
         fill=True,
-        fillColor='blue',
-        fillOpacity=0.3,
-        weight=2,
+        fillColor=style['fill_color'],
+        fillOpacity=style['fill_opacity'],
+        weight=style['weight'],
         popup=folium.Popup(research_title, max_width=300)
     ).add_to(m)
     
@@ -94,3 +106,16 @@ def create_folium_map(geometry_str, research_title="Research Area"):
     map_html = m._repr_html_()
     
     return map_html
+
+
+def geometry_to_shape(geometry):
+    """
+    Convert a stored geometry value to a Shapely geometry.
+
+    Accepts the native "((lon,lat),...)" formats (see geometry_parser), a
+    (lon, lat) tuple as set by the site forms, WKT and GeoJSON.
+
+    Returns:
+        Shapely geometry, or None if the value is empty or cannot be parsed
+    """
+    return parse_geometry(geometry)
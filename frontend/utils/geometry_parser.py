@@ -0,0 +1,301 @@
+"""
+Geometry text parser.
+Decodes the stored geometry formats straight into NumPy float64 arrays:
+
+    (x,y)                                  point
+    ((x,y),(x,y),...)                      ring (polygon; two pairs make a line)
+    (((x,y),...),((x,y),...))              polygon with holes, exterior first
+    ((((x,y),...)),(((x,y),...),(...)))    multipolygon
+
+as well as WKT and GeoJSON. Nesting is resolved with C-level str.split on the
+")),((" style separators and coordinates are converted in one NumPy call, so a
+row parses in microseconds; parse_geometries() handles thousands of rows at
+once through Shapely's vectorized constructors.
+"""
+
+import numpy as np
+import shapely
+from shapely import GeometryType
+from shapely.errors import ShapelyError
+
+POINT = 'point'
+LINESTRING = 'linestring'
+POLYGON = 'polygon'
+MULTIPOLYGON = 'multipolygon'
+
+_STRIP_PARENS = str.maketrans('', '', '() \t\r\n')
+_STRIP_SPACE = str.maketrans('', '', ' \t\r\n')
+
+
+def _separator(depth):
+    return ')' * depth + ',' + '(' * depth
+
+
+def _to_array(text):
+    """Convert "x,y,x,y,..." (parentheses allowed) into an (n, 2) float64 array."""
+    values = np.array(text.translate(_STRIP_PARENS).split(','), dtype=np.float64)
+    if values.size < 2 or values.size % 2:
+        raise ValueError('odd number of coordinates')
+    return values.reshape(-1, 2)
+
+
+def _ring(text):
+    coords = _to_array(text)
+    if not np.array_equal(coords[0], coords[-1]):
+        coords = np.vstack([coords, coords[:1]])
+    if len(coords) < 4:
+        raise ValueError('a ring needs at least three points')
+    return coords
+
+
+def _polygon(text):
+    return [_ring(ring) for ring in text.split(_separator(2))]
+
+
+def decode_native(text):
+    """
+    Decode the native parenthesised format.
+
+    Returns:
+        Tuple (kind, data): data is an (n, 2) array for points and lines, a list
+        of ring arrays for polygons and a list of such lists for multipolygons
+
+    Raises:
+        ValueError: If the text is malformed
+    """
+    text = text.translate(_STRIP_SPACE)
+    depth = len(text) - len(text.lstrip('('))
+    if depth != len(text) - len(text.rstrip(')')):
+        raise ValueError('unbalanced parentheses')
+    if depth <= 1:
+        coords = _to_array(text)
+        if len(coords) != 1:
+            raise ValueError('a point has exactly one coordinate pair')
+        return POINT, coords
+    body = text[1:-1]
+    if depth == 2:
+        coords = _to_array(body)
+        if len(coords) == 1:
+            return POINT, coords
+        if len(coords) == 2:
+            return LINESTRING, coords
+        return POLYGON, [_ring(body)]
+    if depth == 3:
+        return POLYGON, _polygon(body)
+    if depth == 4:
+        return MULTIPOLYGON, [_polygon(polygon) for polygon in body.split(_separator(3))]
+    raise ValueError('unsupported nesting depth')
+
+
+def _shape_from_native(kind, data):
+    if kind == POINT:
+        return shapely.Point(data[0])
+    if kind == LINESTRING:
+        return shapely.LineString(data)
+    if kind == POLYGON:
+        return shapely.Polygon(data[0], data[1:])
+    return shapely.MultiPolygon([shapely.Polygon(rings[0], rings[1:]) for rings in data])
+
+
+def _text_format(text):
+    """Return 'wkt', 'geojson' or 'native' for a stripped, non-empty text."""
+    if text[0] == '{':
+        return 'geojson'
+    if text[0].isalpha():
+        return 'wkt'
+    return 'native'
+
+
+def parse_geometry(value):
+    """
+    Parse one geometry value into a Shapely geometry.
+
+    Args:
+        value: Native, WKT or GeoJSON text, or a (lon, lat) tuple
+
+    Returns:
+        Shapely geometry, or None if the value is empty or invalid
+    """
+    if value is None:
+        return None
+    if isinstance(value, (tuple, list)):
+        try:
+            return shapely.Point(float(value[0]), float(value[1]))
+        except (IndexError, TypeError, ValueError):
+            return None
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        text_format = _text_format(text)
+        if text_format == 'wkt':
+            shape = shapely.from_wkt(text)
+        elif text_format == 'geojson':
+            shape = shapely.from_geojson(text)
+        else:
+            shape = _shape_from_native(*decode_native(text))
+    except (ShapelyError, ValueError):
+        return None
+    if shape is None or shape.is_empty:
+        return None
+    return shape
+
+
+def parse_coordinates(value):
+    """
+    Return every vertex of a geometry value as an (n, 2) float64 array of (x, y).
+
+    Returns:
+        NumPy array, or None if the value is empty or invalid
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        if text and _text_format(text) == 'native':
+            try:
+                kind, data = decode_native(text)
+            except ValueError:
+                return None
+            if kind == POLYGON:
+                return np.vstack(data)
+            if kind == MULTIPOLYGON:
+                return np.vstack([ring for rings in data for ring in rings])
+            return data
+    shape = parse_geometry(value)
+    return None if shape is None else shapely.get_coordinates(shape)
+
+
+def _ragged(kind, decoded):
+    """Build one Shapely array for decoded native rows of the same kind."""
+    if kind == POINT:
+        return shapely.from_ragged_array(GeometryType.POINT, np.vstack(decoded))
+    if kind == LINESTRING:
+        offsets = np.cumsum([0] + [len(coords) for coords in decoded])
+        return shapely.from_ragged_array(GeometryType.LINESTRING, np.vstack(decoded), (offsets,))
+
+    polygons = decoded if kind == POLYGON else [polygon for rows in decoded for polygon in rows]
+    rings = [ring for polygon in polygons for ring in polygon]
+    ring_offsets = np.cumsum([0] + [len(ring) for ring in rings])
+    polygon_offsets = np.cumsum([0] + [len(polygon) for polygon in polygons])
+    if kind == POLYGON:
+        return shapely.from_ragged_array(GeometryType.POLYGON, np.vstack(rings), (ring_offsets, polygon_offsets))
+    part_offsets = np.cumsum([0] + [len(rows) for rows in decoded])
+    return shapely.from_ragged_array(
+        GeometryType.MULTIPOLYGON, np.vstack(rings), (ring_offsets, polygon_offsets, part_offsets)
+    )
+
+
+def parse_geometries(values):
+    """
+    Parse many geometry values at once.
+
+    WKT and GeoJSON rows go through shapely.from_wkt/from_geojson in one call
+    each; native rows are decoded and assembled per geometry type with
+    shapely.from_ragged_array.
+
+    Args:
+        values: Iterable of geometry values (see parse_geometry)
+
+    Returns:
+        Object array of Shapely geometries aligned with values (None where invalid)
+    """
+    values = list(values)
+    result = np.full(len(values), None, dtype=object)
+    by_format = {'wkt': ([], []), 'geojson': ([], [])}
+    native = {}
+
+    for position, value in enumerate(values):
+        if value is None:
+            continue
+        if isinstance(value, (tuple, list)):
+            result[position] = parse_geometry(value)
+            continue
+        text = str(value).strip()
+        if not text:
+            continue
+        text_format = _text_format(text)
+        if text_format != 'native':
+            by_format[text_format][0].append(position)
+            by_format[text_format][1].append(text)
+            continue
+        try:
+            kind, data = decode_native(text)
+        except ValueError:
+            continue
+        positions, decoded = native.setdefault(kind, ([], []))
+        positions.append(position)
+        decoded.append(data)
+
+    for text_format, (positions, texts) in by_format.items():
+        if positions:
+            parse = shapely.from_wkt if text_format == 'wkt' else shapely.from_geojson
+            result[positions] = parse(texts, on_invalid='ignore')
+
+    for kind, (positions, decoded) in native.items():
+        try:
+            result[positions] = _ragged(kind, decoded)
+        except (ShapelyError, ValueError):
+            # Fall back to row by row so one bad row does not drop the batch
+            for position, data in zip(positions, decoded):
+                try:
+                    result[position] = _shape_from_native(kind, data)
+                except (ShapelyError, ValueError):
+                    pass
+
+    for position, shape in enumerate(result):
+        if shape is not None and shape.is_empty:
+            result[position] = None
+    return result
+
+
+_NATIVE_TYPES = [GeometryType.POINT, GeometryType.LINESTRING, GeometryType.POLYGON, GeometryType.MULTIPOLYGON]
+
+
+def format_geometries(shapes, decimals=6):
+    """
+    Encode Shapely geometries as stored text.
+
+    Points, two-point lines, polygons and multipolygons use the native format
+    (holes and every part kept); other geometry types are stored as WKT. The
+    coordinates are printed by shapely.to_wkt in one vectorized call and the
+    WKT is rewritten into the native nesting with plain string replacements:
+    "x y, x y" becomes "(x,y),(x,y)", which also turns WKT's ring and part
+    nesting into the native one.
+
+    Returns:
+        List of texts accepted by parse_geometry (None for missing or empty geometries)
+    """
+    shapes = np.asarray(shapes, dtype=object)
+    result = [None] * len(shapes)
+    if not len(shapes):
+        return result
+    present = ~shapely.is_missing(shapes)
+    present[present] = ~shapely.is_empty(shapes[present])
+    positions = np.flatnonzero(present)
+    selected = shapes[positions]
+    texts = shapely.to_wkt(selected, rounding_precision=decimals, trim=True, output_dimension=2)
+    type_ids = shapely.get_type_id(selected)
+    polygons = type_ids == GeometryType.POLYGON
+    lines = type_ids == GeometryType.LINESTRING
+    native = np.isin(type_ids, _NATIVE_TYPES)
+    native[lines] = shapely.get_num_coordinates(selected[lines]) == 2
+    # Points and hole-less polygons keep the WKT depth; the other types gain one level
+    unwrapped = type_ids == GeometryType.POINT
+    unwrapped[polygons] = shapely.get_num_interior_rings(selected[polygons]) == 0
+
+    for position, text, is_native, is_unwrapped in zip(positions, texts, native.tolist(), unwrapped.tolist()):
+        if not is_native:
+            result[position] = text
+            continue
+        body = text[text.index('('):].replace(', ', '),(').replace(' ', ',')
+        result[position] = body if is_unwrapped else f'({body})'
+    return result
+
+
+def format_geometry(shape, decimals=6):
+    """
+    Encode one Shapely geometry as stored text (see format_geometries).
+
+    Returns:
+        Text accepted by parse_geometry, or None for a missing or empty geometry
+    """
+    return format_geometries([shape], decimals)[0]
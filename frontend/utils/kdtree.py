@@ -0,0 +1,145 @@
+"""
+Static KD-tree for nearest-neighbour queries, built with NumPy only.
+Points are split at the median of their widest dimension until a node holds
+at most LEAF_SIZE points; a query visits nodes best-first by their distance
+to the bounding box and computes distances leaf by leaf in NumPy.
+
+For geographic points, build the tree on unit_vectors(lon, lat): the chord
+length between unit vectors grows with the great-circle distance, so the
+nearest points in 3D are the nearest on the sphere (see chord_length and
+arc_length for the conversion).
+"""
+
+import heapq
+
+import numpy as np
+
+LEAF_SIZE = 32
+EARTH_RADIUS_M = 6371008.8
+
+
+def unit_vectors(lon, lat):
+    """(n, 3) array of points on the unit sphere for lon/lat arrays in degrees."""
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_length(meters):
+    """Chord on the unit sphere spanning a great-circle distance in meters."""
+    return 2.0 * np.sin(np.minimum(np.asarray(meters, dtype=np.float64) / EARTH_RADIUS_M, np.pi) / 2.0)
+
+
+def arc_length(chord):
+    """Great-circle distance in meters of a chord on the unit sphere."""
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2.0, 0.0, 1.0))
+
+
+class KDTree:
+    """
+    Nodes are stored in flat arrays; node i holds the points
+    order[start[i]:end[i]] within the box lower[i]..upper[i], and inner nodes
+    have two children.
+    """
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2:
+            # reshape(0, -1) is ambiguous, so an empty input becomes a tree of no dimensions
+            points = points.reshape(len(points), -1) if points.size else points.reshape(0, 0)
+        self.points = points
+        self.leaf_size = leaf_size
+        self._build()
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self):
+        points = self.points
+        order = np.arange(len(points))
+        start, end, lower, upper, children = [], [], [], [], []
+
+        def add_node(first, last):
+            node_points = points[order[first:last]]
+            start.append(first)
+            end.append(last)
+            lower.append(node_points.min(axis=0) if last > first else np.zeros(points.shape[1]))
+            upper.append(node_points.max(axis=0) if last > first else np.zeros(points.shape[1]))
+            children.append((-1, -1))
+            return len(start) - 1
+
+        stack = [add_node(0, len(points))]
+        while stack:
+            node = stack.pop()
+            first, last = start[node], end[node]
+            if last - first <= self.leaf_size:
+                continue
+            dimension = int(np.argmax(upper[node] - lower[node]))
+            middle = (last - first) // 2
+            segment = order[first:last]
+            order[first:last] = segment[np.argpartition(points[segment, dimension], middle)]
+            left, right = add_node(first, first + middle), add_node(first + middle, last)
+            children[node] = (left, right)
+            stack.extend((left, right))
+
+        self.order = order
+        self.start = np.array(start, dtype=np.intp)
+        self.end = np.array(end, dtype=np.intp)
+        self.lower = np.array(lower).reshape(len(start), points.shape[1])
+        self.upper = np.array(upper).reshape(len(start), points.shape[1])
+        self.children = np.array(children, dtype=np.intp).reshape(len(start), 2)
+
+    def _box_distance(self, node, point):
+        gap = np.maximum(self.lower[node] - point, 0.0) + np.maximum(point - self.upper[node], 0.0)
+        return float(np.sqrt(gap @ gap))
+
+    def query(self, point, k=1, max_distance=np.inf, skip=None):
+        """
+        Find the k points nearest to point.
+
+        Args:
+            point: Coordinates of the query point
+            k: Maximum number of neighbours
+            max_distance: Ignore points farther than this
+            skip: Optional boolean array, True for point positions to ignore
+
+        Returns:
+            Tuple (distances, positions), both sorted by distance
+        """
+        point = np.asarray(point, dtype=np.float64)
+        best_distances = np.zeros(0)
+        best_positions = np.zeros(0, dtype=np.intp)
+        if not len(self.points) or k <= 0:
+            return best_distances, best_positions
+
+        bound = max_distance
+        heap = [(self._box_distance(0, point), 0)]
+        while heap:
+            box_distance, node = heapq.heappop(heap)
+            if box_distance > bound:
+                break
+            left, right = self.children[node]
+            if left >= 0:
+                for child in (left, right):
+                    child_distance = self._box_distance(child, point)
+                    if child_distance <= bound:
+                        heapq.heappush(heap, (child_distance, child))
+                continue
+
+            positions = self.order[self.start[node]:self.end[node]]
+            if skip is not None:
+                positions = positions[~skip[positions]]
+            offsets = self.points[positions] - point
+            distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+            near = distances <= bound
+            best_distances = np.concatenate([best_distances, distances[near]])
+            best_positions = np.concatenate([best_positions, positions[near]])
+            if len(best_distances) > k:
+                keep = np.argpartition(best_distances, k - 1)[:k]
+                best_distances, best_positions = best_distances[keep], best_positions[keep]
+            if len(best_distances) == k:
+                bound = min(max_distance, float(best_distances.max()))
+
+        ranking = np.argsort(best_distances, kind='stable')
+        return best_distances[ranking], best_positions[ranking]
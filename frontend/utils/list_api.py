@@ -0,0 +1,119 @@
+"""
+Helpers for the JSON list endpoints feeding the site/evidence modal selectors.
+Rows are read with .values() (never geometry unless asked for), filtered by
+name prefix and either paginated with keyset cursors or streamed in chunks,
+so memory stays flat however large the tables grow.
+"""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+from ..pagination import KeysetPaginator
+
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_ROWS = 500
+
+
+def parse_fields(value, allowed_fields, default_fields):
+    """
+    Parse a comma-separated fields= parameter.
+
+    Returns:
+        Tuple of field names, always starting with 'id'
+
+    Raises:
+        ValueError: If a field is not in allowed_fields
+    """
+    if not value:
+        fields = list(default_fields)
+    else:
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in allowed_fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return tuple(dict.fromkeys(fields))
+
+
+def parse_limit(value):
+    """Return the requested page size (capped at MAX_PAGE_SIZE), or None to stream everything."""
+    if value in (None, ''):
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def stream_json_results(rows, serialize):
+    """
+    Yield a {"success": true, "results": [...], "count": n} document in chunks.
+    count is written after the results so no separate COUNT query is needed.
+    """
+    yield '{"success": true, "results": ['
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(serialize(row), cls=DjangoJSONEncoder))
+        count += 1
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+            yield (',' if count > len(chunk) else '') + ','.join(chunk)
+            chunk = []
+    if chunk:
+        yield (',' if count > len(chunk) else '') + ','.join(chunk)
+    yield f'], "count": {count}}}'
+
+
+def list_response(request, queryset, name_field, label, allowed_fields, default_fields):
+    """
+    Build the response of a modal selector list endpoint.
+
+    Query parameters:
+        q: Case-insensitive prefix of name_field
+        fields: Comma-separated subset of allowed_fields
+        limit: Page size; when missing every row is streamed
+        cursor: Token from a previous page's "next"
+
+    Args:
+        request: HttpRequest
+        queryset: Base queryset
+        name_field: Field used for ordering, q= filtering and the display fallback
+        label: Display fallback prefix for rows without a name (e.g. 'Site')
+        allowed_fields: Fields that may be requested
+        default_fields: Fields returned when fields= is missing
+
+    Returns:
+        JsonResponse for a page, StreamingHttpResponse for the full list
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'), allowed_fields, default_fields)
+        limit = parse_limit(request.GET.get('limit'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'success': False}, status=400)
+
+    query = request.GET.get('q', '').strip()
+    if query:
+        queryset = queryset.filter(**{f'{name_field}__istartswith': query})
+
+    def serialize(row):
+        data = {field: row[field] for field in fields}
+        if name_field in data and not data[name_field]:
+            data[name_field] = f"{label} #{row['id']}"
+        return data
+
+    if limit is None:
+        rows = queryset.order_by(name_field, 'id').values(*fields).iterator(chunk_size=2000)
+        return StreamingHttpResponse(stream_json_results(rows, serialize), content_type='application/json')
+
+    paginator = KeysetPaginator(queryset.values(*fields), limit, (name_field, 'id'))
+    page = paginator.get_page(request.GET.get('cursor'))
+    results = [serialize(row) for row in page.object_list]
+    return JsonResponse({
+        'success': True,
+        'count': len(results),
+        'results': results,
+        'next': page.next_cursor or None,
+    })
@@ -0,0 +1,210 @@
+"""
+Mapbox Vector Tile encoder.
+Writes the protobuf wire format of the MVT 2.1 specification directly, so
+tiles can be built without protobuf or mapbox-vector-tile installed. Input
+geometries must already be in tile coordinates (integers, y down); see
+frontend/tiles.py for the projection and clipping.
+"""
+
+import struct
+
+import numpy as np
+import shapely
+
+GEOM_POINT = 1
+GEOM_LINESTRING = 2
+GEOM_POLYGON = 3
+
+_MOVE_TO = 1
+_LINE_TO = 2
+_CLOSE_PATH = 7
+
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _message(field, payload):
+    return _key(field, _LENGTH_DELIMITED) + _varint(len(payload)) + payload
+
+
+def _packed(field, values):
+    return _message(field, b''.join(_varint(int(value)) for value in values))
+
+
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return (values << 1) ^ (values >> 63)
+
+
+def _command(command, count):
+    return (command & 0x7) | (count << 3)
+
+
+class _Path:
+    """Geometry command stream; coordinates are delta-encoded from the previous point."""
+
+    def __init__(self):
+        self.commands = []
+        self.cursor = np.zeros(2, dtype=np.int64)
+
+    def _deltas(self, coords):
+        deltas = np.diff(np.vstack([self.cursor, coords]), axis=0)
+        self.cursor = coords[-1]
+        return _zigzag(deltas).ravel().tolist()
+
+    def points(self, coords):
+        self.commands.append(_command(_MOVE_TO, len(coords)))
+        self.commands.extend(self._deltas(coords))
+
+    def line(self, coords, closed=False):
+        if closed:
+            coords = coords[:-1]
+        self.commands.append(_command(_MOVE_TO, 1))
+        self.commands.extend(self._deltas(coords[:1]))
+        self.commands.append(_command(_LINE_TO, len(coords) - 1))
+        self.commands.extend(self._deltas(coords[1:]))
+        if closed:
+            self.commands.append(_command(_CLOSE_PATH, 1))
+
+
+def _coords(geometry):
+    coords = np.rint(shapely.get_coordinates(geometry)).astype(np.int64)
+    if len(coords) > 1:
+        # Drop repeated points; they would encode as zero-length segments
+        keep = np.ones(len(coords), dtype=bool)
+        keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+        coords = coords[keep]
+    return coords
+
+
+def encode_geometry(shape):
+    """
+    Encode a geometry in tile coordinates as MVT commands.
+
+    Polygons are oriented as the specification requires (exterior rings with
+    positive area in y-down coordinates); geometry collections keep only
+    their highest-dimension parts.
+
+    Returns:
+        Tuple (geometry type, command integers), or None when nothing drawable remains
+    """
+    if shape is None or shape.is_empty:
+        return None
+    if shape.geom_type == 'GeometryCollection':
+        parts = shapely.get_parts(shape)
+        dimensions = shapely.get_dimensions(parts)
+        shape = shapely.union_all(parts[dimensions == dimensions.max()])
+        if shape.is_empty:
+            return None
+
+    path = _Path()
+    kind = shape.geom_type
+    if kind in ('Point', 'MultiPoint'):
+        coords = np.rint(shapely.get_coordinates(shape)).astype(np.int64)
+        path.points(coords)
+        return GEOM_POINT, path.commands
+
+    if kind in ('LineString', 'MultiLineString'):
+        for part in shapely.get_parts(shape):
+            coords = _coords(part)
+            if len(coords) >= 2:
+                path.line(coords)
+        return (GEOM_LINESTRING, path.commands) if path.commands else None
+
+    if kind in ('Polygon', 'MultiPolygon'):
+        shape = shapely.orient_polygons(shape, exterior_cw=False)
+        for polygon in shapely.get_parts(shape):
+            rings = [polygon.exterior, *polygon.interiors]
+            for position, ring in enumerate(rings):
+                coords = _coords(ring)
+                if len(coords) < 4:
+                    if position == 0:
+                        break  # exterior collapsed: skip the whole polygon
+                    continue
+                path.line(coords, closed=True)
+        return (GEOM_POLYGON, path.commands) if path.commands else None
+    return None
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return _key(7, _VARINT) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _key(5, _VARINT) + _varint(value)
+        return _key(6, _VARINT) + _varint(int(_zigzag(value)))
+    if isinstance(value, float):
+        return _key(3, _FIXED64) + struct.pack('<d', value)
+    return _message(1, str(value).encode('utf-8'))
+
+
+def encode_layer(name, features, extent=4096):
+    """
+    Encode one tile layer.
+
+    Args:
+        name: Layer name
+        features: Iterable of (id, geometry in tile coordinates, properties dict)
+        extent: Tile extent the coordinates refer to
+
+    Returns:
+        Layer message bytes (without the enclosing tile field)
+    """
+    keys = {}
+    values = {}
+    encoded = []
+    for feature_id, shape, properties in features:
+        geometry = encode_geometry(shape)
+        if geometry is None:
+            continue
+        geom_type, commands = geometry
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        message = b''
+        if feature_id is not None:
+            message += _key(1, _VARINT) + _varint(feature_id)
+        if tags:
+            message += _packed(2, tags)
+        message += _key(3, _VARINT) + _varint(geom_type) + _packed(4, commands)
+        encoded.append(_message(2, message))
+
+    layer = _key(15, _VARINT) + _varint(2) + _message(1, name.encode('utf-8'))
+    layer += b''.join(encoded)
+    layer += b''.join(_message(3, key.encode('utf-8')) for key in keys)
+    layer += b''.join(_message(4, _value(value)) for _, value in values)
+    layer += _key(5, _VARINT) + _varint(extent)
+    return layer
+
+
+def encode_tile(layers):
+    """
+    Encode a vector tile.
+
+    Args:
+        layers: Iterable of layer messages from encode_layer
+
+    Returns:
+        Tile bytes
+    """
+    return b''.join(_message(3, layer) for layer in layers)
@@ -0,0 +1,294 @@
+"""
+Batch loaders for research detail pages.
+Fetches each relation of a research's sites and evidence with a single query
+and groups the rows in memory, so the number of queries does not grow with
+the number of linked sites or evidence.
+"""
+
+from collections import defaultdict
+
+from ..models import (
+    SiteResearch, Site, ArchEvResearch, SiteArchEvidence, ArchaeologicalEvidence,
+    SiteToponymy, Interpretation, SiteInvestigation, SiteBibliography, SiteSources,
+    SiteRelatedDocumentation, Image, ArchEvBiblio, ArchEvSources, ArchEvRelatedDoc
+)
+
+
+def group_by(rows, key):
+    """
+    Group model instances (or dicts) by the value of one attribute.
+
+    Args:
+        rows: Iterable of model instances or dicts
+        key: Attribute (or dict key) holding the grouping value
+
+    Returns:
+        defaultdict mapping each key value to the list of rows, in input order
+    """
+    grouped = defaultdict(list)
+    for row in rows:
+        value = row[key] if isinstance(row, dict) else getattr(row, key)
+        grouped[value].append(row)
+    return grouped
+
+
+def _first(grouped, key):
+    """Return the first row of a group (mirrors QuerySet.first() on pk order)."""
+    rows = grouped.get(key)
+    return rows[0] if rows else None
+
+
+def get_research_site_ids(research):
+    """Return the distinct ids of the sites linked to a research."""
+    return list(
+        SiteResearch.objects
+        .filter(id_research=research)
+        .values_list('id_site_id', flat=True)
+        .distinct()
+    )
+
+
+def get_research_evidence_ids(research):
+    """Return the ids of the evidence linked directly to a research."""
+    return list(
+        ArchEvResearch.objects
+        .filter(id_research=research.id, id_archaeological_evidence__isnull=False)
+        .values_list('id_archaeological_evidence_id', flat=True)
+    )
+
+
+def load_site_evidence_ids(site_ids):
+    """
+    Map each site id to the ids of its evidence using one query.
+
+    Returns:
+        defaultdict(list) of site_id -> [evidence_id, ...]
+    """
+    links = (
+        SiteArchEvidence.objects
+        .filter(id_site_id__in=site_ids)
+        .order_by('id')
+        .values_list('id_site_id', 'id_archaeological_evidence_id')
+    )
+    evidence_ids = defaultdict(list)
+    for site_id, evidence_id in links:
+        evidence_ids[site_id].append(evidence_id)
+    return evidence_ids
+
+
+def load_sites(site_ids):
+    """Fetch sites with the foreign keys shown on detail pages."""
+    return list(
+        Site.objects
+        .filter(id__in=site_ids)
+        .select_related('id_country', 'id_region', 'id_province', 'id_municipality')
+        .order_by('id')
+    )
+
+
+def load_evidences(evidence_ids):
+    """Fetch evidence with the foreign keys shown on detail pages."""
+    return list(
+        ArchaeologicalEvidence.objects
+        .filter(id__in=evidence_ids)
+        .select_related(
+            'id_archaeological_evidence_typology', 'id_country', 'id_region',
+            'id_municipality'
+        )
+        .order_by('id')
+    )
+
+
+def load_site_relations(site_ids):
+    """
+    Load every per-site relation for a set of sites, one query per relation.
+
+    Args:
+        site_ids: Iterable of Site ids
+
+    Returns:
+        Dict of relation name -> defaultdict(list) keyed by site id
+    """
+    return {
+        'toponymy': group_by(
+            SiteToponymy.objects.filter(id_site_id__in=site_ids).order_by('pk'),
+            'id_site_id'),
+        'interpretation': group_by(
+            Interpretation.objects.filter(id_site_id__in=site_ids).order_by('pk'),
+            'id_site_id'),
+        'investigation': group_by(
+            SiteInvestigation.objects.filter(id_site_id__in=site_ids)
+            .select_related('id_investigation').order_by('pk'),
+            'id_site_id'),
+        'bibliography': group_by(
+            SiteBibliography.objects.filter(id_site_id__in=site_ids)
+            .select_related('id_bibliography').order_by('pk'),
+            'id_site_id'),
+        'sources': group_by(
+            SiteSources.objects.filter(id_site_id__in=site_ids)
+            .select_related('id_sources').order_by('pk'),
+            'id_site_id'),
+        'related_doc': group_by(
+            SiteRelatedDocumentation.objects.filter(id_site_id__in=site_ids).order_by('pk'),
+            'id_site_id'),
+        'images': group_by(
+            Image.objects.filter(id_site_id__in=site_ids).order_by('pk'),
+            'id_site_id'),
+    }
+
+
+def load_evidence_relations(evidence_ids, include_images=False):
+    """
+    Load every per-evidence relation for a set of evidence, one query per relation.
+
+    Args:
+        evidence_ids: Iterable of ArchaeologicalEvidence ids
+        include_images: Also load the images attached to each evidence
+
+    Returns:
+        Dict of relation name -> defaultdict(list) keyed by evidence id
+    """
+    relations = {
+        'bibliography': group_by(
+            ArchEvBiblio.objects.filter(id_archaeological_evidence_id__in=evidence_ids)
+            .select_related('id_bibliography').order_by('pk'),
+            'id_archaeological_evidence_id'),
+        'sources': group_by(
+            ArchEvSources.objects.filter(id_archaeological_evidence_id__in=evidence_ids)
+            .select_related('id_sources').order_by('pk'),
+            'id_archaeological_evidence_id'),
+        'related_doc': group_by(
+            ArchEvRelatedDoc.objects.filter(id_archaeological_evidence_id__in=evidence_ids).order_by('pk'),
+            'id_archaeological_evidence_id'),
+    }
+    if include_images:
+        relations['images'] = group_by(
+            Image.objects.filter(id_archaeological_evidence_id__in=evidence_ids).order_by('pk'),
+            'id_archaeological_evidence_id')
+    return relations
+
+
+def load_public_research_details(research):
+    """
+    Build the site and evidence payloads for the public research detail page.
+
+    Sites come with their first toponymy, interpretation, investigation,
+    bibliography, source and related document, plus all images and evidence.
+    Evidence covers both direct links and evidence reached through the sites.
+    The query count is constant regardless of how many sites are linked.
+
+    Args:
+        research: Research instance
+
+    Returns:
+        Tuple (sites_with_details, evidences_with_details)
+    """
+    site_ids = get_research_site_ids(research)
+    site_evidence_ids = load_site_evidence_ids(site_ids)
+
+    all_evidence_ids = set(get_research_evidence_ids(research))
+    for evidence_ids in site_evidence_ids.values():
+        all_evidence_ids.update(evidence_ids)
+
+    evidences = load_evidences(all_evidence_ids)
+    evidence_by_id = {evidence.id: evidence for evidence in evidences}
+
+    site_relations = load_site_relations(site_ids)
+    sites_with_details = []
+    for site in load_sites(site_ids):
+        sites_with_details.append({
+            'site': site,
+            'toponymy': _first(site_relations['toponymy'], site.id),
+            'interpretation': _first(site_relations['interpretation'], site.id),
+            'investigation': _first(site_relations['investigation'], site.id),
+            'bibliography': _first(site_relations['bibliography'], site.id),
+            'sources': _first(site_relations['sources'], site.id),
+            'related_doc': _first(site_relations['related_doc'], site.id),
+            'images': site_relations['images'].get(site.id, []),
+            'evidences': [
+                evidence_by_id[evidence_id]
+                for evidence_id in site_evidence_ids.get(site.id, [])
+                if evidence_id in evidence_by_id
+            ],
+        })
+
+    evidence_relations = load_evidence_relations(list(evidence_by_id))
+    evidences_with_details = []
+    for evidence in evidences:
+        evidences_with_details.append({
+            'evidence': evidence,
+            'bibliography': _first(evidence_relations['bibliography'], evidence.id),
+            'sources': _first(evidence_relations['sources'], evidence.id),
+            'related_doc': _first(evidence_relations['related_doc'], evidence.id),
+        })
+
+    return sites_with_details, evidences_with_details
+
+
+def _linked(grouped, key, attr):
+    """Return the objects a group of link rows point to (e.g. Bibliography for SiteBibliography)."""
+    return [getattr(link, attr) for link in grouped.get(key, [])]
+
+
+def load_research_details(research):
+    """
+    Build the site and evidence payloads for the authenticated research detail page.
+
+    Unlike the public page, every bibliography, source, related document and
+    image is listed, and only evidence linked directly to the research is
+    returned in evidences_with_details. The query count is constant
+    regardless of how many sites or evidence are linked.
+
+    Args:
+        research: Research instance
+
+    Returns:
+        Tuple (sites_with_details, evidences_with_details)
+    """
+    site_ids = get_research_site_ids(research)
+    site_evidence_ids = load_site_evidence_ids(site_ids)
+    direct_evidence_ids = get_research_evidence_ids(research)
+
+    all_evidence_ids = set(direct_evidence_ids)
+    for evidence_ids in site_evidence_ids.values():
+        all_evidence_ids.update(evidence_ids)
+    evidence_by_id = {evidence.id: evidence for evidence in load_evidences(all_evidence_ids)}
+
+    site_relations = load_site_relations(site_ids)
+    sites_with_details = []
+    for site in load_sites(site_ids):
+        sites_with_details.append({
+            'site': site,
+            'toponymy': _first(site_relations['toponymy'], site.id),
+            'interpretation': _first(site_relations['interpretation'], site.id),
+            'investigation': _first(site_relations['investigation'], site.id),
+            'bibliographies': _linked(site_relations['bibliography'], site.id, 'id_bibliography'),
+            'sources': _linked(site_relations['sources'], site.id, 'id_sources'),
+            'related_docs': site_relations['related_doc'].get(site.id, []),
+            'images': site_relations['images'].get(site.id, []),
+            'evidences': [
+                evidence_by_id[evidence_id]
+                for evidence_id in site_evidence_ids.get(site.id, [])
+                if evidence_id in evidence_by_id
+            ],
+        })
+
+    direct_evidences = [
+        evidence_by_id[evidence_id]
+        for evidence_id in sorted(set(direct_evidence_ids))
+        if evidence_id in evidence_by_id
+    ]
+    evidence_relations = load_evidence_relations(
+        [evidence.id for evidence in direct_evidences], include_images=True
+    )
+    evidences_with_details = []
+    for evidence in direct_evidences:
+        evidences_with_details.append({
+            'evidence': evidence,
+            'bibliographies': _linked(evidence_relations['bibliography'], evidence.id, 'id_bibliography'),
+            'sources': _linked(evidence_relations['sources'], evidence.id, 'id_sources'),
+            'related_docs': evidence_relations['related_doc'].get(evidence.id, []),
+            'images': evidence_relations['images'].get(evidence.id, []),
+        })
+
+    return sites_with_details, evidences_with_details
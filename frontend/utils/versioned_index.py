@@ -0,0 +1,85 @@
+"""
+Per-worker in-memory indexes kept in step through a version key in the Django cache.
+Each worker builds its copy lazily and rebuilds it when the shared version
+moved; the worker making a change can patch its copy in place instead (see
+SharedIndex.update). Index objects carry the version they were built for in a
+.version attribute.
+"""
+
+import threading
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Current value of a version key, created at 1 when missing."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(key):
+    """
+    Increment a version key.
+
+    Returns:
+        The new version, or None when the key was missing (e.g. evicted) and had to be recreated
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return None
+
+
+class SharedIndex:
+    """
+    This worker's copy of an index.
+
+    Args:
+        key: Version key in the Django cache
+        builder: Callable returning the index for a version, called as builder(version=version)
+        lock: Lock guarding the copy; pass an RLock when callers hold it around lookups
+    """
+
+    def __init__(self, key, builder, lock=None):
+        self.key = key
+        self.builder = builder
+        self.lock = lock or threading.Lock()
+        self.index = None
+
+    def version(self):
+        return get_version(self.key)
+
+    def get(self):
+        """Return the index, rebuilding it when the shared version changed."""
+        version = get_version(self.key)
+        with self.lock:
+            if self.index is None or self.index.version != version:
+                self.index = self.builder(version=version)
+            return self.index
+
+    def reset(self):
+        with self.lock:
+            self.index = None
+
+    def invalidate(self):
+        """Make every worker rebuild on next use."""
+        bump_version(self.key)
+        self.reset()
+
+    def update(self, change):
+        """Apply change(index) to this worker's copy in place and publish a new version."""
+        version = bump_version(self.key)
+        with self.lock:
+            index = self.index
+            if index is None:
+                return
+            if version is not None and index.version == version - 1:
+                change(index)
+                index.version = version
+            else:
+                # Stale or unknown: rebuild on next use
+                index.version = None
@@ -1,9 +1,8 @@
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import FileResponse, JsonResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.core.exceptions import ValidationError
-from django.db import models
 from django.shortcuts import render, get_object_or_404, redirect
-from .shapefile_utils import extract_geometry_from_shapefile
+from .shapefile_preview import DONE, ERROR, get_preview, preview_geometry, submit_preview
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User
 from django.views.generic import (
@@ -13,7 +12,7 @@ from django.views.generic import (
     UpdateView,
     DeleteView
 )
-from collections import defaultdict
+import hashlib
 import re
 import os
 from django.core.files.storage import default_storage
@@ -29,8 +28,26 @@ from .models import (
 from django.urls import reverse_lazy, reverse
 from django.contrib.staticfiles.views import serve
 from .forms import ResearchForm, SiteForm, ArchaeologicalEvidenceForm
-from .utils import parse_geometry_string, create_folium_map
+from .utils import parse_geometry_string
+from .utils.research_details import load_public_research_details, load_research_details
+from .catalog import get_catalog_trees
+from .search import search_research, attach_snippets, get_search_language
+from .pagination import KeysetPaginationMixin
+from .clusters import cluster_feature_collection, parse_cluster_zoom
+from .nearby import find_nearby, parse_nearby_query
+from .admin_units import resolve_admin_units
+from .admin_aggregates import admin_aggregates, parse_aggregate_query, region_totals
+from .tiles import get_tile
+from .density import density_grid, grid_etag, grid_json, grid_png, parse_density_query
+from .export import EXPORT_FORMATS, csv_chunks, geojson_chunks, geopackage_file, parse_export_filters
+from .map_cache import MAP_FORMATS, map_title, map_url as get_map_url, map_version, render_map
+from .spatial import (
+    DERIVED_FIELDS, MAX_ZOOM, SPATIAL_LAYERS, parse_bbox, parse_layers, parse_zoom, spatial_feature_collection
+)
+from .utils.author_search import search_users
+from .utils.list_api import list_response
 from django.views.decorators.http import require_POST
+from django.utils.cache import get_conditional_response
 
 
 
@@ -80,6 +97,8 @@ def home(request):
         'total_sites': total_sites,
         'total_evidence': total_evidence,
         'total_users': total_users,
+        # Read from the maintained aggregates (one row per region and layer)
+        'region_totals': region_totals(),
     }
     return render(request, 'frontend/home.html', context)
 
@@ -88,18 +107,19 @@ def getfile(request):
     return serve(request, 'File')
 
 
-class ResearchListView(LoginRequiredMixin, ListView):
+class ResearchListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Research
     template_name = 'frontend/research_list.html'  # <app>/<model>_<viewtype>.html
     context_object_name = 'researches'
     ordering = ['-year']
+    keyset_ordering = ('-year', '-id')
     paginate_by = 5
 
     def get_queryset(self):
         return Research.objects.all().order_by('-year')
 
 
-class PublicResearchListView(ListView):
+class PublicResearchListView(KeysetPaginationMixin, ListView):
     """
     Public view (no authentication required) to display all research with related sites and evidence
     """
@@ -107,6 +127,7 @@ class PublicResearchListView(ListView):
     template_name = 'frontend/public_research_list.html'
     context_object_name = 'researches'
     ordering = ['-year']
+    keyset_ordering = ('-year', '-id')
     paginate_by = 10
 
     def get_queryset(self):
@@ -124,32 +145,9 @@ class PublicResearchDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         research = self.object
 
-        # Get unique sites related to this research (avoid duplicates from multiple links)
-        site_ids = (
-            SiteResearch.objects
-            .filter(id_research=research)
-            .values_list('id_site_id', flat=True)
-            .distinct()
-        )
-        sites = Site.objects.filter(id__in=site_ids)
-        
-        # Get all archaeological evidence related to this research (directly)
-        # Use values_list to get IDs first, then fetch objects to avoid geometry comparison
-        direct_evidence_ids = ArchEvResearch.objects.filter(
-            id_research=research.id
-        ).values_list('id_archaeological_evidence_id', flat=True)
-        direct_evidences = ArchaeologicalEvidence.objects.filter(id__in=direct_evidence_ids)
-        
-        # Get archaeological evidence linked through sites
-        site_evidence_ids = SiteArchEvidence.objects.filter(
-            id_site_id__in=site_ids
-        ).values_list('id_archaeological_evidence_id', flat=True)
-        site_evidences = ArchaeologicalEvidence.objects.filter(id__in=site_evidence_ids)
-        
-        # Combine all evidence IDs and fetch unique objects
-        all_evidence_ids = set(list(direct_evidence_ids) + list(site_evidence_ids))
-        all_evidences = ArchaeologicalEvidence.objects.filter(id__in=all_evidence_ids)
-        
+        # Load sites, evidence and all their relations with one query per relation
+        sites_with_details, evidences_with_details = load_public_research_details(research)
+
         # Get authors for this research
         author_ids = list(
             ResearchAuthor.objects
@@ -159,148 +157,75 @@ class PublicResearchDetailView(DetailView):
         )
         authors = User.objects.filter(id__in=author_ids).order_by('last_name', 'first_name', 'email').select_related('profile')
         
-        # For each site, get its related data
-        sites_with_details = []
-        for site in sites:
-            # Get evidence IDs for this site (avoid distinct on geometry)
-            site_evidence_ids_list = SiteArchEvidence.objects.filter(
-                id_site_id=site.id
-            ).values_list('id_archaeological_evidence_id', flat=True)
-            site_evidences_list = ArchaeologicalEvidence.objects.filter(id__in=site_evidence_ids_list)
-            
-            site_data = {
-                'site': site,
-                'toponymy': SiteToponymy.objects.filter(id_site=site).first(),
-                'interpretation': Interpretation.objects.filter(id_site=site).first(),
-                'investigation': SiteInvestigation.objects.filter(id_site=site).select_related('id_investigation').first(),
-                'bibliography': SiteBibliography.objects.filter(id_site=site).select_related('id_bibliography').first(),
-                'sources': SiteSources.objects.filter(id_site=site).select_related('id_sources').first(),
-                'related_doc': SiteRelatedDocumentation.objects.filter(id_site=site).first(),
-                'images': Image.objects.filter(id_site=site).select_related('id_image_type', 'id_image_scale'),
-                'evidences': site_evidences_list,
-            }
-            sites_with_details.append(site_data)
-        
-        # For each evidence, get its related data
-        evidences_with_details = []
-        for evidence in all_evidences:
-            evidence_data = {
-                'evidence': evidence,
-                'bibliography': ArchEvBiblio.objects.filter(id_archaeological_evidence=evidence).select_related('id_bibliography').first(),
-                'sources': ArchEvSources.objects.filter(id_archaeological_evidence=evidence).select_related('id_sources').first(),
-                'related_doc': ArchEvRelatedDoc.objects.filter(id_archaeological_evidence=evidence).first(),
-            }
-            evidences_with_details.append(evidence_data)
-        
-        # Create Folium map for research geometry
-        map_html = None
-        if research.geometry:
-            map_html = create_folium_map(
-                research.geometry, 
-                research_title=research.title or "Research Area"
-            )
+        # The map is loaded on demand from its own endpoint (see map_fragment)
+        map_url = get_map_url(research)
         
         # Add user and research info for permission checks in template
         context.update({
             'sites_with_details': sites_with_details,
             'evidences_with_details': evidences_with_details,
             'authors': authors,
-            'map_html': map_html,
+            'map_url': map_url,
             'research_owner': research.submitted_by if research.submitted_by else None,
         })
         return context
 
 
-class ResearchCatalogView(ListView):
+class ResearchCatalogView(KeysetPaginationMixin, ListView):
     """Public catalog page with research → site → evidence tree."""
     model = Research
     template_name = 'frontend/research_catalog.html'
     context_object_name = 'researches'
     paginate_by = 5
 
+    def get_keyset_ordering(self):
+        if self.request.GET.get('q', '').strip():
+            return ('-search_rank', 'title', 'id')
+        return ('title', 'id')
+
     def get_queryset(self):
-        queryset = Research.objects.all().select_related('submitted_by').order_by('title')
+        queryset = Research.objects.all().select_related('submitted_by__profile').order_by('title')
         search_query = self.request.GET.get('q', '').strip()
         
         if search_query:
-            from django.db.models import Q
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(abstract__icontains=search_query) |
-                Q(keywords__icontains=search_query)
-            )
+            # Ranked full-text search (tsvector + GIN on PostgreSQL)
+            queryset = search_research(queryset, search_query, self.request.GET.get('lang'))
         
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        researches = list(context.get('researches', []))
         search_query = self.request.GET.get('q', '').strip()
+        search_language = get_search_language(self.request.GET.get('lang'))
+        researches = attach_snippets(context.get('researches', []), search_query, search_language)
         context['search_query'] = search_query
+        context['search_language'] = search_language
 
         if not researches:
             context['catalog_entries'] = []
             return context
 
-        research_ids = [research.id for research in researches]
-
-        site_links = SiteResearch.objects.filter(
-            id_research_id__in=research_ids
-        ).select_related('id_site')
-        site_ids = [link.id_site_id for link in site_links]
-
-        sites = Site.objects.filter(id__in=site_ids).select_related(
-            'id_country', 'id_region', 'id_province', 'id_municipality'
-        )
-        site_by_id = {site.id: site for site in sites}
-
-        site_map = defaultdict(list)
-        for link in site_links:
-            site = site_by_id.get(link.id_site_id)
-            if site:
-                site_map[link.id_research_id].append(site)
-
-        site_evidence_links = SiteArchEvidence.objects.filter(
-            id_site_id__in=site_ids
-        ).select_related('id_archaeological_evidence')
-        site_evidence_map = defaultdict(list)
-        for relation in site_evidence_links:
-            evidence = relation.id_archaeological_evidence
-            if evidence:
-                site_evidence_map[relation.id_site_id].append(evidence)
-
-        direct_evidence_links = ArchEvResearch.objects.filter(
-            id_research__in=research_ids
-        ).select_related('id_archaeological_evidence')
-        direct_evidence_map = defaultdict(list)
-        for relation in direct_evidence_links:
-            evidence = relation.id_archaeological_evidence
-            if evidence:
-                direct_evidence_map[relation.id_research].append(evidence)
+        # Trees are read from the materialized catalog (one query for the page)
+        trees = get_catalog_trees(research.id for research in researches)
 
         catalog_entries = []
         for research in researches:
-            sites_payload = []
-            for site in site_map.get(research.id, []):
-                sites_payload.append({
-                    'site': site,
-                    'evidences': site_evidence_map.get(site.id, []),
-                })
-
+            tree = trees.get(research.id, {})
             catalog_entries.append({
                 'research': research,
-                'sites': sites_payload,
-                'direct_evidences': direct_evidence_map.get(research.id, []),
+                'sites': tree.get('sites', []),
+                'direct_evidences': tree.get('direct_evidences', []),
             })
 
         context['catalog_entries'] = catalog_entries
         return context
 
 
-class UserResearchListView(LoginRequiredMixin, ListView):
+class UserResearchListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Research
     template_name = 'frontend/user_research.html'  # <app>/<model>_<viewtype>.html
     context_object_name = 'researches'
+    keyset_ordering = ('-year', '-id')
     paginate_by = 5
 
     def get_queryset(self):
@@ -359,10 +284,10 @@ class ResearchCreateView(LoginRequiredMixin, CreateView):
         shapefile = self.request.FILES.get('shapefile')
         if shapefile:
             try:
-                geometry = extract_geometry_from_shapefile(shapefile)
+                geometry = preview_geometry(shapefile)
                 form.instance.geometry = geometry
-            except ValidationError as e:
-                form.add_error('shapefile', e)
+            except ValueError as e:
+                form.add_error('shapefile', str(e))
                 return self.form_invalid(form)
 
         # === Save research ===
@@ -416,94 +341,19 @@ class ResearchDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         research = self.object
 
-        # Get unique sites linked to this research (avoid duplicates)
-        site_ids = SiteResearch.objects.filter(id_research=research).values_list('id_site_id', flat=True).distinct()
-        unique_sites = Site.objects.filter(id__in=site_ids)
-        
         # Get authors for this research (distinct to avoid duplicates)
         author_ids = ResearchAuthor.objects.filter(id_research=research).values_list('id_author_id', flat=True).distinct()
         authors = User.objects.filter(id__in=author_ids).select_related('profile')
-        
-        # For each site, get its related data (similar to public view)
-        sites_with_details = []
-        for site in unique_sites:
-            # Get evidence IDs for this site
-            site_evidence_ids_list = SiteArchEvidence.objects.filter(
-                id_site_id=site.id
-            ).values_list('id_archaeological_evidence_id', flat=True)
-            site_evidences_list = ArchaeologicalEvidence.objects.filter(id__in=site_evidence_ids_list)
-            
-            # Get ALL bibliographies for this site (not just first)
-            site_biblios = SiteBibliography.objects.filter(id_site=site).select_related('id_bibliography')
-            bibliographies = [sb.id_bibliography for sb in site_biblios]
-            
-            # Get ALL sources for this site
-            site_sources_links = SiteSources.objects.filter(id_site=site).select_related('id_sources')
-            sources = [ss.id_sources for ss in site_sources_links]
-            
-            # Get ALL related docs for this site
-            related_docs = SiteRelatedDocumentation.objects.filter(id_site=site)
-            
-            # Get ALL images for this site
-            site_images = Image.objects.filter(id_site=site)
-            
-            site_data = {
-                'site': site,
-                'toponymy': SiteToponymy.objects.filter(id_site=site).first(),
-                'interpretation': Interpretation.objects.filter(id_site=site).first(),
-                'investigation': SiteInvestigation.objects.filter(id_site=site).select_related('id_investigation').first(),
-                'bibliographies': bibliographies,  # Multiple entries
-                'sources': sources,  # Multiple entries
-                'related_docs': related_docs,  # Multiple entries
-                'images': site_images,  # Multiple entries
-                'evidences': site_evidences_list,
-            }
-            sites_with_details.append(site_data)
-
-        # Evidences linked directly to research (not linked to a site)
-        direct_evidence_ids = ArchEvResearch.objects.filter(
-            id_research=research.id
-        ).values_list('id_archaeological_evidence_id', flat=True)
-        direct_evidences = ArchaeologicalEvidence.objects.filter(id__in=direct_evidence_ids)
-        
-        # For each evidence, get its related data
-        evidences_with_details = []
-        for evidence in direct_evidences:
-            # Get ALL bibliographies for this evidence
-            ev_biblios = ArchEvBiblio.objects.filter(id_archaeological_evidence=evidence).select_related('id_bibliography')
-            bibliographies = [eb.id_bibliography for eb in ev_biblios]
-            
-            # Get ALL sources for this evidence
-            ev_sources_links = ArchEvSources.objects.filter(id_archaeological_evidence=evidence).select_related('id_sources')
-            sources = [es.id_sources for es in ev_sources_links]
-            
-            # Get ALL related docs for this evidence
-            related_docs = ArchEvRelatedDoc.objects.filter(id_archaeological_evidence=evidence)
-            
-            # Get ALL images for this evidence
-            ev_images = Image.objects.filter(id_archaeological_evidence=evidence)
-            
-            evidence_data = {
-                'evidence': evidence,
-                'bibliographies': bibliographies,  # Multiple entries
-                'sources': sources,  # Multiple entries
-                'related_docs': related_docs,  # Multiple entries
-                'images': ev_images,  # Multiple entries
-            }
-            evidences_with_details.append(evidence_data)
+
+        # Load sites, direct evidence and all their relations with one query per relation
+        sites_with_details, evidences_with_details = load_research_details(research)
 
         context['sites_with_details'] = sites_with_details
         context['evidences_with_details'] = evidences_with_details
         context['authors'] = authors
         
-        # Create Folium map for research geometry
-        map_html = None
-        if research.geometry:
-            map_html = create_folium_map(
-                research.geometry, 
-                research_title=research.title or "Research Area"
-            )
-        context['map_html'] = map_html
+        # The map is loaded on demand from its own endpoint (see map_fragment)
+        context['map_url'] = get_map_url(research)
         context['research_owner'] = research.submitted_by if research.submitted_by else None
         
         return context
@@ -549,10 +399,10 @@ class ResearchUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         shapefile = self.request.FILES.get('shapefile')
         if shapefile:
             try:
-                geometry = extract_geometry_from_shapefile(shapefile)
+                geometry = preview_geometry(shapefile)
                 form.instance.geometry = geometry
-            except ValidationError as e:
-                form.add_error('shapefile', e)
+            except ValueError as e:
+                form.add_error('shapefile', str(e))
                 return self.form_invalid(form)
 
         # Save research
@@ -685,17 +535,60 @@ def load_municipalities(request):
     return JsonResponse(list(municipalities), safe=False)
 
 
+def api_admin_units(request):
+    """
+    API endpoint resolving lat/lon to the nearest municipality with its province and region,
+    so the site and evidence forms can fill the admin fields in one request.
+    Answered from the in-memory municipality index (see frontend/admin_units.py);
+    "result" is null when no municipality centroid is close enough.
+    """
+    try:
+        lat, lon = float(request.GET.get('lat')), float(request.GET.get('lon'))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'lat and lon are required numbers', 'success': False}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return JsonResponse({'error': 'lat must be between -90 and 90, lon between -180 and 180',
+                             'success': False}, status=400)
+    return JsonResponse({'success': True, 'result': resolve_admin_units(lon, lat)})
+
+
+def _preview_response(job_id, entry):
+    if entry['status'] == DONE:
+        return JsonResponse({'success': True, 'job_id': job_id, 'status': DONE, **entry['result']})
+    if entry['status'] == ERROR:
+        return JsonResponse({'error': entry['error'], 'success': False, 'job_id': job_id, 'status': ERROR}, status=400)
+    return JsonResponse({
+        'success': True, 'job_id': job_id, 'status': entry['status'],
+        'poll_url': reverse('preview_shapefile_job', args=[job_id]),
+    }, status=202)
+
+
 @csrf_exempt
 def preview_shapefile(request):
+    """
+    Start the preview of an uploaded dataset.
+
+    Answers 200 with geometry, feature_count, bbox and crs when the same file
+    was previewed before, otherwise 202 with a job_id and the poll_url of
+    preview_shapefile_job (see frontend/shapefile_preview.py).
+    """
     if request.method == 'POST' and request.FILES.get('shapefile'):
         try:
-            geometry_text = extract_geometry_from_shapefile(request.FILES['shapefile'])
-            return JsonResponse({'geometry': geometry_text})
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=400)
+            job_id, entry = submit_preview(request.FILES['shapefile'])
+        except ValueError as e:
+            return JsonResponse({'error': str(e), 'success': False}, status=400)
+        return _preview_response(job_id, entry)
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+def preview_shapefile_job(request, job_id):
+    """Status of a preview job: 202 while pending, then the preview_shapefile result or error."""
+    entry = get_preview(job_id)
+    if entry is None:
+        return JsonResponse({'error': 'Unknown or expired preview job', 'success': False}, status=404)
+    return _preview_response(job_id, entry)
+
+
 from .models import SiteToponymy, Interpretation
 
 
@@ -709,73 +602,20 @@ def search_authors(request):
     results = []
     
     if query and len(query) >= 3:  # Minimum 3 characters
-        from django.db.models import Q
-        
-        # Search by last_name (surname) in User model - highest priority
-        user_surname_matches = User.objects.filter(
-            last_name__icontains=query
-        ).select_related('profile').distinct()[:10]
-        
-        seen_users = set()
-        
-        def add_user_result(user, match_type):
-            """Helper to add user result if not already seen"""
-            if user.id in seen_users:
-                return
-            seen_users.add(user.id)
-            
-            # Get profile if exists
-            try:
-                profile = user.profile
-            except:
-                profile = None
-            
+        # Single ranked query: surname > first name > username > email
+        for author, match_type in search_users(query):
             results.append({
                 'type': 'user',
-                'user_id': user.id,
-                'username': user.username,
-                'name': user.first_name or '',
-                'surname': user.last_name or '',
-                'email': user.email or '',
-                'affiliation': profile.affiliation if profile else '',
-                'orcid': profile.orcid if profile else '',
-                'contact_email': profile.contact_email if profile else '',
+                'user_id': author.id,
+                'username': author.username,
+                'name': author.first_name,
+                'surname': author.last_name,
+                'email': author.email,
+                'affiliation': author.affiliation,
+                'orcid': author.orcid,
+                'contact_email': author.contact_email,
                 'match_type': match_type
             })
-        
-        # Process surname matches (highest priority)
-        for user in user_surname_matches:
-            add_user_result(user, 'surname')
-        
-        # Search by first_name (name) - medium priority
-        remaining_slots = 10 - len(results)
-        if remaining_slots > 0:
-            user_firstname_matches = User.objects.filter(
-                first_name__icontains=query
-            ).exclude(id__in=seen_users).select_related('profile').distinct()[:remaining_slots]
-            
-            for user in user_firstname_matches:
-                add_user_result(user, 'firstname')
-        
-        # Search by username - medium-low priority
-        remaining_slots = 10 - len(results)
-        if remaining_slots > 0:
-            user_username_matches = User.objects.filter(
-                username__icontains=query
-            ).exclude(id__in=seen_users).select_related('profile').distinct()[:remaining_slots]
-            
-            for user in user_username_matches:
-                add_user_result(user, 'username')
-        
-        # Search by email - lowest priority
-        remaining_slots = 10 - len(results)
-        if remaining_slots > 0:
-            user_email_matches = User.objects.filter(
-                email__icontains=query
-            ).exclude(id__in=seen_users).select_related('profile').distinct()[:remaining_slots]
-            
-            for user in user_email_matches:
-                add_user_result(user, 'email')
     
     return JsonResponse(results[:10], safe=False)
 
@@ -1051,14 +891,7 @@ class SiteDetailView(DetailView):
         # Multiple images (all entries)
         context['site_images'] = Image.objects.filter(id_site=site)
         
-        # Create Folium map for site geometry
-        map_html = None
-        if site.geometry:
-            map_html = create_folium_map(
-                site.geometry,
-                research_title=site.site_name or "Site Location"
-            )
-        context['map_html'] = map_html
+        context['map_url'] = get_map_url(site)
         
         return context
 
@@ -1669,14 +1502,7 @@ class EvidenceDetailView(DetailView):
         if evidence.id_investigation:
             context['investigation'] = evidence.id_investigation
         
-        # Create Folium map for evidence geometry
-        map_html = None
-        if evidence.geometry:
-            map_html = create_folium_map(
-                evidence.geometry,
-                research_title=evidence.evidence_name or "Evidence Location"
-            )
-        context['map_html'] = map_html
+        context['map_url'] = get_map_url(evidence)
         
         return context
 
@@ -1991,41 +1817,25 @@ def is_staff(user):
 def search_users_autocomplete(request):
     """
     AJAX endpoint for autocomplete user search in research author selection.
-    Searches by surname, username, or email.
+    Searches by surname, first name, username, or email.
     """
     query = request.GET.get('q', '').strip()
     
     if len(query) < 2:
         return JsonResponse({'results': []})
     
-    # Search users by surname, username, or email
-    users = User.objects.filter(
-        models.Q(last_name__icontains=query) |
-        models.Q(username__icontains=query) |
-        models.Q(email__icontains=query)
-    ).select_related('profile')[:10]
-    
     results = []
-    for user in users:
-        # Get user profile info if available
-        affiliation = ''
-        orcid = ''
-        
-        if hasattr(user, 'profile'):
-            affiliation = getattr(user.profile, 'affiliation', '') or ''
-            orcid = getattr(user.profile, 'orcid', '') or ''
-        
+    for author, _ in search_users(query):
         # User is the single source of truth for author data (no Author table)
-        
         results.append({
-            'user_id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'full_name': f"{user.first_name} {user.last_name}",
-            'affiliation': affiliation,
-            'orcid': orcid,
+            'user_id': author.id,
+            'username': author.username,
+            'email': author.email,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'full_name': f"{author.first_name} {author.last_name}",
+            'affiliation': author.affiliation,
+            'orcid': author.orcid,
         })
     
     return JsonResponse({'results': results})
@@ -2606,74 +2416,219 @@ def import_database(request):
 
 
 # API endpoints for modal selectors
+SITE_LIST_FIELDS = (
+    'id', 'site_name', 'locality_name', 'description', 'lat', 'lon', 'elevation',
+    'id_country', 'id_region', 'id_province', 'id_municipality',
+)
+EVIDENCE_LIST_FIELDS = (
+    'id', 'evidence_name', 'description', 'locality_name', 'lat', 'lon', 'elevation',
+    'id_archaeological_evidence_typology', 'id_country', 'id_region', 'id_province',
+    'id_municipality', 'id_chronology',
+)
+
+
 def api_sites_list(request):
-    """API endpoint to get list of all sites"""
-    try:
-        # Fetch ALL sites from database using model instances
-        sites_query = Site.objects.all().order_by('site_name')
-        
-        print(f"[API] Total sites in database: {sites_query.count()}")
-        
-        sites_list = []
-        for site in sites_query:
-            site_display = {
-                'id': site.id,
-                'site_name': site.site_name if site.site_name else f"Site #{site.id}",
-                'locality_name': site.locality_name if hasattr(site, 'locality_name') else ''
-            }
-            sites_list.append(site_display)
-            print(f"[API] Added site: {site_display}")
-        
-        print(f"[API] Total sites to return: {len(sites_list)}")
-        
-        return JsonResponse({
-            'success': True,
-            'count': len(sites_list),
-            'results': sites_list
-        })
-    except Exception as e:
-        import traceback
-        print(f"[API ERROR] {str(e)}")
-        traceback.print_exc()
-        return JsonResponse({
-            'error': str(e), 
-            'success': False
-        }, status=500)
+    """
+    API endpoint to list sites for the modal selectors.
+    Supports q= (name prefix), fields= and limit=/cursor= pagination;
+    without limit= the whole list is streamed.
+    """
+    return list_response(
+        request, Site.objects.all(), 'site_name', 'Site',
+        allowed_fields=SITE_LIST_FIELDS,
+        default_fields=('id', 'site_name', 'locality_name'),
+    )
 
 
 def api_evidence_list(request):
-    """API endpoint to get list of all archaeological evidence"""
+    """
+    API endpoint to list archaeological evidence for the modal selectors.
+    Supports q= (name prefix), fields= and limit=/cursor= pagination;
+    without limit= the whole list is streamed.
+    """
+    return list_response(
+        request, ArchaeologicalEvidence.objects.all(), 'evidence_name', 'Evidence',
+        allowed_fields=EVIDENCE_LIST_FIELDS,
+        default_fields=('id', 'evidence_name', 'description'),
+    )
+
+
+def api_spatial(request):
+    """
+    API endpoint returning the sites, evidence and research areas in a map viewport.
+    Query: bbox=minx,miny,maxx,maxy (lon/lat), optional layers=site,evidence,research
+    and zoom (map zoom choosing the simplification level; derived from bbox if missing).
+    Served from the in-memory STRtree (see frontend/spatial.py) as GeoJSON.
+    """
     try:
-        # Fetch ALL archaeological evidence from database using model instances
-        evidence_query = ArchaeologicalEvidence.objects.all().order_by('evidence_name')
-        
-        print(f"[API] Total evidence in database: {evidence_query.count()}")
-        
-        evidence_list = []
-        for evidence in evidence_query:
-            evidence_display = {
-                'id': evidence.id,
-                'evidence_name': evidence.evidence_name if evidence.evidence_name else f"Evidence #{evidence.id}",
-                'description': evidence.description if hasattr(evidence, 'description') else ''
-            }
-            evidence_list.append(evidence_display)
-            print(f"[API] Added evidence: {evidence_display}")
-        
-        print(f"[API] Total evidence to return: {len(evidence_list)}")
-        
-        return JsonResponse({
-            'success': True,
-            'count': len(evidence_list),
-            'results': evidence_list
-        })
-    except Exception as e:
-        import traceback
-        print(f"[API ERROR] {str(e)}")
-        traceback.print_exc()
-        return JsonResponse({
-            'error': str(e), 
-            'success': False
-        }, status=500)
+        bbox = parse_bbox(request.GET.get('bbox'))
+        layers = parse_layers(request.GET.get('layers'))
+        zoom = parse_zoom(request.GET.get('zoom'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'success': False}, status=400)
+    return HttpResponse(spatial_feature_collection(bbox, layers, zoom=zoom), content_type='application/geo+json')
+
+
+def api_clusters(request):
+    """
+    API endpoint for the overview map of all sites and evidence.
+    Query: z (map zoom) and optional bbox=minx,miny,maxx,maxy (lon/lat, whole world if missing).
+    Returns GeoJSON points: clusters with a count at low zoom, single sites/evidence at high zoom
+    (see frontend/clusters.py).
+    """
+    try:
+        zoom = parse_cluster_zoom(request.GET.get('z'))
+        bbox = parse_bbox(request.GET['bbox']) if request.GET.get('bbox') else (-180.0, -90.0, 180.0, 90.0)
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'success': False}, status=400)
+    return HttpResponse(cluster_feature_collection(zoom, bbox), content_type='application/geo+json')
+
+
+def api_nearby(request):
+    """
+    API endpoint listing the sites and evidence nearest to a position, so editors
+    can spot duplicates before creating a new row.
+    Query: lat, lon, optional k (default 10, at most 100), radius_m and layers=site,evidence.
+    Answered from the in-memory KD-tree (see frontend/nearby.py); distances are great-circle meters.
+    """
+    try:
+        query = parse_nearby_query(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'success': False}, status=400)
+    return JsonResponse({'success': True, 'results': find_nearby(**query)})
+
+
+def api_admin_aggregates(request):
+    """
+    Site and evidence counts per administrative unit, read from the maintained aggregates.
+    Query: level (region, province or municipality; default region), optional layer
+    (site,evidence), by (chronology,typology breakdowns) and unit (ids, comma-separated).
+    """
+    try:
+        query = parse_aggregate_query(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'success': False}, status=400)
+    return JsonResponse({
+        'success': True,
+        'level': query['level'],
+        'by': list(query['by']),
+        'results': admin_aggregates(query['level'], query['layers'], query['by'], query['unit_ids']),
+    })
+
+
+DENSITY_MAX_AGE = 60
+
+
+def api_density(request):
+    """
+    Density grid of sites or evidence for heatmaps.
+    Query: layer (site or evidence), cell_km (cell size, default 10), optional bbox
+    (minx,miny,maxx,maxy, default the layer extent) and format (json or png).
+    JSON carries the counts as base64 uint32, north row first; PNG has one pixel per
+    cell and the snapped bbox in the X-Density-Bbox header (see frontend/density.py).
+    """
+    try:
+        query = parse_density_query(request.GET)
+        grid = density_grid(query['layer'], query['cell_km'], query['bbox'])
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'success': False}, status=400)
+
+    etag = grid_etag(grid)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if query['format'] == 'png':
+            response = HttpResponse(grid_png(grid), content_type='image/png')
+        else:
+            response = JsonResponse(grid_json(query['layer'], query['cell_km'], grid))
+    response['X-Density-Bbox'] = ','.join(f'{value:.6f}' for value in grid.bbox)
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={DENSITY_MAX_AGE}'
+    return response
+
+
+TILE_MAX_AGE = 60
+
+
+def vector_tile(request, layer, z, x, y):
+    """
+    Mapbox Vector Tile of the site, evidence or research layer.
+    Tiles are cached on disk under TILE_CACHE_DIR at the same path, where nginx
+    serves them directly; Django only renders misses (see frontend/tiles.py).
+    """
+    if layer not in SPATIAL_LAYERS or not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise Http404("Unknown tile")
+    data = get_tile(layer, z, x, y)
+    etag = f'"{hashlib.sha256(data).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(data, content_type='application/vnd.mapbox-vector-tile')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={TILE_MAX_AGE}'
+    return response
+
+
+def export_layer(request, layer, export_format):
+    """
+    Bulk export of the site, evidence or research layer: /export/<layer>.geojson, .gpkg or .csv.
+    Accepts the catalog filters q (and lang), region, chronology and research (ids, comma-separated).
+    Rows are streamed in batches (see frontend/export.py).
+    """
+    if layer not in SPATIAL_LAYERS or export_format not in EXPORT_FORMATS:
+        raise Http404("Unknown export")
+    try:
+        filters = parse_export_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'success': False}, status=400)
+
+    if export_format == 'gpkg':
+        response = FileResponse(geopackage_file(layer, filters), content_type=EXPORT_FORMATS['gpkg'])
+    else:
+        chunks = geojson_chunks(layer, filters) if export_format == 'geojson' else csv_chunks(layer, filters)
+        response = StreamingHttpResponse(chunks, content_type=f'{EXPORT_FORMATS[export_format]}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{layer}.{export_format}"'
+    return response
+
+
+MAP_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MAP_REVALIDATE_MAX_AGE = 300
+
+
+def map_fragment(request, kind, pk, map_format):
+    """
+    Map of one research area, site or evidence, loaded on demand by the detail pages.
+    /maps/<kind>/<pk>.geojson returns the quantized GeoJSON Feature, .html a standalone
+    Leaflet page drawing the same feature (for embedding).
+    Responses carry a strong ETag; requests whose ?v= matches the current version
+    (the URLs built by map_url) may be cached for a year.
+    """
+    if kind not in SPATIAL_LAYERS or map_format not in MAP_FORMATS:
+        raise Http404("Unknown map")
+    model, name_field = SPATIAL_LAYERS[kind]
+    instance = get_object_or_404(model.objects.only('id', name_field, 'geometry', *DERIVED_FIELDS), pk=pk)
+
+    version = map_version(instance)
+    etag = f'"{version}"'
+    # Only the exact token map_url() hands out marks the response immutable
+    if request.GET.get('v') == version[:16]:
+        cache_control = f'public, max-age={MAP_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = f'public, max-age={MAP_REVALIDATE_MAX_AGE}, must-revalidate'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        feature = render_map(instance)
+        if feature is None:
+            raise Http404("No drawable geometry")
+        if map_format == 'geojson':
+            response = HttpResponse(feature, content_type='application/geo+json')
+        else:
+            response = render(request, 'frontend/map_fragment.html', {
+                'feature': feature,
+                'title': map_title(instance),
+            })
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
 
 
 def api_site_research_create(request):
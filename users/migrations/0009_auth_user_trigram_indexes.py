@@ -0,0 +1,36 @@
+# Trigram indexes for the author search (frontend/utils/author_search.py)
+
+from django.db import migrations
+
+# icontains compiles to UPPER(column) LIKE UPPER(%s) on PostgreSQL, so the
+# indexes are built on the same expression.
+SEARCH_COLUMNS = ('last_name', 'first_name', 'username', 'email')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    for column in SEARCH_COLUMNS:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS auth_user_{column}_trgm "
+            f"ON auth_user USING gin (UPPER({column}) gin_trgm_ops);"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in SEARCH_COLUMNS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS auth_user_{column}_trgm;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_unique_user_email_partial_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -11,5 +11,8 @@ def create_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance,created, **kwargs):
+def save_profile(sender, instance,created, update_fields=None, **kwargs):
+    # Partial saves (e.g. last_login on every login) leave the profile alone
+    if update_fields:
+        return
     instance.profile.save()
\ No newline at end of file